@@ -3,6 +3,7 @@
 from flask import Flask, jsonify
 from flask_cors import CORS
 import os
+import atexit
 import logging
 from datetime import datetime
 
@@ -19,105 +20,201 @@ from services.mt5_service import MT5Service
 from services.account_monitor_service import AccountMonitorService
 from services.copy_trade_service import CopyTradeService
 from services.performance_service import PerformanceService
+from services.job_runner import JobRunner
+from services.history_store import HistoryStore
+from services.history_archive import HistoryArchive
+from services.history_backfill import HistoryBackfill
+from services.drawdown_tracker import DrawdownTracker
+from services.export_service import ExportService
+from services.exposure_aggregator import ExposureAggregator
+from services.position_store import PositionStore
+from services.bar_cache import BarCache
 from utils.alerting import AlertingSystem
 from utils.trade_validator import TradeValidator
+from utils.event_bus import EventBus
+from utils.result_cache import ResultCache
 
 # Import cấu hình
 import config
 
-# Thiết lập logging
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
-    handlers=[
-        logging.FileHandler(os.path.join('logs', f'app_{datetime.now().strftime("%Y%m%d")}.log')),
-        logging.StreamHandler()
-    ]
-)
-
-# Tạo thư mục logs nếu chưa có
-os.makedirs('logs', exist_ok=True)
-
-# Khởi tạo Flask app
-app = Flask(__name__)
-CORS(app)  # Cho phép Cross-Origin Resource Sharing
-
-# Thiết lập cấu hình
-app.config['SECRET_KEY'] = config.SECRET_KEY
-
-# Khởi tạo các service
-db = Database(config.DB_PATH)
-db.connect()
-db.init_db()
-
-mt5_service = MT5Service()
-alert_service = AlertingSystem(config.ALERT_CONFIG)
-trade_validator = TradeValidator(config.RISK_SETTINGS if hasattr(config, 'RISK_SETTINGS') else None)
-account_monitor_service = AccountMonitorService(db, mt5_service, alert_service, config.ACCOUNT_MONITOR_INTERVAL)
-copy_trade_service = CopyTradeService(db, mt5_service, trade_validator, config.COPY_TRADE_CONFIG['check_interval'])
-performance_service = PerformanceService(db, mt5_service)
-
-# Đăng ký các blueprint
-app.register_blueprint(account_routes, url_prefix='/api')
-app.register_blueprint(auth_routes, url_prefix='/api')
-app.register_blueprint(copy_trade_routes, url_prefix='/api')
-app.register_blueprint(monitor_routes, url_prefix='/api')
-app.register_blueprint(user_routes, url_prefix='/api')
-
-# Route mặc định
-@app.route('/')
-def index():
-    return jsonify({
-        'app': 'MT5 Account Manager',
-        'version': '1.0.0',
-        'status': 'running'
-    })
-
-# Khởi động các dịch vụ khi ứng dụng khởi động
-@app.before_first_request
-def before_first_request():
-    # Khởi tạo MT5
-    mt5_service.initialize_mt5()
-    
-    # Khởi động dịch vụ giám sát tài khoản
-    account_monitor_service.start_monitoring()
-    
-    # Khởi động dịch vụ copy trade
-    copy_trade_service.start_copy_service()
-    
-    logging.info("All services started")
-
-# Dừng các dịch vụ khi đóng ứng dụng
-@app.teardown_appcontext
-def teardown_appcontext(exception=None):
+
+def create_app():
+    """Khởi tạo Flask app và các service (một lần mỗi process)
+
+    Các service được gán vào biến cấp module để route import (from app import db, ...).
+    Service chạy nền được khởi động ở request đầu tiên và dừng khi process thoát.
+    """
+    global app, db, mt5_service, event_bus, exposure_aggregator, position_store, alert_service
+    global trade_validator, history_archive, history_store, drawdown_tracker, account_monitor_service
+    global copy_trade_service, job_runner, performance_service, export_service, bar_cache, history_backfill
+
+    # Tạo thư mục logs nếu chưa có
+    os.makedirs('logs', exist_ok=True)
+
+    # Thiết lập logging
+    logging.basicConfig(
+        level=logging.INFO,
+        format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
+        handlers=[
+            logging.FileHandler(os.path.join('logs', f'app_{datetime.now().strftime("%Y%m%d")}.log')),
+            logging.StreamHandler()
+        ]
+    )
+
+    # Khởi tạo Flask app
+    app = Flask(__name__)
+    CORS(app)  # Cho phép Cross-Origin Resource Sharing
+
+    # Thiết lập cấu hình
+    app.config['SECRET_KEY'] = config.SECRET_KEY
+
+    # Khởi tạo các service
+    db = Database(config.DB_PATH)
+    db.connect()
+    db.init_db()
+
+    mt5_service = MT5Service(config.MT5_HISTORY_CONCURRENCY)
+    event_bus = EventBus(config.STREAM_CONFIG['max_queue'])
+    # Tổng vị thế theo symbol, cập nhật từ delta vị thế mà monitor và copy engine phát lên bus
+    exposure_aggregator = ExposureAggregator(db)
+    event_bus.add_position_listener(exposure_aggregator.apply)
+    # Ảnh chụp vị thế mở trong database để route không phải gọi terminal
+    position_store = PositionStore(db)
+    event_bus.add_position_listener(position_store.apply)
+    alert_service = AlertingSystem(config.ALERT_CONFIG)
+    trade_validator = TradeValidator(config.RISK_SETTINGS if hasattr(config, 'RISK_SETTINGS') else None)
+    history_archive = HistoryArchive(config.HISTORY_ARCHIVE_CONFIG['path'])
+    history_store = HistoryStore(
+        db, mt5_service, config.PERFORMANCE_CONFIG['history_staleness'], archive=history_archive
+    )
+    drawdown_tracker = DrawdownTracker(db, history_store)
+    account_monitor_service = AccountMonitorService(
+        db, mt5_service, alert_service, config.ACCOUNT_MONITOR_INTERVAL,
+        stats_interval=config.DAILY_STATS_INTERVAL, event_bus=event_bus,
+        history_store=history_store, drawdown_tracker=drawdown_tracker
+    )
+    copy_trade_service = CopyTradeService(
+        db, mt5_service, trade_validator, config.COPY_TRADE_CONFIG['check_interval'],
+        event_bus=event_bus
+    )
+    # Các job định kỳ nặng chạy ngoài thread giám sát (process pool dùng chung cho các tính toán nặng)
+    job_runner = JobRunner(config.JOB_RUNNER_CONFIG)
+    performance_service = PerformanceService(
+        db, mt5_service, history_store,
+        compare_workers=config.PERFORMANCE_CONFIG['compare_workers'],
+        drawdown_tracker=drawdown_tracker,
+        result_cache=ResultCache(
+            config.PERFORMANCE_CONFIG['result_cache_entries'],
+            config.PERFORMANCE_CONFIG['result_cache_bytes']
+        ),
+        job_runner=job_runner,
+        monte_carlo_max_simulations=config.PERFORMANCE_CONFIG['monte_carlo_max_simulations'],
+        monte_carlo_max_trades=config.PERFORMANCE_CONFIG['monte_carlo_max_trades'],
+        monte_carlo_max_steps=config.PERFORMANCE_CONFIG['monte_carlo_max_steps']
+    )
+    export_service = ExportService(db)
+    bar_cache = BarCache(
+        config.BAR_CACHE_CONFIG['path'], mt5_service, config.BAR_CACHE_CONFIG['refresh_interval']
+    )
+    history_backfill = HistoryBackfill(
+        db, mt5_service, history_store, job_runner, config.HISTORY_BACKFILL_CONFIG['days']
+    )
+
+    job_runner.register(
+        'daily_stats', account_monitor_service.update_daily_stats,
+        interval=config.DAILY_STATS_INTERVAL,
+        budget=config.JOB_RUNNER_CONFIG['budgets']['daily_stats']
+    )
+    job_runner.register(
+        'history_archive', history_store.archive_all_accounts,
+        interval=config.HISTORY_ARCHIVE_CONFIG['interval'],
+        budget=config.JOB_RUNNER_CONFIG['budgets']['history_archive']
+    )
+    job_runner.register(
+        HistoryBackfill.JOB_NAME, history_backfill.run_pending,
+        interval=config.HISTORY_BACKFILL_CONFIG['interval'],
+        budget=config.JOB_RUNNER_CONFIG['budgets']['history_backfill']
+    )
+
+    # Đăng ký các blueprint
+    app.register_blueprint(account_routes, url_prefix='/api')
+    app.register_blueprint(auth_routes, url_prefix='/api')
+    app.register_blueprint(copy_trade_routes, url_prefix='/api')
+    app.register_blueprint(monitor_routes, url_prefix='/api')
+    app.register_blueprint(user_routes, url_prefix='/api')
+
+    # Route mặc định
+    @app.route('/')
+    def index():
+        return jsonify({
+            'app': 'MT5 Account Manager',
+            'version': '1.0.0',
+            'status': 'running'
+        })
+
+    # Khởi động các dịch vụ khi ứng dụng khởi động
+    @app.before_first_request
+    def before_first_request():
+        # Khởi tạo MT5
+        mt5_service.initialize_mt5()
+
+        # Khởi động dịch vụ giám sát tài khoản
+        account_monitor_service.start_monitoring()
+
+        # Khởi động dịch vụ copy trade
+        copy_trade_service.start_copy_service()
+
+        # Khởi động các job chạy nền
+        job_runner.start()
+
+        logging.info("All services started")
+
+    # Dừng các dịch vụ khi process thoát (không phải sau mỗi request)
+    atexit.register(shutdown)
+
+    # Xử lý lỗi 404
+    @app.errorhandler(404)
+    def not_found(error):
+        return jsonify({
+            'success': False,
+            'message': 'Endpoint not found'
+        }), 404
+
+    # Xử lý lỗi 500
+    @app.errorhandler(500)
+    def server_error(error):
+        return jsonify({
+            'success': False,
+            'message': 'Internal server error'
+        }), 500
+
+    return app
+
+
+def shutdown():
+    """Dừng các dịch vụ chạy nền và đóng database"""
     account_monitor_service.stop_monitoring()
     copy_trade_service.stop_copy_service()
+    job_runner.stop()
     db.close()
     logging.info("All services stopped")
 
-# Xử lý lỗi 404
-@app.errorhandler(404)
-def not_found(error):
-    return jsonify({
-        'success': False,
-        'message': 'Endpoint not found'
-    }), 404
-
-# Xử lý lỗi 500
-@app.errorhandler(500)
-def server_error(error):
-    return jsonify({
-        'success': False,
-        'message': 'Internal server error'
-    }), 500
+
+# Process pool của JobRunner trên Windows (spawn) import lại file này dưới tên
+# __mp_main__: không khởi tạo lại database, log và service trong process con.
+# Khi chạy trực tiếp, service được tạo ở lần import module app (như các route).
+if __name__ not in ('__main__', '__mp_main__'):
+    create_app()
 
 if __name__ == '__main__':
+    from app import app
+
     # Thêm cấu hình của thư mục static cho frontend
     app.static_folder = 'frontend/build'
-    
+
     # Khởi động server
     app.run(
         host=config.HOST,
         port=config.PORT,
         debug=config.DEBUG
-    )
\ No newline at end of file
+    )
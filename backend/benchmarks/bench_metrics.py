@@ -0,0 +1,143 @@
+# So sánh tốc độ giữa cách tính cũ của PerformanceService (list dict, pandas theo ngày) và metrics_engine (NumPy)
+# Chạy: python benchmarks/bench_metrics.py [số deal]
+
+import os
+import sys
+import time
+from datetime import datetime, timedelta
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from services.metrics_engine import compute_metrics
+
+
+def make_history(n, seed=42):
+    """Tạo lịch sử deal giả lập theo định dạng của get_order_history"""
+    rng = np.random.default_rng(seed)
+    profits = np.round(rng.normal(2.0, 50.0, n), 2)
+    start = datetime.now() - timedelta(days=365)
+    seconds = np.sort(rng.integers(0, 365 * 86400, n))
+    history = [{
+        'ticket': i + 1,
+        'symbol': 'EURUSD',
+        'type': 'BUY',
+        'volume': 0.1,
+        'price': 1.1,
+        'time': start + timedelta(seconds=int(seconds[i])),
+        'profit': float(profits[i]),
+        'commission': 0.0,
+        'swap': 0.0,
+        'fee': 0.0
+    } for i in range(n)]
+    return history, profits
+
+
+class _LegacyStore:
+    """db/mt5_service giả: trả về cùng một lịch sử cho mọi truy vấn như get_order_history"""
+
+    def __init__(self, history):
+        self.history = history
+
+    def get_account(self, account_id):
+        return object()
+
+    def get_order_history(self, account_id, start_date, end_date, account=None):
+        return self.history
+
+
+class LegacyPerformance:
+    """Các phương thức của PerformanceService trước metrics_engine (giữ nguyên cách tính)"""
+
+    def __init__(self, history):
+        self.db = self.mt5_service = _LegacyStore(history)
+
+    def calculate_daily_performance(self, account_id, days=30):
+        account = self.db.get_account(account_id)
+        end_date = datetime.now()
+        start_date = end_date - timedelta(days=days)
+        history = self.mt5_service.get_order_history(account_id, start_date, end_date, account)
+        if not history:
+            return pd.DataFrame()
+        df = pd.DataFrame(history)
+        df['date'] = pd.to_datetime(df['time']).dt.date
+        daily_profit = df.groupby('date')['profit'].sum()
+        date_range = pd.date_range(start=start_date.date(), end=end_date.date(), freq='D')
+        result = pd.DataFrame({'date': date_range})
+        result = result.set_index('date').join(daily_profit).fillna(0).reset_index()
+        result['cumulative_profit'] = result['profit'].cumsum()
+        return result
+
+    def calculate_drawdown(self, account_id):
+        daily_performance = self.calculate_daily_performance(account_id, days=365)
+        if daily_performance.empty:
+            return 0
+        cumulative = daily_performance['cumulative_profit']
+        running_max = np.maximum.accumulate(cumulative)
+        drawdown = (cumulative - running_max) / running_max * 100
+        max_drawdown = drawdown.min()
+        return abs(max_drawdown) if not np.isnan(max_drawdown) else 0
+
+    def calculate_win_rate(self, account_id):
+        account = self.db.get_account(account_id)
+        end_date = datetime.now()
+        start_date = end_date - timedelta(days=90)
+        history = self.mt5_service.get_order_history(account_id, start_date, end_date, account)
+        if not history:
+            return 0
+        winning_trades = sum(1 for trade in history if trade['profit'] > 0)
+        total_trades = len(history)
+        win_rate = (winning_trades / total_trades * 100) if total_trades > 0 else 0
+        return round(win_rate, 2)
+
+    def calculate_profit_factor(self, account_id):
+        account = self.db.get_account(account_id)
+        end_date = datetime.now()
+        start_date = end_date - timedelta(days=90)
+        history = self.mt5_service.get_order_history(account_id, start_date, end_date, account)
+        if not history:
+            return 0
+        total_profit = sum(trade['profit'] for trade in history if trade['profit'] > 0)
+        total_loss = abs(sum(trade['profit'] for trade in history if trade['profit'] < 0))
+        profit_factor = (total_profit / total_loss) if total_loss > 0 else float('inf')
+        return round(profit_factor, 2)
+
+
+def legacy_metrics(legacy):
+    """Ba chỉ số của báo cáo cũ (win rate, profit factor, drawdown %), mỗi chỉ số một lần lấy lịch sử"""
+    return legacy.calculate_win_rate(1), legacy.calculate_profit_factor(1), legacy.calculate_drawdown(1)
+
+
+def bench(fn, *args, repeat=5):
+    best = float('inf')
+    for _ in range(repeat):
+        started = time.perf_counter()
+        fn(*args)
+        best = min(best, time.perf_counter() - started)
+    return best
+
+
+def main():
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 100000
+    history, profits = make_history(n)
+
+    legacy_service = LegacyPerformance(history)
+    legacy = bench(legacy_metrics, legacy_service)
+    vectorized = bench(compute_metrics, profits)
+
+    # Cùng dữ liệu phải cho cùng kết quả ở các chỉ số chung. Drawdown cũ là %
+    # trên lợi nhuận tích lũy theo ngày (không có số dư) nên không so sánh được.
+    win_rate, profit_factor, _ = legacy_metrics(legacy_service)
+    metrics = compute_metrics(profits)
+    assert abs(metrics['win_rate'] - win_rate) < 0.01
+    assert abs(metrics['profit_factor'] - profit_factor) < 0.01
+
+    print(f"deals: {n}")
+    print(f"legacy (win rate, profit factor, drawdown %): {legacy * 1000:.1f} ms")
+    print(f"metrics_engine (full metric set):          {vectorized * 1000:.1f} ms")
+    print(f"speedup: {legacy / vectorized:.1f}x")
+
+
+if __name__ == '__main__':
+    main()
@@ -19,9 +19,11 @@ os.makedirs(os.path.dirname(DB_PATH), exist_ok=True)
 # Cấu hình MT5
 MT5_PATH = 'C:/Program Files/MetaTrader 5/terminal64.exe'
 CONNECTION_TIMEOUT = 10  # seconds
+MT5_HISTORY_CONCURRENCY = 1  # Số lần tải lịch sử (đồng bộ, backfill) chờ terminal cùng lúc
 
 # Khoảng thời gian kiểm tra
 ACCOUNT_MONITOR_INTERVAL = 60  # seconds
+DAILY_STATS_INTERVAL = 3600    # seconds, tổng hợp deal mới vào daily_account_stats
 
 # Cấu hình cảnh báo
 ALERT_CONFIG = {
@@ -42,6 +44,55 @@ COPY_TRADE_CONFIG = {
     'max_slippage': 5
 }
 
+# Cấu hình hiệu suất
+PERFORMANCE_CONFIG = {
+    'compare_workers': 4,      # Số tài khoản được xử lý song song khi so sánh
+    'history_staleness': 30,   # seconds, bỏ qua đồng bộ lịch sử nếu vừa đồng bộ
+    'result_cache_entries': 512,            # Số kết quả tối đa trong cache
+    'result_cache_bytes': 64 * 1024 * 1024, # Dung lượng tối đa của cache (bytes, ước lượng theo JSON)
+    'monte_carlo_max_simulations': 100000,  # Giới hạn số đường mô phỏng cho một yêu cầu
+    'monte_carlo_max_trades': 10000,        # Giới hạn độ dài mỗi đường (số giao dịch)
+    'monte_carlo_max_steps': 50000000       # Giới hạn số đường x số giao dịch của một yêu cầu
+}
+
+# Cấu hình job chạy nền (thống kê, tổng hợp hiệu suất, backfill)
+JOB_RUNNER_CONFIG = {
+    'process_workers': 2,  # Số process cho phần tính toán nặng
+    'thread_workers': 2,   # Số job chạy đồng thời
+    'poll_interval': 1,    # seconds
+    'budgets': {           # seconds, ngân sách thời gian cho mỗi lần chạy job
+        'daily_stats': 600,
+        'history_archive': 600,
+        'history_backfill': 300
+    }
+}
+
+# Cấu hình nhập lịch sử ban đầu cho tài khoản mới (chạy nền theo từng tháng)
+HISTORY_BACKFILL_CONFIG = {
+    'days': 365,           # Độ dài lịch sử được nhập
+    'interval': 60         # seconds, nhịp chạy tiếp các job còn dở
+}
+
+# Cấu hình lưu trữ lịch sử theo tháng (file cột, đọc bằng memory map)
+HISTORY_ARCHIVE_CONFIG = {
+    'path': os.path.join('data', 'archive'),
+    'interval': 86400      # seconds giữa hai lần đóng băng các tháng đã kết thúc
+}
+
+# Cấu hình cache nến OHLC (các đoạn file theo symbol/khung thời gian, đọc bằng memory map)
+BAR_CACHE_CONFIG = {
+    'path': os.path.join('data', 'bars'),
+    'refresh_interval': 1,  # seconds, các yêu cầu trong khoảng này dùng chung một lần lấy từ terminal
+    'max_bars': 50000,      # Số nến tối đa trong một response
+    'default_days': 7       # Khoảng mặc định khi không truyền from
+}
+
+# Cấu hình luồng sự kiện (Server-Sent Events)
+STREAM_CONFIG = {
+    'max_queue': 500,      # Số sự kiện tối đa chờ gửi cho mỗi client
+    'heartbeat': 15        # seconds, gửi keep-alive khi không có sự kiện
+}
+
 # Cấu hình rủi ro
 RISK_SETTINGS = {
     'max_risk_per_trade': 2,  # % vốn tối đa cho mỗi giao dịch
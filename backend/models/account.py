@@ -3,12 +3,15 @@
 from datetime import datetime
 
 class Account:
-    def __init__(self, account_id=None, login=None, password=None, server=None, name=None):
+    def __init__(self, account_id=None, login=None, password=None, server=None, name=None,
+                 user_id=None, group_name=None):
         self.account_id = account_id
         self.login = login
         self.password = password
         self.server = server
         self.name = name or f"Account {login}"
+        self.user_id = user_id        # Người dùng quản lý tài khoản
+        self.group_name = group_name  # Nhóm tài khoản (tag)
         self.balance = 0
         self.equity = 0
         self.margin = 0
@@ -41,6 +44,8 @@ class Account:
             'password': self.password,
             'server': self.server,
             'name': self.name,
+            'user_id': self.user_id,
+            'group_name': self.group_name,
             'balance': self.balance,
             'equity': self.equity,
             'margin': self.margin,
@@ -59,7 +64,9 @@ class Account:
             login=data.get('login'),
             password=data.get('password'),
             server=data.get('server'),
-            name=data.get('name')
+            name=data.get('name'),
+            user_id=data.get('user_id'),
+            group_name=data.get('group_name')
         )
         
         account.balance = data.get('balance', 0)
@@ -2,26 +2,33 @@
 import sqlite3
 import json
 import os
+import threading
 from datetime import datetime
 
 class Database:
     def __init__(self, db_path):
         self.db_path = db_path
         self.conn = None
+        # Kết nối dùng chung cho mọi thread (monitor, copy, job runner, request):
+        # mọi thao tác trên kết nối giữ khóa này để commit của thread này không
+        # commit nửa transaction của thread khác
+        self.lock = threading.RLock()
         # Đảm bảo thư mục chứa database tồn tại
         os.makedirs(os.path.dirname(db_path), exist_ok=True)
         
     def connect(self):
         """Kết nối tới database"""
-        self.conn = sqlite3.connect(self.db_path)
-        self.conn.row_factory = sqlite3.Row  # Để kết quả truy vấn trả về dạng dictionary
-        return self.conn
+        with self.lock:
+            self.conn = sqlite3.connect(self.db_path, check_same_thread=False)
+            self.conn.row_factory = sqlite3.Row  # Để kết quả truy vấn trả về dạng dictionary
+            return self.conn
         
     def close(self):
         """Đóng kết nối database"""
-        if self.conn:
-            self.conn.close()
-            self.conn = None
+        with self.lock:
+            if self.conn:
+                self.conn.close()
+                self.conn = None
     
     def init_db(self):
         """Khởi tạo cấu trúc database"""
@@ -47,6 +54,8 @@ class Database:
             password TEXT NOT NULL,
             server TEXT NOT NULL,
             name TEXT,
+            user_id INTEGER,
+            group_name TEXT,
             balance REAL DEFAULT 0,
             equity REAL DEFAULT 0,
             margin REAL DEFAULT 0,
@@ -58,6 +67,12 @@ class Database:
         )
         ''')
         
+        # Bổ sung cột cho database tạo từ phiên bản cũ
+        self._ensure_columns(cursor, 'accounts', {
+            'user_id': 'INTEGER',
+            'group_name': 'TEXT'
+        })
+        
         # Tạo bảng trades
         cursor.execute('''
         CREATE TABLE IF NOT EXISTS trades (
@@ -99,184 +114,1106 @@ class Database:
         )
         ''')
         
+        # Tạo bảng daily_account_stats (thống kê giao dịch theo ngày)
+        cursor.execute('''
+        CREATE TABLE IF NOT EXISTS daily_account_stats (
+            account_id INTEGER NOT NULL,
+            date TEXT NOT NULL,
+            total_trades INTEGER DEFAULT 0,
+            winning_trades INTEGER DEFAULT 0,
+            losing_trades INTEGER DEFAULT 0,
+            profit REAL DEFAULT 0,
+            loss REAL DEFAULT 0,
+            volume REAL DEFAULT 0,
+            commission REAL DEFAULT 0,
+            swap REAL DEFAULT 0,
+            PRIMARY KEY (account_id, date),
+            FOREIGN KEY (account_id) REFERENCES accounts (id)
+        )
+        ''')
+        self._ensure_columns(cursor, 'daily_account_stats', {
+            'volume': 'REAL DEFAULT 0',
+            'commission': 'REAL DEFAULT 0',
+            'swap': 'REAL DEFAULT 0'
+        })
+        
+        # Tạo bảng monthly_account_stats (tổng hợp theo tháng từ daily_account_stats)
+        cursor.execute('''
+        CREATE TABLE IF NOT EXISTS monthly_account_stats (
+            account_id INTEGER NOT NULL,
+            month TEXT NOT NULL,
+            total_trades INTEGER DEFAULT 0,
+            winning_trades INTEGER DEFAULT 0,
+            losing_trades INTEGER DEFAULT 0,
+            profit REAL DEFAULT 0,
+            loss REAL DEFAULT 0,
+            volume REAL DEFAULT 0,
+            commission REAL DEFAULT 0,
+            swap REAL DEFAULT 0,
+            PRIMARY KEY (account_id, month),
+            FOREIGN KEY (account_id) REFERENCES accounts (id)
+        )
+        ''')
+        
+        # Tạo bảng stats_watermarks (deal cuối cùng đã được tổng hợp cho mỗi tài khoản)
+        cursor.execute('''
+        CREATE TABLE IF NOT EXISTS stats_watermarks (
+            account_id INTEGER PRIMARY KEY,
+            synced_from TIMESTAMP,
+            last_deal_time TIMESTAMP,
+            last_deal_ticket INTEGER DEFAULT 0,
+            updated_at TIMESTAMP,
+            FOREIGN KEY (account_id) REFERENCES accounts (id)
+        )
+        ''')
+        self._ensure_columns(cursor, 'stats_watermarks', {'synced_from': 'TIMESTAMP'})
+        
+        # Tạo bảng deals (bản sao cục bộ lịch sử deal của MT5)
+        cursor.execute('''
+        CREATE TABLE IF NOT EXISTS deals (
+            account_id INTEGER NOT NULL,
+            ticket INTEGER NOT NULL,
+            order_ticket INTEGER,
+            position_id INTEGER,
+            symbol TEXT,
+            type TEXT,
+            deal_type INTEGER,
+            entry INTEGER,
+            volume REAL,
+            price REAL,
+            time TEXT NOT NULL,
+            profit REAL DEFAULT 0,
+            commission REAL DEFAULT 0,
+            swap REAL DEFAULT 0,
+            fee REAL DEFAULT 0,
+            magic INTEGER,
+            PRIMARY KEY (account_id, ticket),
+            FOREIGN KEY (account_id) REFERENCES accounts (id)
+        )
+        ''')
+        cursor.execute('CREATE INDEX IF NOT EXISTS idx_deals_account_time ON deals (account_id, time)')
+        cursor.execute('CREATE INDEX IF NOT EXISTS idx_deals_account_position ON deals (account_id, position_id)')
+        
+        # Tạo bảng history_sync_state (khoảng thời gian đã đồng bộ vào bảng deals)
+        cursor.execute('''
+        CREATE TABLE IF NOT EXISTS history_sync_state (
+            account_id INTEGER PRIMARY KEY,
+            synced_from TIMESTAMP,
+            synced_to TIMESTAMP,
+            last_deal_time TIMESTAMP,
+            last_deal_ticket INTEGER DEFAULT 0,
+            deal_count INTEGER DEFAULT 0,
+            synced_at TIMESTAMP,
+            FOREIGN KEY (account_id) REFERENCES accounts (id)
+        )
+        ''')
+        
+        # Tạo bảng open_positions (ảnh chụp vị thế mở gần nhất do monitor/copy engine ghi)
+        cursor.execute('''
+        CREATE TABLE IF NOT EXISTS open_positions (
+            account_id INTEGER NOT NULL,
+            ticket INTEGER NOT NULL,
+            symbol TEXT NOT NULL,
+            type TEXT NOT NULL,
+            volume REAL NOT NULL,
+            open_price REAL,
+            open_time TIMESTAMP,
+            current_price REAL,
+            sl REAL,
+            tp REAL,
+            profit REAL DEFAULT 0,
+            contract_size REAL,
+            updated_at TIMESTAMP,
+            PRIMARY KEY (account_id, ticket),
+            FOREIGN KEY (account_id) REFERENCES accounts (id)
+        )
+        ''')
+        
+        # Tạo bảng position_snapshots (thời điểm danh sách vị thế của tài khoản được lấy lần cuối)
+        cursor.execute('''
+        CREATE TABLE IF NOT EXISTS position_snapshots (
+            account_id INTEGER PRIMARY KEY,
+            captured_at TIMESTAMP,
+            FOREIGN KEY (account_id) REFERENCES accounts (id)
+        )
+        ''')
+        
+        # Tạo bảng history_backfill_jobs (nhập lịch sử ban đầu theo từng tháng, chạy nền)
+        cursor.execute('''
+        CREATE TABLE IF NOT EXISTS history_backfill_jobs (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            account_id INTEGER NOT NULL,
+            status TEXT NOT NULL DEFAULT 'pending',
+            start_date TIMESTAMP NOT NULL,
+            end_date TIMESTAMP NOT NULL,
+            backfilled_from TIMESTAMP,
+            chunks_total INTEGER DEFAULT 0,
+            chunks_done INTEGER DEFAULT 0,
+            deals_imported INTEGER DEFAULT 0,
+            error TEXT,
+            created_at TIMESTAMP,
+            updated_at TIMESTAMP,
+            finished_at TIMESTAMP,
+            FOREIGN KEY (account_id) REFERENCES accounts (id)
+        )
+        ''')
+        cursor.execute('CREATE INDEX IF NOT EXISTS idx_backfill_jobs_status ON history_backfill_jobs (status)')
+        cursor.execute('CREATE INDEX IF NOT EXISTS idx_backfill_jobs_account ON history_backfill_jobs (account_id)')
+        
+        # Tạo bảng drawdown_state (trạng thái drawdown theo equity của từng tài khoản)
+        cursor.execute('''
+        CREATE TABLE IF NOT EXISTS drawdown_state (
+            account_id INTEGER PRIMARY KEY,
+            peak REAL,
+            peak_time TIMESTAMP,
+            trough REAL,
+            trough_time TIMESTAMP,
+            last_equity REAL,
+            last_time TIMESTAMP,
+            current_drawdown REAL DEFAULT 0,
+            current_drawdown_percent REAL DEFAULT 0,
+            max_drawdown REAL DEFAULT 0,
+            max_drawdown_percent REAL DEFAULT 0,
+            max_drawdown_start TIMESTAMP,
+            max_drawdown_end TIMESTAMP,
+            FOREIGN KEY (account_id) REFERENCES accounts (id)
+        )
+        ''')
+        
+        # Tạo bảng account_leaderboard (chỉ số xếp hạng đã tính sẵn của từng tài khoản)
+        cursor.execute('''
+        CREATE TABLE IF NOT EXISTS account_leaderboard (
+            account_id INTEGER PRIMARY KEY,
+            total_trades INTEGER DEFAULT 0,
+            winning_trades INTEGER DEFAULT 0,
+            losing_trades INTEGER DEFAULT 0,
+            profit REAL DEFAULT 0,
+            loss REAL DEFAULT 0,
+            net_profit REAL DEFAULT 0,
+            win_rate REAL DEFAULT 0,
+            profit_factor REAL DEFAULT 0,
+            return_percent REAL DEFAULT 0,
+            max_drawdown REAL DEFAULT 0,
+            max_drawdown_percent REAL DEFAULT 0,
+            updated_at TIMESTAMP,
+            FOREIGN KEY (account_id) REFERENCES accounts (id)
+        )
+        ''')
+        for column in self.LEADERBOARD_METRICS:
+            cursor.execute(
+                f'CREATE INDEX IF NOT EXISTS idx_leaderboard_{column} ON account_leaderboard ({column}, account_id)'
+            )
+        # Sắp tăng dần vẫn để các dòng NULL cuối cùng
+        for column in self.LEADERBOARD_NULLABLE_METRICS:
+            cursor.execute(
+                f'CREATE INDEX IF NOT EXISTS idx_leaderboard_{column}_nulls_last '
+                f'ON account_leaderboard ({column} IS NULL, {column}, account_id)'
+            )
+        # Điền các tài khoản đã có thống kê nhưng chưa có dòng xếp hạng
+        self._refresh_leaderboard(
+            cursor, 's.account_id NOT IN (SELECT account_id FROM account_leaderboard)', []
+        )
+        
+        # Tạo bảng service_state (trạng thái dạng key/value của các service)
+        cursor.execute('''
+        CREATE TABLE IF NOT EXISTS service_state (
+            key TEXT PRIMARY KEY,
+            value TEXT,
+            updated_at TIMESTAMP
+        )
+        ''')
+        
         conn.commit()
         return True
     
+    def _ensure_columns(self, cursor, table, columns):
+        """Thêm các cột còn thiếu vào bảng đã tồn tại"""
+        cursor.execute(f"PRAGMA table_info({table})")
+        existing = {row['name'] for row in cursor.fetchall()}
+        
+        for name, definition in columns.items():
+            if name not in existing:
+                cursor.execute(f"ALTER TABLE {table} ADD COLUMN {name} {definition}")
+    
     # Các phương thức CRUD cho Account
     def save_account(self, account):
         """Lưu hoặc cập nhật thông tin tài khoản"""
-        conn = self.conn or self.connect()
-        cursor = conn.cursor()
-        
-        # Kiểm tra xem tài khoản đã tồn tại chưa
-        cursor.execute("SELECT id FROM accounts WHERE login = ?", (account.login,))
-        result = cursor.fetchone()
-        
-        if result:
-            # Cập nhật tài khoản hiện có
-            account_id = result['id']
-            cursor.execute('''
-            UPDATE accounts SET 
-                password = ?, server = ?, name = ?, balance = ?, 
-                equity = ?, margin = ?, free_margin = ?, leverage = ?,
-                profit = ?, is_connected = ?, last_update = ?
-            WHERE id = ?
-            ''', (
-                account.password, account.server, account.name,
-                account.balance, account.equity, account.margin, 
-                account.free_margin, account.leverage, account.profit,
-                account.is_connected, datetime.now(), account_id
-            ))
-            account.account_id = account_id
-        else:
-            # Thêm tài khoản mới
-            cursor.execute('''
-            INSERT INTO accounts (
-                login, password, server, name, balance, 
-                equity, margin, free_margin, leverage,
-                profit, is_connected, last_update
-            ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-            ''', (
-                account.login, account.password, account.server, account.name,
-                account.balance, account.equity, account.margin, 
-                account.free_margin, account.leverage, account.profit,
-                account.is_connected, datetime.now()
-            ))
-            account.account_id = cursor.lastrowid
+        with self.lock:
+            conn = self.conn or self.connect()
+            cursor = conn.cursor()
             
-        conn.commit()
-        return account.account_id
+            # Kiểm tra xem tài khoản đã tồn tại chưa
+            cursor.execute("SELECT id FROM accounts WHERE login = ?", (account.login,))
+            result = cursor.fetchone()
+            
+            if result:
+                # Cập nhật tài khoản hiện có
+                account_id = result['id']
+                cursor.execute('''
+                UPDATE accounts SET 
+                    password = ?, server = ?, name = ?, user_id = ?, group_name = ?,
+                    balance = ?, equity = ?, margin = ?, free_margin = ?, leverage = ?,
+                    profit = ?, is_connected = ?, last_update = ?
+                WHERE id = ?
+                ''', (
+                    account.password, account.server, account.name,
+                    account.user_id, account.group_name, account.balance, account.equity, account.margin, 
+                    account.free_margin, account.leverage, account.profit,
+                    account.is_connected, datetime.now(), account_id
+                ))
+                account.account_id = account_id
+            else:
+                # Thêm tài khoản mới
+                cursor.execute('''
+                INSERT INTO accounts (
+                    login, password, server, name, user_id, group_name, balance, 
+                    equity, margin, free_margin, leverage,
+                    profit, is_connected, last_update
+                ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+                ''', (
+                    account.login, account.password, account.server, account.name,
+                    account.user_id, account.group_name, account.balance, account.equity, account.margin, 
+                    account.free_margin, account.leverage, account.profit,
+                    account.is_connected, datetime.now()
+                ))
+                account.account_id = cursor.lastrowid
+                
+            conn.commit()
+            return account.account_id
     
     def get_account(self, account_id):
         """Lấy thông tin tài khoản theo ID"""
         from models.account import Account
         
-        conn = self.conn or self.connect()
-        cursor = conn.cursor()
-        
-        cursor.execute("SELECT * FROM accounts WHERE id = ?", (account_id,))
-        row = cursor.fetchone()
-        
-        if row:
-            account = Account(
-                account_id=row['id'],
-                login=row['login'],
-                password=row['password'],
-                server=row['server'],
-                name=row['name']
-            )
-            account.balance = row['balance']
-            account.equity = row['equity']
-            account.margin = row['margin']
-            account.free_margin = row['free_margin']
-            account.leverage = row['leverage']
-            account.profit = row['profit']
-            account.is_connected = bool(row['is_connected'])
-            account.last_update = row['last_update']
-            return account
-        return None
+        with self.lock:
+            conn = self.conn or self.connect()
+            cursor = conn.cursor()
+            
+            cursor.execute("SELECT * FROM accounts WHERE id = ?", (account_id,))
+            row = cursor.fetchone()
+            
+            if row:
+                account = Account(
+                    account_id=row['id'],
+                    login=row['login'],
+                    password=row['password'],
+                    server=row['server'],
+                    name=row['name'],
+                    user_id=row['user_id'],
+                    group_name=row['group_name']
+                )
+                account.balance = row['balance']
+                account.equity = row['equity']
+                account.margin = row['margin']
+                account.free_margin = row['free_margin']
+                account.leverage = row['leverage']
+                account.profit = row['profit']
+                account.is_connected = bool(row['is_connected'])
+                account.last_update = _parse_timestamp(row['last_update'])
+                return account
+            return None
     
     def get_all_accounts(self):
         """Lấy tất cả tài khoản"""
         from models.account import Account
         
-        conn = self.conn or self.connect()
-        cursor = conn.cursor()
-        
-        cursor.execute("SELECT * FROM accounts ORDER BY name")
-        rows = cursor.fetchall()
-        
-        accounts = []
-        for row in rows:
-            account = Account(
-                account_id=row['id'],
-                login=row['login'],
-                password=row['password'],
-                server=row['server'],
-                name=row['name']
-            )
-            account.balance = row['balance']
-            account.equity = row['equity']
-            account.margin = row['margin']
-            account.free_margin = row['free_margin']
-            account.leverage = row['leverage']
-            account.profit = row['profit']
-            account.is_connected = bool(row['is_connected'])
-            account.last_update = row['last_update']
-            accounts.append(account)
-            
-        return accounts
+        with self.lock:
+            conn = self.conn or self.connect()
+            cursor = conn.cursor()
+            
+            cursor.execute("SELECT * FROM accounts ORDER BY name")
+            rows = cursor.fetchall()
+            
+            accounts = []
+            for row in rows:
+                account = Account(
+                    account_id=row['id'],
+                    login=row['login'],
+                    password=row['password'],
+                    server=row['server'],
+                    name=row['name'],
+                    user_id=row['user_id'],
+                    group_name=row['group_name']
+                )
+                account.balance = row['balance']
+                account.equity = row['equity']
+                account.margin = row['margin']
+                account.free_margin = row['free_margin']
+                account.leverage = row['leverage']
+                account.profit = row['profit']
+                account.is_connected = bool(row['is_connected'])
+                account.last_update = _parse_timestamp(row['last_update'])
+                accounts.append(account)
+                
+            return accounts
     
     def delete_account(self, account_id):
         """Xóa tài khoản theo ID"""
-        conn = self.conn or self.connect()
-        cursor = conn.cursor()
+        with self.lock:
+            conn = self.conn or self.connect()
+            cursor = conn.cursor()
+            
+            # Xóa các cài đặt copy trade liên quan
+            cursor.execute("DELETE FROM copy_settings WHERE master_account_id = ? OR follower_account_id = ?", 
+                          (account_id, account_id))
+            
+            # Xóa các giao dịch liên quan
+            cursor.execute("DELETE FROM trades WHERE account_id = ?", (account_id,))
+            cursor.execute("DELETE FROM open_positions WHERE account_id = ?", (account_id,))
+            cursor.execute("DELETE FROM position_snapshots WHERE account_id = ?", (account_id,))
+            
+            # Xóa thống kê đã tổng hợp
+            cursor.execute("DELETE FROM daily_account_stats WHERE account_id = ?", (account_id,))
+            cursor.execute("DELETE FROM monthly_account_stats WHERE account_id = ?", (account_id,))
+            cursor.execute("DELETE FROM stats_watermarks WHERE account_id = ?", (account_id,))
+            
+            cursor.execute("DELETE FROM drawdown_state WHERE account_id = ?", (account_id,))
+            cursor.execute("DELETE FROM account_leaderboard WHERE account_id = ?", (account_id,))
+            
+            # Xóa lịch sử deal cục bộ
+            cursor.execute("DELETE FROM deals WHERE account_id = ?", (account_id,))
+            cursor.execute("DELETE FROM history_sync_state WHERE account_id = ?", (account_id,))
+            cursor.execute("DELETE FROM history_backfill_jobs WHERE account_id = ?", (account_id,))
+            
+            # Xóa tài khoản
+            cursor.execute("DELETE FROM accounts WHERE id = ?", (account_id,))
+            
+            conn.commit()
+            return cursor.rowcount > 0
+    
+    # Các phương thức CRUD cho CopySettings
+    def save_copy_settings(self, copy_settings):
+        """Lưu hoặc cập nhật cài đặt copy trade"""
+        with self.lock:
+            conn = self.conn or self.connect()
+            cursor = conn.cursor()
+            
+            # Chuyển danh sách symbols sang JSON
+            allowed_symbols_json = json.dumps(copy_settings.allowed_symbols) if copy_settings.allowed_symbols else None
+            
+            # Kiểm tra xem cài đặt đã tồn tại chưa
+            if copy_settings.id:
+                cursor.execute('''
+                UPDATE copy_settings SET 
+                    master_account_id = ?, follower_account_id = ?, volume_percent = ?,
+                    copy_sl_tp = ?, min_volume = ?, max_volume = ?,
+                    allowed_symbols = ?, is_active = ?
+                WHERE id = ?
+                ''', (
+                    copy_settings.master_account_id, copy_settings.follower_account_id,
+                    copy_settings.volume_percent, copy_settings.copy_sl_tp,
+                    copy_settings.min_volume, copy_settings.max_volume,
+                    allowed_symbols_json, copy_settings.is_active, copy_settings.id
+                ))
+            else:
+                # Kiểm tra xem cặp master/follower đã tồn tại chưa
+                cursor.execute('''
+                SELECT id FROM copy_settings 
+                WHERE master_account_id = ? AND follower_account_id = ?
+                ''', (copy_settings.master_account_id, copy_settings.follower_account_id))
+                
+                existing = cursor.fetchone()
+                if existing:
+                    copy_settings.id = existing['id']
+                    return self.save_copy_settings(copy_settings)
+                
+                # Thêm cài đặt mới
+                cursor.execute('''
+                INSERT INTO copy_settings (
+                    master_account_id, follower_account_id, volume_percent,
+                    copy_sl_tp, min_volume, max_volume,
+                    allowed_symbols, is_active, created_at
+                ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+                ''', (
+                    copy_settings.master_account_id, copy_settings.follower_account_id,
+                    copy_settings.volume_percent, copy_settings.copy_sl_tp,
+                    copy_settings.min_volume, copy_settings.max_volume,
+                    allowed_symbols_json, copy_settings.is_active, datetime.now()
+                ))
+                copy_settings.id = cursor.lastrowid
+                
+            conn.commit()
+            return copy_settings.id
+    
+    # Các phương thức cho thống kê hàng ngày
+    def get_stats_watermark(self, account_id):
+        """Lấy deal cuối cùng đã được tổng hợp vào daily_account_stats"""
+        with self.lock:
+            conn = self.conn or self.connect()
+            cursor = conn.cursor()
+            
+            cursor.execute("SELECT * FROM stats_watermarks WHERE account_id = ?", (account_id,))
+            row = cursor.fetchone()
+            
+            if not row:
+                return None
+                
+            return {
+                'account_id': row['account_id'],
+                'synced_from': _parse_timestamp(row['synced_from']),
+                'last_deal_time': _parse_timestamp(row['last_deal_time']),
+                'last_deal_ticket': row['last_deal_ticket'] or 0,
+                'updated_at': _parse_timestamp(row['updated_at'])
+            }
+    
+    def apply_daily_account_stats(self, account_id, daily_rows, last_deal_time, last_deal_ticket,
+                                  reset_from=None):
+        """Cộng dồn thống kê các deal mới vào daily_account_stats và dời watermark
+        
+        Các tháng có ngày thay đổi được tổng hợp lại vào monthly_account_stats
+        và dòng xếp hạng của tài khoản được tính lại từ các tháng. Tất cả nằm
+        trong cùng một transaction để không đếm trùng deal nếu tiến trình bị
+        dừng giữa chừng. reset_from: xóa thống kê cũ và tổng hợp lại từ thời
+        điểm này (lần đầu hoặc khi bảng chưa đủ cột).
+        """
+        with self.lock:
+            conn = self.conn or self.connect()
+            cursor = conn.cursor()
+            
+            try:
+                if reset_from:
+                    cursor.execute("DELETE FROM daily_account_stats WHERE account_id = ?", (account_id,))
+                    cursor.execute("DELETE FROM monthly_account_stats WHERE account_id = ?", (account_id,))
+                    
+                for row in daily_rows:
+                    cursor.execute('''
+                    INSERT INTO daily_account_stats (
+                        account_id, date, total_trades, winning_trades,
+                        losing_trades, profit, loss, volume, commission, swap
+                    ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+                    ON CONFLICT (account_id, date) DO UPDATE SET
+                        total_trades = total_trades + excluded.total_trades,
+                        winning_trades = winning_trades + excluded.winning_trades,
+                        losing_trades = losing_trades + excluded.losing_trades,
+                        profit = profit + excluded.profit,
+                        loss = loss + excluded.loss,
+                        volume = volume + excluded.volume,
+                        commission = commission + excluded.commission,
+                        swap = swap + excluded.swap
+                    ''', (
+                        account_id, row['date'], row['total_trades'],
+                        row['winning_trades'], row['losing_trades'],
+                        row['profit'], row['loss'], row.get('volume', 0),
+                        row.get('commission', 0), row.get('swap', 0)
+                    ))
+                    
+                # Tổng hợp lại các tháng bị ảnh hưởng (tối đa 31 dòng ngày mỗi tháng)
+                for month in sorted({row['date'][:7] for row in daily_rows}):
+                    cursor.execute('''
+                    INSERT INTO monthly_account_stats (
+                        account_id, month, total_trades, winning_trades,
+                        losing_trades, profit, loss, volume, commission, swap
+                    )
+                    SELECT account_id, substr(date, 1, 7), SUM(total_trades), SUM(winning_trades),
+                        SUM(losing_trades), SUM(profit), SUM(loss), SUM(volume),
+                        SUM(commission), SUM(swap)
+                    FROM daily_account_stats
+                    WHERE account_id = ? AND date >= ? AND date < ?
+                    GROUP BY account_id, substr(date, 1, 7)
+                    ON CONFLICT (account_id, month) DO UPDATE SET
+                        total_trades = excluded.total_trades,
+                        winning_trades = excluded.winning_trades,
+                        losing_trades = excluded.losing_trades,
+                        profit = excluded.profit,
+                        loss = excluded.loss,
+                        volume = excluded.volume,
+                        commission = excluded.commission,
+                        swap = excluded.swap
+                    ''', (account_id, f"{month}-01", f"{month}-32"))
+                    
+                if daily_rows or reset_from:
+                    self._refresh_leaderboard(cursor, 's.account_id = ?', [account_id])
+                    
+                cursor.execute('''
+                INSERT INTO stats_watermarks (account_id, synced_from, last_deal_time, last_deal_ticket, updated_at)
+                VALUES (?, ?, ?, ?, ?)
+                ON CONFLICT (account_id) DO UPDATE SET
+                    synced_from = COALESCE(excluded.synced_from, synced_from),
+                    last_deal_time = excluded.last_deal_time,
+                    last_deal_ticket = excluded.last_deal_ticket,
+                    updated_at = excluded.updated_at
+                ''', (account_id, reset_from, last_deal_time, last_deal_ticket, datetime.now()))
+                
+                conn.commit()
+            except Exception:
+                conn.rollback()
+                raise
+                
+        return True
+    
+    def touch_stats_watermark(self, account_id):
+        """Ghi nhận lần đồng bộ không có deal mới (giữ nguyên watermark)"""
+        with self.lock:
+            conn = self.conn or self.connect()
+            cursor = conn.cursor()
+            
+            cursor.execute(
+                "UPDATE stats_watermarks SET updated_at = ? WHERE account_id = ?",
+                (datetime.now(), account_id)
+            )
+            conn.commit()
+            return cursor.rowcount > 0
+    
+    def reset_stats_watermark(self, account_id):
+        """Xóa watermark thống kê để lần đồng bộ sau tổng hợp lại cả cửa sổ (ví dụ sau backfill)"""
+        with self.lock:
+            conn = self.conn or self.connect()
+            cursor = conn.cursor()
+            
+            cursor.execute("DELETE FROM stats_watermarks WHERE account_id = ?", (account_id,))
+            conn.commit()
+            return cursor.rowcount > 0
+    
+    def get_account_stats_summary(self, account_id, from_date):
+        """Tổng hợp daily_account_stats từ ngày from_date (YYYY-MM-DD) đến nay"""
+        with self.lock:
+            conn = self.conn or self.connect()
+            cursor = conn.cursor()
+            
+            cursor.execute('''
+            SELECT
+                COALESCE(SUM(total_trades), 0) AS total_trades,
+                COALESCE(SUM(winning_trades), 0) AS winning_trades,
+                COALESCE(SUM(losing_trades), 0) AS losing_trades,
+                COALESCE(SUM(profit), 0) AS profit,
+                COALESCE(SUM(loss), 0) AS loss
+            FROM daily_account_stats
+            WHERE account_id = ? AND date >= ?
+            ''', (account_id, from_date))
+            row = cursor.fetchone()
+            
+            return dict(row)
+    
+    def get_daily_account_stats(self, account_id, from_date, to_date):
+        """Đọc các dòng thống kê theo ngày trong khoảng [from_date, to_date] (YYYY-MM-DD)"""
+        with self.lock:
+            conn = self.conn or self.connect()
+            cursor = conn.cursor()
+            
+            cursor.execute('''
+            SELECT * FROM daily_account_stats
+            WHERE account_id = ? AND date >= ? AND date <= ?
+            ORDER BY date
+            ''', (account_id, from_date, to_date))
+            
+            return [dict(row) for row in cursor.fetchall()]
+    
+    def get_daily_stats_for_accounts(self, account_ids, from_date, to_date):
+        """Đọc thống kê theo ngày của nhiều tài khoản trong một truy vấn (dạng tuple)
+        
+        Mỗi dòng: (account_id, date, net_profit, total_trades, winning_trades,
+        losing_trades, profit, loss).
+        """
+        if not account_ids:
+            return []
+            
+        placeholders = ', '.join('?' * len(account_ids))
+        with self.lock:
+            conn = self.conn or self.connect()
+            cursor = conn.cursor()
+            
+            cursor.execute(f'''
+            SELECT account_id, date, profit + loss, total_trades, winning_trades,
+                losing_trades, profit, loss
+            FROM daily_account_stats
+            WHERE account_id IN ({placeholders}) AND date >= ? AND date <= ?
+            ''', [*account_ids, from_date, to_date])
+            
+            return [tuple(row) for row in cursor.fetchall()]
+    
+    def get_monthly_account_stats(self, account_id, from_month, to_month):
+        """Đọc các dòng thống kê theo tháng trong khoảng [from_month, to_month] (YYYY-MM)"""
+        with self.lock:
+            conn = self.conn or self.connect()
+            cursor = conn.cursor()
+            
+            cursor.execute('''
+            SELECT * FROM monthly_account_stats
+            WHERE account_id = ? AND month >= ? AND month <= ?
+            ORDER BY month
+            ''', (account_id, from_month, to_month))
+            
+            return [dict(row) for row in cursor.fetchall()]
+    
+    # Các phương thức cho lịch sử deal cục bộ
+    DEAL_COLUMNS = ['ticket', 'order_ticket', 'position_id', 'symbol', 'type', 'deal_type',
+                    'entry', 'volume', 'price', 'time', 'profit', 'commission', 'swap',
+                    'fee', 'magic']
+    
+    def save_deals(self, account_id, deals):
+        """Lưu các deal lấy từ MT5 (bỏ qua deal đã có)"""
+        if not deals:
+            return 0
+            
+        rows = [(
+            account_id, d['ticket'], d.get('order'), d.get('position_id'), d['symbol'],
+            d['type'], d.get('deal_type'), d.get('entry'), d['volume'], d['price'],
+            _format_timestamp(d['time']), d['profit'], d.get('commission', 0),
+            d.get('swap', 0), d.get('fee', 0), d.get('magic')
+        ) for d in deals]
         
-        # Xóa các cài đặt copy trade liên quan
-        cursor.execute("DELETE FROM copy_settings WHERE master_account_id = ? OR follower_account_id = ?", 
-                      (account_id, account_id))
+        with self.lock:
+            conn = self.conn or self.connect()
+            cursor = conn.cursor()
+            
+            cursor.executemany('''
+            INSERT OR IGNORE INTO deals (
+                account_id, ticket, order_ticket, position_id, symbol, type,
+                deal_type, entry, volume, price, time, profit, commission,
+                swap, fee, magic
+            ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+            ''', rows)
+            conn.commit()
+            return cursor.rowcount
+    
+    def get_deals(self, account_id, from_time=None, to_time=None, symbol=None):
+        """Lấy deal cục bộ theo khoảng thời gian (và symbol), sắp xếp theo thời gian (dạng tuple theo DEAL_COLUMNS)"""
+        query = f"SELECT {', '.join(self.DEAL_COLUMNS)} FROM deals WHERE account_id = ?"
+        params = [account_id]
+        if from_time:
+            query += " AND time >= ?"
+            params.append(_format_timestamp(from_time))
+        if to_time:
+            query += " AND time <= ?"
+            params.append(_format_timestamp(to_time))
+        if symbol:
+            query += " AND symbol = ?"
+            params.append(symbol)
+        query += " ORDER BY time, ticket"
         
-        # Xóa các giao dịch liên quan
-        cursor.execute("DELETE FROM trades WHERE account_id = ?", (account_id,))
+        with self.lock:
+            conn = self.conn or self.connect()
+            cursor = conn.cursor()
+            cursor.execute(query, params)
+            return [tuple(row) for row in cursor.fetchall()]
+    
+    def get_deals_page(self, account_id, from_time=None, to_time=None, after=None, limit=5000):
+        """Lấy một trang deal theo thứ tự (time, ticket), bắt đầu sau khóa after=(time, ticket)
         
-        # Xóa tài khoản
-        cursor.execute("DELETE FROM accounts WHERE id = ?", (account_id,))
+        Phân trang theo khóa nên mỗi trang là một truy vấn ngắn, không giữ khóa
+        database trong suốt quá trình xuất dữ liệu lớn.
+        """
+        query = f"SELECT {', '.join(self.DEAL_COLUMNS)} FROM deals WHERE account_id = ?"
+        params = [account_id]
+        if from_time:
+            query += " AND time >= ?"
+            params.append(_format_timestamp(from_time))
+        if to_time:
+            query += " AND time <= ?"
+            params.append(_format_timestamp(to_time))
+        if after:
+            query += " AND (time, ticket) > (?, ?)"
+            params.extend([_format_timestamp(after[0]), after[1]])
+        query += " ORDER BY time, ticket LIMIT ?"
+        params.append(limit)
         
-        conn.commit()
-        return cursor.rowcount > 0
+        with self.lock:
+            conn = self.conn or self.connect()
+            cursor = conn.cursor()
+            cursor.execute(query, params)
+            return [tuple(row) for row in cursor.fetchall()]
     
-    # Các phương thức CRUD cho CopySettings
-    def save_copy_settings(self, copy_settings):
-        """Lưu hoặc cập nhật cài đặt copy trade"""
-        conn = self.conn or self.connect()
-        cursor = conn.cursor()
+    def get_position_deals_since(self, account_id, after_ticket, from_time):
+        """Lấy toàn bộ deal của các vị thế có deal mới (ticket > after_ticket, từ from_time)
         
-        # Chuyển danh sách symbols sang JSON
-        allowed_symbols_json = json.dumps(copy_settings.allowed_symbols) if copy_settings.allowed_symbols else None
+        Dùng để dựng lại các giao dịch được đóng bởi deal mới, kể cả khi deal mở
+        nằm trước watermark.
+        """
+        query = f'''
+        SELECT {', '.join(self.DEAL_COLUMNS)} FROM deals
+        WHERE account_id = ? AND position_id IN (
+            SELECT DISTINCT position_id FROM deals
+            WHERE account_id = ? AND ticket > ? AND time >= ? AND position_id != 0
+        )
+        ORDER BY time, ticket
+        '''
         
-        # Kiểm tra xem cài đặt đã tồn tại chưa
-        if copy_settings.id:
+        with self.lock:
+            conn = self.conn or self.connect()
+            cursor = conn.cursor()
+            cursor.execute(query, (account_id, account_id, after_ticket, _format_timestamp(from_time)))
+            return [tuple(row) for row in cursor.fetchall()]
+    
+    def get_deal_summary(self, account_id):
+        """Số deal, ticket và thời gian của deal mới nhất trong bảng deals"""
+        with self.lock:
+            conn = self.conn or self.connect()
+            cursor = conn.cursor()
             cursor.execute('''
-            UPDATE copy_settings SET 
-                master_account_id = ?, follower_account_id = ?, volume_percent = ?,
-                copy_sl_tp = ?, min_volume = ?, max_volume = ?,
-                allowed_symbols = ?, is_active = ?
-            WHERE id = ?
+            SELECT COUNT(*) AS deal_count, MAX(ticket) AS last_deal_ticket, MAX(time) AS last_deal_time
+            FROM deals WHERE account_id = ?
+            ''', (account_id,))
+            row = cursor.fetchone()
+            
+        return {
+            'deal_count': row['deal_count'],
+            'last_deal_ticket': row['last_deal_ticket'] or 0,
+            'last_deal_time': _parse_timestamp(row['last_deal_time'])
+        }
+    
+    def get_history_sync_state(self, account_id):
+        """Lấy trạng thái đồng bộ lịch sử của tài khoản"""
+        with self.lock:
+            conn = self.conn or self.connect()
+            cursor = conn.cursor()
+            
+            cursor.execute("SELECT * FROM history_sync_state WHERE account_id = ?", (account_id,))
+            row = cursor.fetchone()
+            
+            if not row:
+                return None
+                
+            return {
+                'account_id': row['account_id'],
+                'synced_from': _parse_timestamp(row['synced_from']),
+                'synced_to': _parse_timestamp(row['synced_to']),
+                'last_deal_time': _parse_timestamp(row['last_deal_time']),
+                'last_deal_ticket': row['last_deal_ticket'] or 0,
+                'deal_count': row['deal_count'] or 0,
+                'synced_at': _parse_timestamp(row['synced_at'])
+            }
+    
+    def save_history_sync_state(self, state):
+        """Lưu trạng thái đồng bộ lịch sử của tài khoản"""
+        with self.lock:
+            conn = self.conn or self.connect()
+            cursor = conn.cursor()
+            
+            cursor.execute('''
+            INSERT INTO history_sync_state (
+                account_id, synced_from, synced_to, last_deal_time,
+                last_deal_ticket, deal_count, synced_at
+            ) VALUES (?, ?, ?, ?, ?, ?, ?)
+            ON CONFLICT (account_id) DO UPDATE SET
+                synced_from = excluded.synced_from,
+                synced_to = excluded.synced_to,
+                last_deal_time = excluded.last_deal_time,
+                last_deal_ticket = excluded.last_deal_ticket,
+                deal_count = excluded.deal_count,
+                synced_at = excluded.synced_at
             ''', (
-                copy_settings.master_account_id, copy_settings.follower_account_id,
-                copy_settings.volume_percent, copy_settings.copy_sl_tp,
-                copy_settings.min_volume, copy_settings.max_volume,
-                allowed_symbols_json, copy_settings.is_active, copy_settings.id
+                state['account_id'], _format_timestamp(state['synced_from']),
+                _format_timestamp(state['synced_to']), _format_timestamp(state['last_deal_time']),
+                state['last_deal_ticket'], state['deal_count'], _format_timestamp(state['synced_at'])
             ))
-        else:
-            # Kiểm tra xem cặp master/follower đã tồn tại chưa
+            conn.commit()
+            return True
+    
+    # Các phương thức cho ảnh chụp vị thế mở
+    POSITION_COLUMNS = ['ticket', 'symbol', 'type', 'volume', 'open_price', 'open_time',
+                        'current_price', 'sl', 'tp', 'profit', 'contract_size']
+    
+    def apply_position_changes(self, account_id, upserts, closed_tickets, captured_at, replace=False):
+        """Ghi các vị thế mở/thay đổi, xóa vị thế đã đóng và dời thời điểm chụp trong một transaction
+        
+        replace: thay toàn bộ danh sách của tài khoản bằng upserts (lần ghi đầu
+        sau khi khởi động, bỏ các vị thế đã đóng trong lúc dừng).
+        """
+        columns = self.POSITION_COLUMNS
+        with self.lock:
+            conn = self.conn or self.connect()
+            cursor = conn.cursor()
+            
+            try:
+                if replace:
+                    cursor.execute("DELETE FROM open_positions WHERE account_id = ?", (account_id,))
+                elif closed_tickets:
+                    cursor.executemany(
+                        "DELETE FROM open_positions WHERE account_id = ? AND ticket = ?",
+                        [(account_id, ticket) for ticket in closed_tickets]
+                    )
+                    
+                cursor.executemany(f'''
+                INSERT OR REPLACE INTO open_positions (account_id, {', '.join(columns)}, updated_at)
+                VALUES ({', '.join('?' * (len(columns) + 2))})
+                ''', [
+                    [account_id] + [_format_timestamp(position.get(c)) for c in columns] + [captured_at]
+                    for position in upserts
+                ])
+                
+                # Chỉ ghi cho tài khoản còn tồn tại (delta đóng vị thế khi xóa tài khoản)
+                cursor.execute('''
+                INSERT INTO position_snapshots (account_id, captured_at)
+                SELECT ?, ? WHERE EXISTS (SELECT 1 FROM accounts WHERE id = ?)
+                ON CONFLICT (account_id) DO UPDATE SET captured_at = excluded.captured_at
+                ''', (account_id, _format_timestamp(captured_at), account_id))
+                
+                conn.commit()
+            except Exception:
+                conn.rollback()
+                raise
+                
+        return True
+    
+    def get_open_positions(self, account_id):
+        """Đọc ảnh chụp vị thế mở của tài khoản, trả về (danh sách vị thế, thời điểm chụp)"""
+        with self.lock:
+            conn = self.conn or self.connect()
+            cursor = conn.cursor()
+            
+            cursor.execute("SELECT captured_at FROM position_snapshots WHERE account_id = ?", (account_id,))
+            row = cursor.fetchone()
+            if not row:
+                return [], None
+                
+            cursor.execute(f'''
+            SELECT {', '.join(self.POSITION_COLUMNS)} FROM open_positions
+            WHERE account_id = ?
+            ORDER BY open_time, ticket
+            ''', (account_id,))
+            
+            return [dict(position) for position in cursor.fetchall()], _parse_timestamp(row['captured_at'])
+    
+    # Các phương thức cho job backfill lịch sử
+    BACKFILL_TIME_FIELDS = ['start_date', 'end_date', 'backfilled_from', 'created_at', 'updated_at', 'finished_at']
+    
+    def create_backfill_job(self, account_id, start_date, end_date, chunks_total):
+        """Tạo job backfill mới ở trạng thái pending, trả về ID của job"""
+        with self.lock:
+            conn = self.conn or self.connect()
+            cursor = conn.cursor()
+            
+            now = datetime.now()
             cursor.execute('''
-            SELECT id FROM copy_settings 
-            WHERE master_account_id = ? AND follower_account_id = ?
-            ''', (copy_settings.master_account_id, copy_settings.follower_account_id))
+            INSERT INTO history_backfill_jobs (
+                account_id, status, start_date, end_date, chunks_total, created_at, updated_at
+            ) VALUES (?, 'pending', ?, ?, ?, ?, ?)
+            ''', (account_id, _format_timestamp(start_date), _format_timestamp(end_date),
+                  chunks_total, now, now))
+            conn.commit()
+            return cursor.lastrowid
+    
+    def _backfill_job_from_row(self, row):
+        job = dict(row)
+        for field in self.BACKFILL_TIME_FIELDS:
+            job[field] = _parse_timestamp(job[field])
+        return job
+    
+    def get_backfill_job(self, job_id):
+        """Lấy job backfill theo ID"""
+        with self.lock:
+            conn = self.conn or self.connect()
+            cursor = conn.cursor()
+            
+            cursor.execute("SELECT * FROM history_backfill_jobs WHERE id = ?", (job_id,))
+            row = cursor.fetchone()
+            
+            return self._backfill_job_from_row(row) if row else None
+    
+    def get_latest_backfill_job(self, account_id):
+        """Lấy job backfill gần nhất của tài khoản"""
+        with self.lock:
+            conn = self.conn or self.connect()
+            cursor = conn.cursor()
+            
+            cursor.execute(
+                "SELECT * FROM history_backfill_jobs WHERE account_id = ? ORDER BY id DESC LIMIT 1",
+                (account_id,)
+            )
+            row = cursor.fetchone()
             
-            existing = cursor.fetchone()
-            if existing:
-                copy_settings.id = existing['id']
-                return self.save_copy_settings(copy_settings)
+            return self._backfill_job_from_row(row) if row else None
+    
+    def get_active_backfill_jobs(self):
+        """Các job backfill chưa xong (pending hoặc đang chạy dở), theo thứ tự tạo"""
+        with self.lock:
+            conn = self.conn or self.connect()
+            cursor = conn.cursor()
             
-            # Thêm cài đặt mới
             cursor.execute('''
-            INSERT INTO copy_settings (
-                master_account_id, follower_account_id, volume_percent,
-                copy_sl_tp, min_volume, max_volume,
-                allowed_symbols, is_active, created_at
-            ) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
-            ''', (
-                copy_settings.master_account_id, copy_settings.follower_account_id,
-                copy_settings.volume_percent, copy_settings.copy_sl_tp,
-                copy_settings.min_volume, copy_settings.max_volume,
-                allowed_symbols_json, copy_settings.is_active, datetime.now()
-            ))
-            copy_settings.id = cursor.lastrowid
+            SELECT * FROM history_backfill_jobs
+            WHERE status IN ('pending', 'running')
+            ORDER BY id
+            ''')
             
-        conn.commit()
-        return copy_settings.id
+            return [self._backfill_job_from_row(row) for row in cursor.fetchall()]
+    
+    def update_backfill_job(self, job_id, **fields):
+        """Cập nhật trạng thái/tiến độ của job backfill"""
+        fields['updated_at'] = datetime.now()
+        columns = list(fields)
+        
+        with self.lock:
+            conn = self.conn or self.connect()
+            cursor = conn.cursor()
+            
+            cursor.execute(
+                f"UPDATE history_backfill_jobs SET {', '.join(f'{c} = ?' for c in columns)} WHERE id = ?",
+                [_format_timestamp(fields[c]) for c in columns] + [job_id]
+            )
+            conn.commit()
+            return cursor.rowcount > 0
+    
+    # Các phương thức cho trạng thái drawdown
+    DRAWDOWN_TIME_FIELDS = ['peak_time', 'trough_time', 'last_time', 'max_drawdown_start', 'max_drawdown_end']
+    
+    def get_drawdown_state(self, account_id):
+        """Lấy trạng thái drawdown đã lưu của tài khoản"""
+        with self.lock:
+            conn = self.conn or self.connect()
+            cursor = conn.cursor()
+            
+            cursor.execute("SELECT * FROM drawdown_state WHERE account_id = ?", (account_id,))
+            row = cursor.fetchone()
+            
+            if not row:
+                return None
+                
+            state = dict(row)
+            state.pop('account_id')
+            for field in self.DRAWDOWN_TIME_FIELDS:
+                state[field] = _parse_timestamp(state[field])
+            return state
+    
+    def save_drawdown_state(self, account_id, state):
+        """Lưu trạng thái drawdown của tài khoản"""
+        fields = ['peak', 'peak_time', 'trough', 'trough_time', 'last_equity', 'last_time',
+                  'current_drawdown', 'current_drawdown_percent', 'max_drawdown',
+                  'max_drawdown_percent', 'max_drawdown_start', 'max_drawdown_end']
+        
+        with self.lock:
+            conn = self.conn or self.connect()
+            cursor = conn.cursor()
+            
+            cursor.execute(f'''
+            INSERT OR REPLACE INTO drawdown_state (account_id, {', '.join(fields)})
+            VALUES ({', '.join('?' * (len(fields) + 1))})
+            ''', [account_id] + [state.get(field) for field in fields])
+            cursor.execute('''
+            UPDATE account_leaderboard SET max_drawdown = ?, max_drawdown_percent = ?
+            WHERE account_id = ? AND (max_drawdown IS NOT ? OR max_drawdown_percent IS NOT ?)
+            ''', (state.get('max_drawdown'), state.get('max_drawdown_percent'), account_id,
+                  state.get('max_drawdown'), state.get('max_drawdown_percent')))
+            conn.commit()
+            return True
+    
+    # Các phương thức cho bảng xếp hạng
+    # Các cột có thể dùng để xếp hạng (mỗi cột có index riêng)
+    LEADERBOARD_METRICS = ['return_percent', 'net_profit', 'profit_factor', 'win_rate',
+                           'max_drawdown_percent', 'total_trades']
+    # Các cột có thể NULL (luôn xếp cuối bảng)
+    LEADERBOARD_NULLABLE_METRICS = ['profit_factor']
+    
+    def _refresh_leaderboard(self, cursor, where, params):
+        """Tính lại dòng xếp hạng từ monthly_account_stats (tối đa vài chục dòng mỗi tài khoản)
+        
+        Lợi nhuận % tính trên số dư ban đầu suy ngược từ số dư hiện tại; profit
+        factor là NULL (không xác định) khi có lãi mà không có lệnh lỗ; drawdown
+        lấy từ drawdown_state.
+        """
+        cursor.execute(f'''
+        INSERT INTO account_leaderboard (
+            account_id, total_trades, winning_trades, losing_trades, profit, loss,
+            net_profit, win_rate, profit_factor, return_percent, max_drawdown,
+            max_drawdown_percent, updated_at
+        )
+        SELECT s.account_id, SUM(s.total_trades), SUM(s.winning_trades), SUM(s.losing_trades),
+            SUM(s.profit), SUM(s.loss), ROUND(SUM(s.profit) + SUM(s.loss), 2),
+            CASE WHEN SUM(s.total_trades) > 0
+                THEN ROUND(SUM(s.winning_trades) * 100.0 / SUM(s.total_trades), 2) ELSE 0 END,
+            CASE WHEN SUM(s.loss) < 0 THEN ROUND(SUM(s.profit) / -SUM(s.loss), 2)
+                WHEN SUM(s.profit) > 0 THEN NULL ELSE 0 END,
+            CASE WHEN a.balance - (SUM(s.profit) + SUM(s.loss)) > 0
+                THEN ROUND((SUM(s.profit) + SUM(s.loss)) * 100.0 / (a.balance - (SUM(s.profit) + SUM(s.loss))), 2)
+                ELSE 0 END,
+            COALESCE(d.max_drawdown, 0), COALESCE(d.max_drawdown_percent, 0), ?
+        FROM monthly_account_stats s
+        JOIN accounts a ON a.id = s.account_id
+        LEFT JOIN drawdown_state d ON d.account_id = s.account_id
+        WHERE {where}
+        GROUP BY s.account_id
+        ON CONFLICT (account_id) DO UPDATE SET
+            total_trades = excluded.total_trades,
+            winning_trades = excluded.winning_trades,
+            losing_trades = excluded.losing_trades,
+            profit = excluded.profit,
+            loss = excluded.loss,
+            net_profit = excluded.net_profit,
+            win_rate = excluded.win_rate,
+            profit_factor = excluded.profit_factor,
+            return_percent = excluded.return_percent,
+            max_drawdown = excluded.max_drawdown,
+            max_drawdown_percent = excluded.max_drawdown_percent,
+            updated_at = excluded.updated_at
+        ''', [datetime.now(), *params])
+    
+    def get_leaderboard(self, metric, descending=True, limit=50, offset=0, masters_only=False):
+        """Đọc một trang bảng xếp hạng theo chỉ số (dùng index của cột), trả về (các dòng, tổng số)
+        
+        Dòng có chỉ số NULL luôn nằm cuối, theo cả hai chiều sắp xếp.
+        """
+        if metric not in self.LEADERBOARD_METRICS:
+            raise ValueError(f"Unsupported leaderboard metric: {metric}")
+            
+        where = ''
+        if masters_only:
+            where = 'WHERE l.account_id IN (SELECT master_account_id FROM copy_settings WHERE is_active = 1)'
+        direction = 'DESC' if descending else 'ASC'
+        # SQLite coi NULL nhỏ nhất: giảm dần đã để NULL cuối, tăng dần cần index riêng
+        order_by = f'l.{metric} {direction}, l.account_id {direction}'
+        if not descending and metric in self.LEADERBOARD_NULLABLE_METRICS:
+            order_by = f'l.{metric} IS NULL, {order_by}'
+        
+        with self.lock:
+            conn = self.conn or self.connect()
+            cursor = conn.cursor()
+            
+            cursor.execute(f'''
+            SELECT l.*, a.login, a.name, a.server, a.user_id, a.group_name, a.balance
+            FROM account_leaderboard l
+            JOIN accounts a ON a.id = l.account_id
+            {where}
+            ORDER BY {order_by}
+            LIMIT ? OFFSET ?
+            ''', (limit, offset))
+            rows = [dict(row) for row in cursor.fetchall()]
+            
+            cursor.execute(f"SELECT COUNT(*) FROM account_leaderboard l {where}")
+            total = cursor.fetchone()[0]
+            
+            return rows, total
+    
+    # Các phương thức cho trạng thái service
+    def get_state(self, key, default=None):
+        """Lấy giá trị trạng thái theo key"""
+        with self.lock:
+            conn = self.conn or self.connect()
+            cursor = conn.cursor()
+            
+            cursor.execute("SELECT value FROM service_state WHERE key = ?", (key,))
+            row = cursor.fetchone()
+            
+            return row['value'] if row else default
+    
+    def set_state(self, key, value):
+        """Lưu giá trị trạng thái theo key"""
+        with self.lock:
+            conn = self.conn or self.connect()
+            cursor = conn.cursor()
+            
+            cursor.execute('''
+            INSERT INTO service_state (key, value, updated_at) VALUES (?, ?, ?)
+            ON CONFLICT (key) DO UPDATE SET
+                value = excluded.value,
+                updated_at = excluded.updated_at
+            ''', (key, value, datetime.now()))
+            conn.commit()
+            return True
     
     # Các phương thức tương tự cho trade và user cũng sẽ được triển khai tương tự
-    # ...
\ No newline at end of file
+    # ...
+
+def _parse_timestamp(value):
+    """Chuyển timestamp lưu trong SQLite (chuỗi ISO) thành datetime"""
+    if not value or isinstance(value, datetime):
+        return value
+    try:
+        return datetime.fromisoformat(value)
+    except ValueError:
+        return None
+
+def _format_timestamp(value):
+    """Định dạng datetime thống nhất để so sánh chuỗi trong SQLite"""
+    if not isinstance(value, datetime):
+        return value
+    return value.strftime('%Y-%m-%d %H:%M:%S')
@@ -39,8 +39,12 @@ def get_account(account_id):
 
 @account_routes.route('/accounts', methods=['POST'])
 def create_account():
-    """Tạo tài khoản mới"""
-    from app import db, mt5_service
+    """Tạo tài khoản mới
+    
+    Lịch sử giao dịch được nhập nền theo từng tháng, response trả về ngay kèm
+    ID của job backfill (xem GET /accounts/backfill/<job_id>).
+    """
+    from app import db, mt5_service, account_monitor_service, history_backfill
     
     data = request.json
     if not data:
@@ -63,7 +67,9 @@ def create_account():
         login=data['login'],
         password=data['password'],
         server=data['server'],
-        name=data.get('name')
+        name=data.get('name'),
+        user_id=data.get('user_id'),
+        group_name=data.get('group_name')
     )
     
     # Kiểm tra kết nối
@@ -75,17 +81,79 @@ def create_account():
     
     # Lưu vào database
     account_id = db.save_account(account)
+    account_monitor_service.dashboard.update(account)
+    
+    backfill_job_id = history_backfill.submit(account_id)
     
     return jsonify({
         'success': True,
         'message': 'Account created successfully',
-        'account_id': account_id
+        'account_id': account_id,
+        'backfill_job_id': backfill_job_id
+    })
+
+@account_routes.route('/accounts/backfill/<int:job_id>', methods=['GET'])
+def get_backfill_job(job_id):
+    """Lấy trạng thái và tiến độ của job nhập lịch sử"""
+    from app import history_backfill
+    
+    job = history_backfill.get_job(job_id)
+    if not job:
+        return jsonify({
+            'success': False,
+            'message': f'Backfill job with ID {job_id} not found'
+        }), 404
+    
+    return jsonify({
+        'success': True,
+        'job': job
+    })
+
+@account_routes.route('/accounts/<int:account_id>/backfill', methods=['GET', 'POST'])
+def account_backfill(account_id):
+    """GET: job nhập lịch sử gần nhất của tài khoản; POST: nhập lại lịch sử (tùy chọn {"days": N})"""
+    from app import db, history_backfill
+    
+    if not db.get_account(account_id):
+        return jsonify({
+            'success': False,
+            'message': f'Account with ID {account_id} not found'
+        }), 404
+    
+    if request.method == 'POST':
+        days = (request.json or {}).get('days') if request.is_json else None
+        if days is not None:
+            try:
+                days = int(days)
+            except (TypeError, ValueError):
+                days = 0
+            if days <= 0:
+                return jsonify({
+                    'success': False,
+                    'message': 'days must be a positive integer'
+                }), 400
+        job_id = history_backfill.submit(account_id, days)
+        return jsonify({
+            'success': True,
+            'job': history_backfill.get_job(job_id)
+        }), 202
+    
+    job = history_backfill.get_account_job(account_id)
+    if not job:
+        return jsonify({
+            'success': False,
+            'message': f'No backfill job for account {account_id}'
+        }), 404
+    
+    return jsonify({
+        'success': True,
+        'job': job
     })
 
 @account_routes.route('/accounts/<int:account_id>', methods=['PUT'])
 def update_account(account_id):
     """Cập nhật thông tin tài khoản"""
-    from app import db, mt5_service
+    from app import db, mt5_service, account_monitor_service
     
     data = request.json
     if not data:
@@ -109,6 +177,10 @@ def update_account(account_id):
         account.password = data['password']
     if 'server' in data:
         account.server = data['server']
+    if 'user_id' in data:
+        account.user_id = data['user_id']
+    if 'group_name' in data:
+        account.group_name = data['group_name']
     
     # Cập nhật kết nối nếu thông tin đăng nhập thay đổi
     if 'password' in data or 'server' in data:
@@ -120,6 +192,7 @@ def update_account(account_id):
     
     # Lưu vào database
     db.save_account(account)
+    account_monitor_service.dashboard.update(account)
     
     return jsonify({
         'success': True,
@@ -129,7 +202,9 @@ def update_account(account_id):
 @account_routes.route('/accounts/<int:account_id>', methods=['DELETE'])
 def delete_account(account_id):
     """Xóa tài khoản"""
-    from app import db, mt5_service
+    from app import (db, mt5_service, account_monitor_service, copy_trade_service, event_bus,
+                     drawdown_tracker, history_archive, history_backfill, exposure_aggregator,
+                     position_store)
     
     # Lấy tài khoản
     account = db.get_account(account_id)
@@ -143,8 +218,20 @@ def delete_account(account_id):
     if account.is_connected:
         mt5_service.disconnect_account(account_id)
     
+    # Dừng job nhập lịch sử còn dở
+    history_backfill.cancel(account_id)
+    
     # Xóa khỏi database
     if db.delete_account(account_id):
+        account_monitor_service.dashboard.remove(account_id)
+        # Bỏ thời gian xử lý của tài khoản khỏi thống kê vòng lặp (slowest_items)
+        account_monitor_service.ticker.metrics.forget_item(account_id)
+        copy_trade_service.ticker.metrics.forget_item(account_id)
+        event_bus.forget_account(account_id)
+        exposure_aggregator.forget_account(account_id)
+        position_store.forget_account(account_id)
+        drawdown_tracker.remove(account_id)
+        history_archive.remove(account_id)
         return jsonify({
             'success': True,
             'message': 'Account deleted successfully'
@@ -186,7 +273,7 @@ def connect_account(account_id):
 @account_routes.route('/accounts/<int:account_id>/disconnect', methods=['POST'])
 def disconnect_account(account_id):
     """Ngắt kết nối tài khoản MT5"""
-    from app import db, mt5_service
+    from app import db, mt5_service, account_monitor_service
     
     # Ngắt kết nối tài khoản
     if mt5_service.disconnect_account(account_id):
@@ -195,6 +282,7 @@ def disconnect_account(account_id):
         if account:
             account.is_connected = False
             db.save_account(account)
+            account_monitor_service.dashboard.update(account)
             
         return jsonify({
             'success': True,
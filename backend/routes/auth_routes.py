@@ -22,6 +22,10 @@ def token_required(f):
             if auth_header.startswith('Bearer '):
                 token = auth_header.split(' ')[1]
         
+        # EventSource của trình duyệt không gửi được header: route cho phép thì lấy từ ?token=
+        if not token and getattr(f, 'query_token_allowed', False):
+            token = request.args.get('token')
+        
         if not token:
             return jsonify({
                 'success': False,
@@ -53,6 +57,11 @@ def token_required(f):
     
     return decorated
 
+def query_token_allowed(f):
+    """Cho phép route nhận token qua ?token= (đặt dưới token_required, dùng cho stream SSE)"""
+    f.query_token_allowed = True
+    return f
+
 @auth_routes.route('/login', methods=['POST'])
 def login():
     """Đăng nhập và lấy token"""
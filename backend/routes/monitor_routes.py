@@ -1,7 +1,8 @@
 # ✅ ĐÃ HOÀN THÀNH
 
-from flask import Blueprint, request, jsonify
-from auth_routes import token_required
+from flask import Blueprint, request, jsonify, Response, stream_with_context
+from auth_routes import token_required, query_token_allowed
+import json
 
 monitor_routes = Blueprint('monitor_routes', __name__)
 
@@ -11,7 +12,15 @@ def get_dashboard_data(current_user):
     """Lấy dữ liệu tổng quan cho dashboard"""
     from app import account_monitor_service
     
-    data = account_monitor_service.get_dashboard_data()
+    # Lọc theo người dùng / nhóm tài khoản hoặc chỉ lấy tổng số
+    user_id = request.args.get('user_id', type=int)
+    group_name = request.args.get('group')
+    summary_only = request.args.get('summary') == '1'
+    
+    if user_id is not None or group_name or summary_only:
+        data = account_monitor_service.get_dashboard_totals(user_id=user_id, group_name=group_name)
+    else:
+        data = account_monitor_service.get_dashboard_data()
     return jsonify({
         'success': True,
         'data': data
@@ -20,8 +29,13 @@ def get_dashboard_data(current_user):
 @monitor_routes.route('/monitor/accounts/<int:account_id>/trades', methods=['GET'])
 @token_required
 def get_account_trades(current_user, account_id):
-    """Lấy danh sách giao dịch của tài khoản"""
-    from app import db, mt5_service
+    """Lấy danh sách vị thế mở của tài khoản
+    
+    Mặc định đọc ảnh chụp do monitor/copy engine ghi (kèm captured_at và age),
+    ?live=1 lấy trực tiếp từ MT5 (và cập nhật ảnh chụp). Nếu không lấy được từ
+    MT5 thì trả về ảnh chụp đã lưu, hoặc lỗi nếu chưa có ảnh chụp.
+    """
+    from app import db, mt5_service, event_bus, position_store
     
     # Lấy tài khoản
     account = db.get_account(account_id)
@@ -31,11 +45,37 @@ def get_account_trades(current_user, account_id):
             'message': f'Account with ID {account_id} not found'
         }), 404
     
-    # Lấy các vị thế mở
+    snapshot = None
+    if request.args.get('live') != '1':
+        snapshot = position_store.get(account_id)
+        # Chưa có ảnh chụp nào (tài khoản mới, monitor chưa chạy): lấy trực tiếp
+        if snapshot['captured_at'] is not None:
+            return jsonify({
+                'success': True,
+                'source': 'snapshot',
+                **snapshot
+            })
+    
+    # Lấy các vị thế mở từ MT5
     positions = mt5_service.get_open_positions(account_id, account)
+    if positions is None:
+        # Không phát/lưu danh sách rỗng khi lấy lỗi
+        snapshot = snapshot or position_store.get(account_id)
+        if snapshot['captured_at'] is not None:
+            return jsonify({
+                'success': True,
+                'source': 'snapshot',
+                **snapshot
+            })
+        return jsonify({
+            'success': False,
+            'message': f'Failed to get open positions for account {account.login}'
+        }), 500
+    event_bus.publish_positions(account_id, positions)
     
     return jsonify({
         'success': True,
+        'source': 'live',
         'positions': positions
     })
 
@@ -65,33 +105,61 @@ def get_account_performance(current_user, account_id):
     
     # Lấy các tham số từ query string
     time_range = request.args.get('range', 'monthly')
+    downsample, error = _downsample_args()
+    if error:
+        return error
     
+    # Đọc theo khoảng từ bảng thống kê ngày/tháng đã tổng hợp sẵn
     if time_range == 'daily':
         days = int(request.args.get('days', 30))
-        performance = performance_service.calculate_daily_performance(account_id, days)
-        if performance is None:
-            return jsonify({
-                'success': False,
-                'message': f'Account with ID {account_id} not found'
-            }), 404
-            
-        # Chuyển DataFrame thành list
-        performance_data = performance.to_dict('records') if not performance.empty else []
+        params = {'range': 'daily', 'days': days}
+        compute = lambda: performance_service.get_daily_performance(account_id, days)
     else:  # monthly
         months = int(request.args.get('months', 12))
-        performance = performance_service.calculate_monthly_performance(account_id, months)
-        if performance is None:
-            return jsonify({
-                'success': False,
-                'message': f'Account with ID {account_id} not found'
-            }), 404
-            
-        # Chuyển DataFrame thành list
-        performance_data = performance.to_dict('records') if not performance.empty else []
+        days = 30 * months
+        params = {'range': 'monthly', 'months': months}
+        compute = lambda: performance_service.get_monthly_performance(account_id, months)
+    params.update(downsample)
+        
+    key = performance_service.get_result_key('performance', [account_id], params, days)
+    if key is None:
+        return jsonify({
+            'success': False,
+            'message': f'Account with ID {account_id} not found'
+        }), 404
+    
+    return _cached_response(key, compute, lambda performance_data: {
+        'success': True,
+        'performance': _downsample_series(performance_data, 'cumulative_profit', downsample)
+    })
+
+@monitor_routes.route('/monitor/accounts/<int:account_id>/drawdown', methods=['GET'])
+@token_required
+def get_account_drawdown(current_user, account_id):
+    """Lấy trạng thái drawdown theo equity của tài khoản
+    
+    Tài khoản chưa có mẫu equity (và chưa có giao dịch đóng) trả về drawdown null.
+    """
+    from app import db, performance_service
+    
+    account = db.get_account(account_id)
+    if not account:
+        return jsonify({
+            'success': False,
+            'message': f'Account with ID {account_id} not found'
+        }), 404
+    
+    drawdown = performance_service.get_drawdown(account_id, account)
+    if not drawdown:
+        return jsonify({
+            'success': True,
+            'drawdown': None,
+            'message': 'No equity samples yet'
+        })
     
     return jsonify({
         'success': True,
-        'performance': performance_data
+        'drawdown': drawdown
     })
 
 @monitor_routes.route('/monitor/accounts/<int:account_id>/report', methods=['GET'])
@@ -100,8 +168,60 @@ def get_account_report(current_user, account_id):
     """Lấy báo cáo hiệu suất đầy đủ"""
     from app import performance_service
     
-    report = performance_service.generate_performance_report(account_id)
-    if not report:
+    from services.round_trips import BREAKDOWN_DIMENSIONS
+    
+    # Thống kê thêm theo chiều: ?breakdown=symbol,side,weekday,hour,session
+    breakdowns = [b for b in request.args.get('breakdown', '').split(',') if b]
+    invalid = [b for b in breakdowns if b not in BREAKDOWN_DIMENSIONS]
+    if invalid:
+        return jsonify({
+            'success': False,
+            'message': f"Unsupported breakdown: {', '.join(invalid)}"
+        }), 400
+    
+    # Báo cáo chứa số dư/equity hiện tại nên phiên bản gồm cả lần cập nhật cuối của tài khoản
+    key = performance_service.get_result_key(
+        'report', [account_id], {'breakdown': ','.join(breakdowns)}, live=True
+    )
+    if key is None:
+        return jsonify({
+            'success': False,
+            'message': f'Account with ID {account_id} not found'
+        }), 404
+    
+    return _cached_response(
+        key,
+        lambda: performance_service.generate_performance_report(account_id, breakdowns),
+        lambda report: {
+            'success': True,
+            'report': report
+        }
+    )
+
+@monitor_routes.route('/monitor/accounts/<int:account_id>/monte-carlo', methods=['GET'])
+@token_required
+def simulate_risk_of_ruin(current_user, account_id):
+    """Mô phỏng Monte Carlo rủi ro cháy tài khoản và thời gian đạt mục tiêu"""
+    from app import performance_service
+    
+    seed = request.args.get('seed', type=int)
+    simulations = request.args.get('simulations', 5000, type=int)
+    trades = request.args.get('trades', type=int)
+    if simulations <= 0 or (trades is not None and trades <= 0):
+        return jsonify({
+            'success': False,
+            'message': 'simulations and trades must be positive'
+        }), 400
+    
+    simulation = performance_service.simulate_risk_of_ruin(
+        account_id,
+        simulations=simulations,
+        trades=trades,
+        ruin_percent=request.args.get('ruin', 50, type=float),
+        target_percent=request.args.get('target', 20, type=float),
+        seed=seed
+    )
+    if simulation is None:
         return jsonify({
             'success': False,
             'message': f'Account with ID {account_id} not found'
@@ -109,7 +229,124 @@ def get_account_report(current_user, account_id):
     
     return jsonify({
         'success': True,
-        'report': report
+        'simulation': simulation
+    })
+
+@monitor_routes.route('/monitor/accounts/<int:account_id>/copy-simulation', methods=['POST'])
+@token_required
+def simulate_copy_settings(current_user, account_id):
+    """Mô phỏng kết quả của follower với các cài đặt copy trên lịch sử của master
+    
+    Body: {"settings": {...} hoặc [{...}, ...]} hoặc {"grid": {"volume_percent": [...],
+    "min_volume": [...], "max_volume": [...], "allowed_symbols": [[...], ...]}},
+    tùy chọn "follower_account_id", "balance", "days".
+    """
+    from app import db, performance_service
+    from models.copy_settings import CopySettings
+    import itertools
+    import math
+    
+    data = request.json or {}
+    follower_account_id = data.get('follower_account_id')
+    downsample, error = _downsample_args()
+    if error:
+        return error
+    
+    # Danh sách bộ cài đặt cần mô phỏng
+    if 'grid' in data:
+        grid = data['grid']
+        if not isinstance(grid, dict):
+            return jsonify({
+                'success': False,
+                'message': 'grid must be an object of value lists'
+            }), 400
+        fields = ['volume_percent', 'min_volume', 'max_volume', 'allowed_symbols']
+        defaults = CopySettings(account_id, follower_account_id)
+        values = [grid.get(field) or [getattr(defaults, field)] for field in fields]
+        for field, options in zip(fields, values):
+            if not isinstance(options, list):
+                return jsonify({
+                    'success': False,
+                    'message': f'grid.{field} must be a list'
+                }), 400
+        # Kiểm tra số tổ hợp trước khi sinh tích Descartes
+        combinations = math.prod(len(options) for options in values)
+    else:
+        settings_list = data.get('settings') or {}
+        if isinstance(settings_list, dict):
+            settings_list = [settings_list]
+        if not isinstance(settings_list, list) or not all(isinstance(item, dict) for item in settings_list):
+            return jsonify({
+                'success': False,
+                'message': 'settings must be an object or a list of objects'
+            }), 400
+        combinations = len(settings_list)
+            
+    if combinations > performance_service.COPY_SIMULATION_MAX_GRID:
+        return jsonify({
+            'success': False,
+            'message': f'Too many settings combinations (max {performance_service.COPY_SIMULATION_MAX_GRID})'
+        }), 400
+    if 'grid' in data:
+        settings_list = [dict(zip(fields, combination)) for combination in itertools.product(*values)]
+    
+    # Điền giá trị mặc định và kiểm tra như khi tạo CopySettings
+    settings_grid = []
+    for values in settings_list:
+        # Follower chưa chọn: dùng giá trị tạm để chỉ kiểm tra các tham số khối lượng
+        settings = CopySettings(account_id, follower_account_id or -1)
+        try:
+            for field in ('volume_percent', 'min_volume', 'max_volume'):
+                if values.get(field) is not None:
+                    setattr(settings, field, float(values[field]))
+        except (TypeError, ValueError):
+            return jsonify({
+                'success': False,
+                'message': 'volume_percent, min_volume and max_volume must be numbers'
+            }), 400
+        allowed_symbols = values.get('allowed_symbols')
+        if allowed_symbols is not None:
+            if not isinstance(allowed_symbols, list):
+                return jsonify({
+                    'success': False,
+                    'message': 'allowed_symbols must be a list'
+                }), 400
+            settings.allowed_symbols = allowed_symbols
+        is_valid, message = settings.validate()
+        if not is_valid:
+            return jsonify({
+                'success': False,
+                'message': message
+            }), 400
+        settings_grid.append({
+            'volume_percent': settings.volume_percent,
+            'min_volume': settings.min_volume,
+            'max_volume': settings.max_volume,
+            'allowed_symbols': settings.allowed_symbols
+        })
+    
+    # Số dư ban đầu: theo yêu cầu, theo follower hoặc theo master
+    balance = data.get('balance')
+    if balance is None and follower_account_id:
+        follower = db.get_account(follower_account_id)
+        balance = follower.balance if follower else None
+    
+    simulation = performance_service.simulate_copy_settings(
+        account_id, settings_grid, days=int(data.get('days', 365)), balance=balance
+    )
+    if simulation is None:
+        return jsonify({
+            'success': False,
+            'message': f'Account with ID {account_id} not found'
+        }), 404
+    
+    for result in simulation['results']:
+        if 'equity_curve' in result:
+            result['equity_curve'] = _downsample_series(result['equity_curve'], 'equity', downsample)
+    
+    return jsonify({
+        'success': True,
+        'simulation': simulation
     })
 
 @monitor_routes.route('/monitor/compare', methods=['GET'])
@@ -129,8 +366,396 @@ def compare_accounts(current_user):
     # Chuyển đổi thành list các ID
     account_ids = [int(id) for id in account_ids.split(',')]
     
-    comparison = performance_service.compare_accounts(account_ids)
+    # Trả về từng tài khoản ngay khi tính xong (NDJSON)
+    if request.args.get('stream') == '1':
+        def generate():
+            for result in performance_service.iter_compare_accounts(account_ids):
+                yield json.dumps(result, default=str) + '\n'
+                
+        return Response(stream_with_context(generate()), mimetype='application/x-ndjson')
+    
+    key = performance_service.get_result_key('compare', account_ids, live=True)
+    if key is None:
+        return jsonify({
+            'success': True,
+            'comparison': []
+        })
+    
+    return _cached_response(
+        key,
+        lambda: performance_service.compare_accounts(account_ids),
+        lambda comparison: {
+            'success': True,
+            'comparison': comparison
+        }
+    )
+
+@monitor_routes.route('/monitor/portfolio', methods=['GET'])
+@token_required
+def get_portfolio_performance(current_user):
+    """Hiệu suất gộp của nhiều tài khoản, có thể nhóm theo người dùng, server hoặc nhóm tài khoản"""
+    from app import performance_service
+    
+    # ?group_by=user|server|group, lọc bằng ?user=&server=&group= hoặc ?accounts=1,2
+    account_ids = request.args.get('accounts', '')
+    account_ids = [int(id) for id in account_ids.split(',')] if account_ids else None
+    group_by = request.args.get('group_by')
+    filters = {name: request.args.get(name) for name in ('user', 'server', 'group')}
+    days = int(request.args.get('days', 365))
+    include_series = request.args.get('series', '1') != '0'
+    downsample, error = _downsample_args()
+    if error:
+        return error
+    
+    try:
+        portfolio = performance_service.get_portfolio_performance(
+            account_ids, group_by, filters, days, include_series
+        )
+    except ValueError as e:
+        return jsonify({
+            'success': False,
+            'message': str(e)
+        }), 400
+    
+    for result in portfolio:
+        if 'daily' in result:
+            result['daily'] = _downsample_series(result['daily'], 'equity', downsample)
+    
+    return jsonify({
+        'success': True,
+        'portfolio': portfolio
+    })
+
+@monitor_routes.route('/monitor/leaderboard', methods=['GET'])
+@token_required
+def get_leaderboard(current_user):
+    """Bảng xếp hạng tài khoản (mặc định các master) theo một chỉ số, phân trang"""
+    from app import performance_service
+    
+    # ?metric=return_percent|net_profit|profit_factor|win_rate|max_drawdown_percent|total_trades
+    metric = request.args.get('metric', 'return_percent')
+    order = request.args.get('order')
+    page = request.args.get('page', 1, type=int)
+    page_size = min(max(request.args.get('page_size', 50, type=int), 1), 500)
+    masters_only = request.args.get('all') != '1'
+    
+    if order not in (None, 'asc', 'desc'):
+        return jsonify({
+            'success': False,
+            'message': f'Unsupported order: {order}'
+        }), 400
+    
+    try:
+        leaderboard = performance_service.get_leaderboard(
+            metric, page, page_size, masters_only,
+            descending=None if order is None else order == 'desc'
+        )
+    except ValueError as e:
+        return jsonify({
+            'success': False,
+            'message': str(e)
+        }), 400
+    
+    return jsonify({
+        'success': True,
+        'leaderboard': leaderboard
+    })
+
+@monitor_routes.route('/monitor/exposure', methods=['GET'])
+@token_required
+def get_exposure(current_user):
+    """Vị thế ròng (lot, notional, lãi/lỗ thả nổi) theo symbol trên mọi tài khoản hoặc của ?user_id="""
+    from app import exposure_aggregator
+    
+    user_id = request.args.get('user_id', type=int)
+    return jsonify({
+        'success': True,
+        'exposure': exposure_aggregator.get_exposure(user_id)
+    })
+
+@monitor_routes.route('/monitor/exposure/<symbol>', methods=['GET'])
+@token_required
+def get_symbol_exposure(current_user, symbol):
+    """Chi tiết vị thế của một symbol theo tài khoản (?by=account) hoặc người dùng (?by=user)"""
+    from app import exposure_aggregator
+    
+    try:
+        exposure = exposure_aggregator.get_symbol_exposure(symbol, request.args.get('by', 'account'))
+    except ValueError as e:
+        return jsonify({
+            'success': False,
+            'message': str(e)
+        }), 400
+    
+    if exposure is None:
+        return jsonify({
+            'success': False,
+            'message': f'No open positions for symbol {symbol}'
+        }), 404
+    
     return jsonify({
         'success': True,
-        'comparison': comparison
-    })
\ No newline at end of file
+        'exposure': exposure
+    })
+
+@monitor_routes.route('/monitor/correlation', methods=['GET'])
+@token_required
+def get_correlation_matrix(current_user):
+    """Ma trận tương quan lợi nhuận ngày giữa các tài khoản (mặc định tất cả tài khoản)"""
+    from app import performance_service
+    
+    account_ids = request.args.get('accounts', '')
+    account_ids = [int(id) for id in account_ids.split(',')] if account_ids else None
+    days = int(request.args.get('days', 90))
+    
+    correlation = performance_service.get_correlation_matrix(account_ids, days)
+    if correlation is None:
+        return jsonify({
+            'success': False,
+            'message': 'No accounts found'
+        }), 404
+    
+    return jsonify({
+        'success': True,
+        'correlation': correlation
+    })
+
+@monitor_routes.route('/monitor/export', methods=['GET'])
+@token_required
+def export_history(current_user):
+    """Xuất lịch sử cục bộ của các tài khoản (stream CSV hoặc Parquet)
+    
+    ?accounts=1,2&kind=deals|round_trips|daily|monthly&format=csv|parquet&from=YYYY-MM-DD&to=YYYY-MM-DD
+    """
+    from app import db, export_service
+    from datetime import datetime
+    
+    kind = request.args.get('kind', 'deals')
+    fmt = request.args.get('format', 'csv')
+    is_valid, message = export_service.validate(kind, fmt)
+    if not is_valid:
+        return jsonify({
+            'success': False,
+            'message': message
+        }), 400
+    
+    account_ids = request.args.get('accounts', '')
+    if account_ids:
+        account_ids = [int(id) for id in account_ids.split(',')]
+    else:
+        account_ids = [account.account_id for account in db.get_all_accounts()]
+    
+    try:
+        start_date = datetime.strptime(request.args['from'], '%Y-%m-%d') if request.args.get('from') else None
+        end_date = datetime.strptime(request.args['to'], '%Y-%m-%d') if request.args.get('to') else None
+    except ValueError:
+        return jsonify({
+            'success': False,
+            'message': 'Dates must use the YYYY-MM-DD format'
+        }), 400
+    if end_date:
+        # Bao gồm cả ngày cuối
+        end_date = end_date.replace(hour=23, minute=59, second=59)
+    
+    mimetype = 'text/csv' if fmt == 'csv' else 'application/vnd.apache.parquet'
+    return Response(
+        stream_with_context(export_service.stream(kind, account_ids, fmt, start_date, end_date)),
+        mimetype=mimetype,
+        headers={'Content-Disposition': f'attachment; filename={kind}.{fmt}'}
+    )
+
+@monitor_routes.route('/monitor/bars/<symbol>', methods=['GET'])
+@token_required
+def get_bars(current_user, symbol):
+    """Nến OHLC của symbol cho biểu đồ (qua cache nến trên đĩa)
+    
+    ?timeframe=M1|M5|M15|M30|H1|H4|D1|W1&from=&to= (ISO, ví dụ 2024-05-01 hoặc
+    2024-05-01T08:00), &account_id= để kèm các deal của tài khoản trên symbol này.
+    Thời gian trả về là epoch giây. from bị giới hạn còn tối đa max_bars nến
+    trước to.
+    """
+    from app import db, bar_cache, mt5_service
+    from datetime import datetime, timedelta
+    import config
+    
+    timeframe = request.args.get('timeframe', 'H1')
+    if timeframe not in mt5_service.TIMEFRAMES:
+        return jsonify({
+            'success': False,
+            'message': f'Unsupported timeframe: {timeframe}'
+        }), 400
+    
+    account_id = request.args.get('account_id', type=int)
+    if account_id and not db.get_account(account_id):
+        return jsonify({
+            'success': False,
+            'message': f'Account with ID {account_id} not found'
+        }), 404
+    
+    try:
+        end_date = datetime.fromisoformat(request.args['to']) if request.args.get('to') else datetime.now()
+        start_date = (
+            datetime.fromisoformat(request.args['from']) if request.args.get('from')
+            else end_date - timedelta(days=config.BAR_CACHE_CONFIG['default_days'])
+        )
+    except ValueError:
+        return jsonify({
+            'success': False,
+            'message': 'Dates must use the ISO format (YYYY-MM-DD[THH:MM])'
+        }), 400
+    
+    # Giới hạn khoảng trước khi lấy nến (không tải/đọc cả năm M1 rồi mới cắt), giữ các nến mới nhất
+    max_bars = config.BAR_CACHE_CONFIG['max_bars']
+    earliest = end_date - timedelta(seconds=max_bars * mt5_service.TIMEFRAMES[timeframe][1])
+    truncated = start_date < earliest
+    start_date = max(start_date, earliest)
+    
+    bars = bar_cache.get_bars(symbol, timeframe, int(start_date.timestamp()), int(end_date.timestamp()))
+    truncated = truncated or len(bars) > max_bars
+    bars = bars[-max_bars:]
+    
+    result = {
+        'success': True,
+        'symbol': symbol,
+        'timeframe': timeframe,
+        'truncated': truncated,
+        'bars': [dict(zip(bars.dtype.names, bar)) for bar in bars.tolist()]
+    }
+    
+    # Deal của tài khoản để vẽ điểm vào/ra lệnh lên biểu đồ
+    if account_id:
+        columns = db.DEAL_COLUMNS
+        result['deals'] = [
+            {
+                'ticket': deal['ticket'],
+                'position_id': deal['position_id'],
+                'time': int(datetime.strptime(deal['time'], '%Y-%m-%d %H:%M:%S').timestamp()),
+                'type': deal['type'],
+                'entry': deal['entry'],
+                'volume': deal['volume'],
+                'price': deal['price'],
+                'profit': deal['profit']
+            }
+            for deal in (
+                dict(zip(columns, row)) for row in db.get_deals(account_id, start_date, end_date, symbol=symbol)
+            )
+        ]
+    
+    return jsonify(result)
+
+def _cached_response(key, compute, build):
+    """Trả kết quả từ cache kèm ETag; 304 nếu client đã có bản mới nhất (If-None-Match)"""
+    from app import performance_service
+    
+    etag = performance_service.result_cache.etag(key)
+    if request.if_none_match.contains(etag):
+        response = Response(status=304)
+    else:
+        response = jsonify(build(performance_service.get_cached_result(key, compute)))
+    
+    response.set_etag(etag)
+    # Trình duyệt luôn hỏi lại server, server trả 304 nếu dữ liệu chưa đổi
+    response.headers['Cache-Control'] = 'private, no-cache'
+    return response
+
+def _downsample_args():
+    """Đọc ?points=N&downsample=lttb|minmax, trả về (tham số, response lỗi hoặc None)"""
+    from utils.downsample import METHODS
+    
+    points = request.args.get('points', type=int)
+    method = request.args.get('downsample', 'lttb')
+    if method not in METHODS:
+        return None, (jsonify({
+            'success': False,
+            'message': f'Unsupported downsample method: {method}'
+        }), 400)
+    if points is not None and points < 3:
+        return None, (jsonify({
+            'success': False,
+            'message': 'points must be at least 3'
+        }), 400)
+    return ({'points': points, 'downsample': method} if points else {}), None
+
+def _downsample_series(records, y_key, downsample):
+    """Rút gọn chuỗi thời gian còn khoảng points điểm, giữ hình dạng theo trường y_key"""
+    from utils.downsample import downsample_records
+    
+    if not downsample or not isinstance(records, list):
+        return records
+    return downsample_records(records, y_key, downsample['points'], downsample['downsample'])
+
+@monitor_routes.route('/monitor/metrics', methods=['GET'])
+@token_required
+def get_loop_metrics(current_user):
+    """Lấy số liệu thời gian của vòng lặp giám sát, copy trade, các job chạy nền và các cache"""
+    from app import account_monitor_service, copy_trade_service, job_runner, performance_service, bar_cache
+    
+    return jsonify({
+        'success': True,
+        'metrics': {
+            'monitor': account_monitor_service.get_loop_metrics(),
+            'copy_trade': copy_trade_service.get_loop_metrics(),
+            'jobs': job_runner.get_status(),
+            'result_cache': performance_service.result_cache.get_stats(),
+            'bar_cache': bar_cache.get_stats()
+        }
+    })
+
+@monitor_routes.route('/monitor/stream', methods=['GET'])
+@token_required
+@query_token_allowed
+def stream_updates(current_user):
+    """Stream thay đổi tài khoản và vị thế (Server-Sent Events)
+    
+    EventSource không gửi được header Authorization nên token có thể truyền qua ?token=.
+    """
+    from app import event_bus
+    import config
+    
+    # Bộ lọc của client: ?accounts=1,2&types=account,position
+    account_ids = request.args.get('accounts', '')
+    try:
+        account_ids = [int(id) for id in account_ids.split(',')] if account_ids else None
+    except ValueError:
+        return jsonify({
+            'success': False,
+            'message': 'accounts must be a comma-separated list of account IDs'
+        }), 400
+    event_types = request.args.get('types', '')
+    event_types = [t for t in event_types.split(',') if t] if event_types else None
+    heartbeat = config.STREAM_CONFIG.get('heartbeat', 15)
+    
+    def generate():
+        # Đăng ký khi bắt đầu gửi: response không bao giờ được đọc thì không để lại đăng ký
+        subscription = event_bus.subscribe(account_ids=account_ids, event_types=event_types)
+        try:
+            # Gửi trạng thái hiện tại trước, sau đó chỉ gửi delta
+            yield _format_sse('snapshot', event_bus.get_snapshot(account_ids, event_types))
+            while True:
+                event = subscription.get(timeout=heartbeat)
+                if subscription.take_lagged():
+                    # Client đọc chậm, các delta cũ đã bị bỏ -> gửi lại snapshot
+                    yield _format_sse('snapshot', event_bus.get_snapshot(account_ids, event_types))
+                if event is None:
+                    yield ': keep-alive\n\n'
+                    continue
+                yield _format_sse(event['type'], event, event['id'])
+        finally:
+            event_bus.unsubscribe(subscription)
+    
+    return Response(
+        stream_with_context(generate()),
+        mimetype='text/event-stream',
+        headers={
+            'Cache-Control': 'no-cache',
+            'X-Accel-Buffering': 'no'
+        }
+    )
+
+def _format_sse(event_type, data, event_id=None):
+    """Định dạng một sự kiện theo chuẩn Server-Sent Events"""
+    message = f'event: {event_type}\n'
+    if event_id is not None:
+        message += f'id: {event_id}\n'
+    message += f'data: {json.dumps(data, default=str)}\n\n'
+    return message
@@ -4,23 +4,43 @@ import time
 import logging
 from datetime import datetime, timedelta
 from models.account import Account
+from services.dashboard_aggregate import DashboardAggregate
+from utils.ticker import DeadlineTicker
+from services.history_store import HistoryStore
+from services.job_runner import JobBudgetExceeded
 
 class AccountMonitorService:
-    def __init__(self, db, mt5_service, alert_service=None, update_interval=60):
+    STATS_WINDOW_DAYS = 30
+    SWEEP_BUDGET = 0.8  # Tỷ lệ chu kỳ dành cho một sweep, phần còn lại để dự phòng
+    STATS_STATE_KEY = 'daily_stats_last_update'
+    
+    def __init__(self, db, mt5_service, alert_service=None, update_interval=60, stats_interval=3600,
+                 event_bus=None, history_store=None, drawdown_tracker=None):
         self.db = db
         self.mt5_service = mt5_service
+        self.history_store = history_store or HistoryStore(db, mt5_service)
         self.alert_service = alert_service
+        self.event_bus = event_bus  # Phát thay đổi tới các client đang stream
+        self.drawdown_tracker = drawdown_tracker  # Drawdown theo từng mẫu equity
         self.update_interval = update_interval  # Seconds
+        self.stats_interval = stats_interval  # Seconds giữa hai lần tổng hợp thống kê
         self.is_running = False
         self.monitor_thread = None
+        self.ticker = DeadlineTicker(update_interval)
+        # Tài khoản chưa kịp cập nhật ở sweep trước (được ưu tiên ở sweep sau)
+        self.deferred_account_ids = []
         self.logger = logging.getLogger('account_monitor')
+        # Tổng hợp dashboard cập nhật tăng dần theo từng tài khoản
+        self.dashboard = DashboardAggregate()
         
     def start_monitoring(self):
         """Bắt đầu theo dõi tài khoản"""
         if self.is_running:
             return
             
+        self._ensure_dashboard_loaded()
         self.is_running = True
+        self.ticker = DeadlineTicker(self.update_interval)
         self.monitor_thread = threading.Thread(target=self._monitoring_loop)
         self.monitor_thread.daemon = True
         self.monitor_thread.start()
@@ -29,30 +49,63 @@ class AccountMonitorService:
     def stop_monitoring(self):
         """Dừng theo dõi tài khoản"""
         self.is_running = False
+        self.ticker.stop()
         if self.monitor_thread:
             self.monitor_thread.join(timeout=5)
             self.monitor_thread = None
         self.logger.info("Account monitoring stopped")
         
     def _monitoring_loop(self):
-        """Vòng lặp kiểm tra và cập nhật thông tin tài khoản"""
-        while self.is_running:
+        """Vòng lặp kiểm tra và cập nhật thông tin tài khoản theo chu kỳ cố định"""
+        while self.is_running and self.ticker.wait():
+            started = time.monotonic()
+            deferred = 0
             try:
-                accounts = self.db.get_all_accounts()
-                for account in accounts:
-                    try:
-                        self.update_account_info(account)
-                    except Exception as e:
-                        self.logger.error(f"Error updating account {account.login}: {str(e)}")
-                        
-                # Cập nhật thống kê tài khoản hàng ngày
-                self._update_daily_stats()
+                # Thống kê hàng ngày chạy trong JobRunner, không chặn vòng lặp này
+                deferred = self._sweep_accounts(started)
                         
             except Exception as e:
                 self.logger.error(f"Error in monitoring loop: {str(e)}")
                 
-            # Đợi trước khi vòng lặp tiếp theo
-            time.sleep(self.update_interval)
+            duration = time.monotonic() - started
+            if self.ticker.metrics.record_sweep(duration, deferred):
+                self.logger.warning(
+                    f"Monitor sweep took {duration:.2f}s, longer than interval {self.update_interval}s"
+                )
+    
+    def _sweep_accounts(self, started):
+        """Cập nhật các tài khoản trong ngân sách thời gian của một chu kỳ
+        
+        Tài khoản không kịp cập nhật được dời sang sweep sau và xử lý trước tiên.
+        Trả về số tài khoản bị dời.
+        """
+        accounts = self.db.get_all_accounts()
+        if self.deferred_account_ids:
+            deferred_ids = set(self.deferred_account_ids)
+            accounts.sort(key=lambda a: a.account_id not in deferred_ids)
+        self.deferred_account_ids = []
+        
+        budget = self.update_interval * self.SWEEP_BUDGET
+        for index, account in enumerate(accounts):
+            if time.monotonic() - started > budget:
+                self.deferred_account_ids = [a.account_id for a in accounts[index:]]
+                self.logger.warning(
+                    f"Monitor sweep out of budget, deferring {len(self.deferred_account_ids)} accounts"
+                )
+                break
+                
+            account_started = time.monotonic()
+            try:
+                self.update_account_info(account)
+            except Exception as e:
+                self.logger.error(f"Error updating account {account.login}: {str(e)}")
+            self.ticker.metrics.record_item(account.account_id, time.monotonic() - account_started)
+            
+        return len(self.deferred_account_ids)
+    
+    def get_loop_metrics(self):
+        """Số liệu thời gian của vòng lặp giám sát"""
+        return self.ticker.metrics.snapshot()
     
     def update_account_info(self, account):
         """Cập nhật thông tin tài khoản từ MT5"""
@@ -63,6 +116,9 @@ class AccountMonitorService:
             # Nếu không lấy được thông tin, đánh dấu là mất kết nối
             account.is_connected = False
             self.db.save_account(account)
+            self.dashboard.update(account)
+            if self.event_bus:
+                self.event_bus.publish_account(account)
             
             # Gửi cảnh báo
             if self.alert_service:
@@ -105,102 +161,125 @@ class AccountMonitorService:
         
         # Lưu thông tin vào database
         self.db.save_account(account)
+        self.dashboard.update(account)
+        if self.drawdown_tracker:
+            self.drawdown_tracker.update(account)
+        
+        # Phát thay đổi tài khoản và vị thế cho các client đang stream
+        if self.event_bus:
+            self.event_bus.publish_account(account)
+            if self._needs_positions(account.account_id):
+                positions = self.mt5_service.get_open_positions(account.account_id, account)
+                # Lấy vị thế lỗi: giữ ảnh chụp cũ thay vì phát "đã đóng hết"
+                if positions is not None:
+                    self.event_bus.publish_positions(account.account_id, positions)
         return True
     
-    def _update_daily_stats(self):
-        """Cập nhật thống kê hàng ngày"""
-        # Kiểm tra xem có cần cập nhật hay không (chỉ cập nhật 1 lần mỗi ngày)
+    def _needs_positions(self, account_id):
+        """Có cần lấy vị thế của tài khoản trong sweep này không
+        
+        Ảnh chụp vị thế (PositionStore) và tổng vị thế theo symbol chỉ được cập
+        nhật từ các lần phát lên bus, nên mỗi tài khoản cần một lần lấy mỗi sweep
+        để các route đọc ảnh chụp không cũ quá update_interval. Bỏ qua khi không
+        có ai nhận vị thế, hoặc khi copy engine vừa phát vị thế của master.
+        """
+        if not self.event_bus.has_position_consumers():
+            return False
+        age = self.event_bus.positions_age(account_id)
+        return age is None or age >= self.update_interval
+    
+    def update_daily_stats(self, context=None):
+        """Cập nhật thống kê hàng ngày (chỉ tổng hợp các deal mới kể từ lần chạy trước)
+        
+        Được JobRunner gọi định kỳ với context chứa ngân sách thời gian; phần
+        tổng hợp chạy trong process pool của runner.
+        """
         now = datetime.now()
         last_update_time = self._get_last_stats_update_time()
         
-        if last_update_time and last_update_time.date() == now.date():
-            return  # Đã cập nhật trong ngày hôm nay
-            
-        try:
-            # Lấy tất cả tài khoản
-            accounts = self.db.get_all_accounts()
+        if last_update_time and (now - last_update_time).total_seconds() < self.stats_interval:
+            return  # Chưa đến lúc cập nhật
             
-            for account in accounts:
-                # Lấy thống kê giao dịch
-                self.get_account_stats(account.account_id)
-                
-            # Lưu thời gian cập nhật
-            self._save_last_stats_update_time(now)
+        # Lấy tất cả tài khoản
+        accounts = self.db.get_all_accounts()
+        
+        for account in accounts:
+            if context and context.expired():
+                # Watermark của từng tài khoản đã lưu, lần chạy sau sẽ tiếp tục
+                self.logger.warning("Daily stats job out of budget, remaining accounts deferred")
+                return
+            try:
+                self.sync_account_stats(account, context)
+            except JobBudgetExceeded:
+                # Hết ngân sách giữa phần tổng hợp: watermark của tài khoản chưa dời, lần chạy sau làm lại
+                self.logger.warning("Daily stats job out of budget, remaining accounts deferred")
+                return
+            except Exception as e:
+                self.logger.error(f"Error syncing stats for account {account.login}: {str(e)}")
             
-        except Exception as e:
-            self.logger.error(f"Error updating daily stats: {str(e)}")
+        # Lưu thời gian cập nhật
+        self._save_last_stats_update_time(now)
     
     def _get_last_stats_update_time(self):
         """Lấy thời gian cập nhật thống kê gần nhất"""
-        # Todo: Implement lấy từ database hoặc file
-        return None
+        value = self.db.get_state(self.STATS_STATE_KEY)
+        if not value:
+            return None
+        try:
+            return datetime.fromisoformat(value)
+        except ValueError:
+            return None
     
     def _save_last_stats_update_time(self, time):
         """Lưu thời gian cập nhật thống kê"""
-        # Todo: Implement lưu vào database hoặc file
-        pass
+        self.db.set_state(self.STATS_STATE_KEY, time.isoformat())
+    
+    def sync_account_stats(self, account, context=None):
+        """Tổng hợp các giao dịch được đóng bởi deal mới vào thống kê ngày/tháng
+        
+        Phần tổng hợp chạy trong process pool của JobRunner khi có context.
+        """
+        compute = context.compute if context else None
+        return self.history_store.sync_rollups(account, compute)
     
     def get_account_stats(self, account_id):
-        """Lấy thống kê giao dịch của tài khoản"""
+        """Lấy thống kê giao dịch của tài khoản (đọc từ bảng daily_account_stats)"""
         # Lấy tài khoản
         account = self.db.get_account(account_id)
         if not account:
             return None
             
-        # Lấy giao dịch trong 30 ngày gần nhất
-        from_date = datetime.now() - timedelta(days=30)
-        trades = self.mt5_service.get_order_history(account_id, from_date, account=account)
-        
-        if not trades:
-            return {
-                'total_trades': 0,
-                'winning_trades': 0,
-                'losing_trades': 0,
-                'win_rate': 0,
-                'profit': 0,
-                'loss': 0,
-                'net_profit': 0
-            }
-            
-        # Tính toán thống kê
-        winning_trades = [t for t in trades if t['profit'] > 0]
-        losing_trades = [t for t in trades if t['profit'] < 0]
-        
-        win_rate = (len(winning_trades) / len(trades)) * 100 if trades else 0
-        total_profit = sum(t['profit'] for t in winning_trades)
-        total_loss = sum(t['profit'] for t in losing_trades)
-        net_profit = total_profit + total_loss
-        
-        stats = {
-            'total_trades': len(trades),
-            'winning_trades': len(winning_trades),
-            'losing_trades': len(losing_trades),
-            'win_rate': round(win_rate, 2),
-            'profit': round(total_profit, 2),
-            'loss': round(total_loss, 2),
-            'net_profit': round(net_profit, 2)
-        }
+        # Tổng hợp tối đa STATS_WINDOW_DAYS dòng theo khóa chính (account_id, date)
+        from_date = (datetime.now() - timedelta(days=self.STATS_WINDOW_DAYS)).date().isoformat()
+        summary = self.db.get_account_stats_summary(account_id, from_date)
+        watermark = self.db.get_stats_watermark(account_id)
         
-        # Todo: Lưu thống kê vào database
+        total_trades = summary['total_trades']
+        win_rate = (summary['winning_trades'] / total_trades) * 100 if total_trades else 0
+        net_profit = summary['profit'] + summary['loss']
         
-        return stats
+        return {
+            'total_trades': total_trades,
+            'winning_trades': summary['winning_trades'],
+            'losing_trades': summary['losing_trades'],
+            'win_rate': round(win_rate, 2),
+            'profit': round(summary['profit'], 2),
+            'loss': round(summary['loss'], 2),
+            'net_profit': round(net_profit, 2),
+            'last_update': watermark['updated_at'].isoformat() if watermark and watermark['updated_at'] else None
+        }
+    
+    def _ensure_dashboard_loaded(self):
+        """Nạp tổng hợp dashboard từ database ở lần đọc đầu tiên"""
+        if not self.dashboard.is_loaded:
+            self.dashboard.load(self.db.get_all_accounts())
     
     def get_dashboard_data(self):
-        """Lấy dữ liệu tổng quan cho dashboard"""
-        accounts = self.db.get_all_accounts()
-        
-        total_balance = sum(a.balance for a in accounts)
-        total_equity = sum(a.equity for a in accounts)
-        total_profit = sum(a.profit for a in accounts)
-        
-        connected_accounts = sum(1 for a in accounts if a.is_connected)
-        
-        return {
-            'total_accounts': len(accounts),
-            'connected_accounts': connected_accounts,
-            'disconnected_accounts': len(accounts) - connected_accounts,
-            'total_balance': round(total_balance, 2),
-            'total_equity': round(total_equity, 2),
-            'total_profit': round(total_profit, 2),
-            'accounts': [a.to_dict() for a in accounts]
-        }
\ No newline at end of file
+        """Lấy dữ liệu tổng quan cho dashboard (snapshot đã tính sẵn theo version)"""
+        self._ensure_dashboard_loaded()
+        return self.dashboard.get_snapshot()
+    
+    def get_dashboard_totals(self, user_id=None, group_name=None):
+        """Lấy tổng số của toàn bộ, một người dùng hoặc một nhóm tài khoản"""
+        self._ensure_dashboard_loaded()
+        return self.dashboard.get_totals(user_id=user_id, group_name=group_name)
@@ -0,0 +1,248 @@
+import os
+import re
+import mmap
+import time
+import threading
+import logging
+import numpy as np
+
+# Cùng bố cục với mảng nến của MT5 (copy_rates_range)
+BAR_DTYPE = np.dtype([
+    ('time', '<i8'),
+    ('open', '<f8'),
+    ('high', '<f8'),
+    ('low', '<f8'),
+    ('close', '<f8'),
+    ('tick_volume', '<u8'),
+    ('spread', '<i4'),
+    ('real_volume', '<u8')
+])
+
+
+class BarCache:
+    """Cache nến OHLC trên đĩa theo (symbol, khung thời gian), đọc bằng memory map
+
+    Mỗi khóa là một thư mục gồm các đoạn (segment) rời nhau; mỗi đoạn là một file
+    nhị phân không header gồm các bản ghi BAR_DTYPE sắp theo thời gian, tên file là
+    khoảng thời gian mà đoạn đã bao phủ ("<from>_<to>.bin", kể cả khi khoảng đó
+    không có nến). Mỗi lần đọc chỉ lấy từ MT5 các khoảng trong [from_time, to_time]
+    chưa được bao phủ, rồi ghép với đoạn liền kề. Khoảng sát hiện tại được lấy tới
+    nến mới nhất; nến đó có thể chưa đóng nên chỉ được giữ trong bộ nhớ.
+    Khóa theo từng (symbol, khung thời gian) cộng với refresh_interval gộp nhiều
+    người xem cùng symbol thành một lần gọi terminal.
+    """
+
+    # Giờ server MT5 có thể lệch với giờ máy tối đa chừng này (seconds)
+    SERVER_TIME_SLACK = 86400
+
+    def __init__(self, base_dir, mt5_service, refresh_interval=1):
+        self.base_dir = base_dir
+        self.mt5_service = mt5_service
+        self.refresh_interval = refresh_interval  # seconds giữa hai lần lấy phần đuôi của một khóa
+        self.lock = threading.Lock()
+        self.entries = {}  # {(symbol, timeframe): trạng thái trong bộ nhớ}
+        self.fetches = 0
+        self.fetched_bars = 0
+        self.logger = logging.getLogger('bar_cache')
+        os.makedirs(base_dir, exist_ok=True)
+
+    def _entry(self, symbol, timeframe):
+        with self.lock:
+            return self.entries.setdefault((symbol, timeframe), {
+                'lock': threading.Lock(),
+                'forming': np.empty(0, dtype=BAR_DTYPE),
+                'refreshed_at': None,
+                'segments': None  # [(covered_from, covered_to, path)] sắp theo thời gian, nạp lần đầu dùng
+            })
+
+    def _key_dir(self, symbol, timeframe):
+        # Tên symbol có thể chứa ký tự không hợp lệ cho tên file (ví dụ "US30.cash#")
+        return os.path.join(self.base_dir, f"{re.sub(r'[^A-Za-z0-9._-]', '_', symbol)}_{timeframe}")
+
+    def get_bars(self, symbol, timeframe, from_time, to_time):
+        """Nến trong khoảng [from_time, to_time] (epoch giây, giờ server MT5), dạng mảng BAR_DTYPE"""
+        if timeframe not in self.mt5_service.TIMEFRAMES:
+            raise ValueError(f"Unsupported timeframe: {timeframe}")
+
+        entry = self._entry(symbol, timeframe)
+        key_dir = self._key_dir(symbol, timeframe)
+        period = self.mt5_service.TIMEFRAMES[timeframe][1]
+        with entry['lock']:
+            segments = self._segments(entry, key_dir)
+            for gap_from, gap_to in self._gaps(segments, from_time, to_time):
+                # Nến của khoảng sát hiện tại có thể chưa đóng (kể cả D1/W1 bắt đầu từ vài ngày trước)
+                if gap_to + period + self.SERVER_TIME_SLACK >= time.time():
+                    self._fetch_live(entry, key_dir, symbol, timeframe, gap_from)
+                else:
+                    self._fetch_range(entry, key_dir, symbol, timeframe, gap_from, gap_to)
+
+            parts = [
+                self._read(path, from_time, to_time)
+                for covered_from, covered_to, path in entry['segments']
+                if covered_to >= from_time and covered_from <= to_time
+            ]
+            forming = entry['forming']
+            parts.append(forming[(forming['time'] >= from_time) & (forming['time'] <= to_time)])
+            return np.concatenate(parts)
+
+    def _segments(self, entry, key_dir):
+        """Danh sách đoạn của khóa, nạp từ tên file trong thư mục ở lần dùng đầu tiên"""
+        if entry['segments'] is not None:
+            return entry['segments']
+
+        os.makedirs(key_dir, exist_ok=True)
+        # File đơn của phiên bản trước (nến liền nhau từ nến đầu tới nến cuối) -> một đoạn
+        legacy = f'{key_dir}.bin'
+        if os.path.exists(legacy):
+            stored = self._read(legacy)
+            if stored is None:
+                os.remove(legacy)
+            else:
+                os.replace(legacy, self._segment_path(key_dir, *stored))
+
+        found = []
+        for name in os.listdir(key_dir):
+            match = re.fullmatch(r'(\d+)_(\d+)\.bin', name)
+            if match:
+                found.append((int(match.group(1)), int(match.group(2)), os.path.join(key_dir, name)))
+
+        # Tiến trình dừng giữa lúc ghép đoạn có thể để lại đoạn cũ nằm trong đoạn đã ghép
+        segments = []
+        for segment in sorted(found, key=lambda item: (item[0], -item[1])):
+            if segments and segment[1] <= segments[-1][1]:
+                os.remove(segment[2])
+                continue
+            segments.append(segment)
+        entry['segments'] = segments
+        return segments
+
+    @staticmethod
+    def _segment_path(key_dir, covered_from, covered_to):
+        return os.path.join(key_dir, f'{covered_from}_{covered_to}.bin')
+
+    @staticmethod
+    def _gaps(segments, from_time, to_time):
+        """Các khoảng con của [from_time, to_time] chưa có đoạn nào bao phủ"""
+        gaps = []
+        cursor = from_time
+        for covered_from, covered_to, _ in segments:
+            if covered_to < cursor:
+                continue
+            if covered_from > to_time:
+                break
+            if covered_from > cursor:
+                gaps.append((cursor, covered_from - 1))
+            cursor = covered_to + 1
+        if cursor <= to_time:
+            gaps.append((cursor, to_time))
+        return gaps
+
+    def _read(self, path, from_time=None, to_time=None):
+        """Không có khoảng: (thời gian nến đầu, nến cuối) hoặc None nếu file rỗng.
+        Có khoảng: bản sao các nến trong [from_time, to_time]."""
+        size = os.path.getsize(path) if os.path.exists(path) else 0
+        if size < BAR_DTYPE.itemsize:
+            return None if from_time is None else np.empty(0, dtype=BAR_DTYPE)
+
+        # Không giữ mapping sau khi đọc để file luôn ghi nối/thay được (kể cả trên Windows)
+        with open(path, 'rb') as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+            bars = np.frombuffer(mapped, dtype=BAR_DTYPE, count=size // BAR_DTYPE.itemsize)
+            if from_time is None:
+                result = int(bars[0]['time']), int(bars[-1]['time'])
+            else:
+                times = bars['time']
+                lo = np.searchsorted(times, from_time, side='left')
+                hi = np.searchsorted(times, to_time, side='right')
+                result = bars[lo:hi].copy()
+                del times
+            del bars
+        return result
+
+    def _fetch_live(self, entry, key_dir, symbol, timeframe, from_time):
+        """Lấy các nến từ from_time tới nến mới nhất; nến cuối (có thể chưa đóng) chỉ giữ trong bộ nhớ"""
+        now = time.monotonic()
+        if entry['refreshed_at'] is not None and now - entry['refreshed_at'] < self.refresh_interval:
+            return
+        entry['refreshed_at'] = now
+
+        # Giờ server MT5 có thể lệch với giờ máy, lấy dư về phía tương lai
+        rates = self._fetch(symbol, timeframe, from_time, time.time() + self.SERVER_TIME_SLACK)
+        if rates is None:
+            return
+
+        rates = rates[rates['time'] >= from_time]
+        if not len(rates):
+            entry['forming'] = rates
+            return
+        entry['forming'] = rates[-1:]
+        # Đã biết mọi nến trước nến đang hình thành
+        self._store(entry, key_dir, from_time, int(rates[-1]['time']) - 1, rates[:-1])
+
+    def _fetch_range(self, entry, key_dir, symbol, timeframe, from_time, to_time):
+        """Lấy các nến đã đóng trong [from_time, to_time] và lưu thành đoạn (kể cả khi không có nến)"""
+        rates = self._fetch(symbol, timeframe, from_time, to_time)
+        if rates is None:
+            # Không ghi nhận khoảng đã bao phủ, lần đọc sau sẽ thử lại
+            return
+        self._store(entry, key_dir, from_time, to_time,
+                    rates[(rates['time'] >= from_time) & (rates['time'] <= to_time)])
+
+    def _store(self, entry, key_dir, covered_from, covered_to, bars):
+        """Ghi các nến của khoảng [covered_from, covered_to], ghép với đoạn liền kề hai bên"""
+        if covered_to < covered_from:
+            return
+
+        segments = entry['segments']
+        left = next((segment for segment in segments if segment[1] == covered_from - 1), None)
+        right = next((segment for segment in segments if segment[0] == covered_to + 1), None)
+        path = self._segment_path(
+            key_dir, left[0] if left else covered_from, right[1] if right else covered_to
+        )
+
+        if left and not right:
+            # Trường hợp thường gặp (nến mới ở cuối): chỉ ghi nối rồi đổi tên
+            with open(left[2], 'ab') as f:
+                f.write(bars.tobytes())
+            os.replace(left[2], path)
+        else:
+            temp = f'{path}.{os.getpid()}.{threading.get_ident()}.tmp'
+            with open(temp, 'wb') as f:
+                if left:
+                    self._copy_file(left[2], f)
+                f.write(bars.tobytes())
+                if right:
+                    self._copy_file(right[2], f)
+            os.replace(temp, path)
+            for segment in (left, right):
+                if segment:
+                    os.remove(segment[2])
+
+        entry['segments'] = sorted(
+            [segment for segment in segments if segment is not left and segment is not right]
+            + [(left[0] if left else covered_from, right[1] if right else covered_to, path)]
+        )
+
+    @staticmethod
+    def _copy_file(path, target):
+        with open(path, 'rb') as source:
+            while True:
+                chunk = source.read(1 << 20)
+                if not chunk:
+                    break
+                target.write(chunk)
+
+    def _fetch(self, symbol, timeframe, from_time, to_time):
+        rates = self.mt5_service.get_rates(symbol, timeframe, from_time, to_time)
+        rates = None if rates is None else np.asarray(rates).astype(BAR_DTYPE)
+        with self.lock:
+            self.fetches += 1
+            self.fetched_bars += 0 if rates is None else len(rates)
+        return rates
+
+    def get_stats(self):
+        with self.lock:
+            return {
+                'keys': len(self.entries),
+                'fetches': self.fetches,
+                'fetched_bars': self.fetched_bars
+            }
@@ -0,0 +1,53 @@
+import numpy as np
+from services.metrics_engine import compute_metrics
+
+# round() của Python áp dụng từng phần tử: np.round làm tròn khác ở các giá trị
+# đúng nửa bước (0.025 -> 0.02), lệnh copy thật dùng round() của Python
+_round = np.frompyfunc(lambda value, digits: round(float(value), digits), 2, 1)
+
+
+def copy_volumes(volumes, volume_percent, min_volume, max_volume):
+    """Khối lượng lệnh copy theo cài đặt (dùng được cho số hoặc mảng NumPy)
+
+    Cùng công thức với CopyTradeService.calculate_copy_volume: tỷ lệ phần trăm,
+    giới hạn trong [min_volume, max_volume], làm tròn 2 chữ số.
+    """
+    volume = np.asarray(volumes, dtype=float) * (np.asarray(volume_percent, dtype=float) / 100)
+    volume = np.maximum(np.minimum(volume, max_volume), min_volume)
+    return np.asarray(_round(volume, 2), dtype=float)
+
+
+def simulate_copy_grid(net_profit, volumes, symbols, start_balance, settings_grid):
+    """Mô phỏng kết quả của follower cho nhiều bộ cài đặt trên cùng lịch sử master
+
+    net_profit, volumes, symbols: mảng theo từng round trip của master (đã sắp
+    xếp theo thời gian đóng). P&L của follower tỷ lệ với khối lượng copy. Mỗi
+    phần tử của settings_grid: dict volume_percent, min_volume, max_volume,
+    allowed_symbols. Hàm cấp module để chạy được trong process pool.
+    Trả về (ma trận P&L bộ cài đặt x giao dịch, danh sách metrics).
+    """
+    net_profit = np.asarray(net_profit, dtype=float)
+    volumes = np.asarray(volumes, dtype=float)
+    symbols = np.asarray(symbols)
+
+    percent = np.array([s['volume_percent'] for s in settings_grid], dtype=float)[:, None]
+    min_volume = np.array([s['min_volume'] for s in settings_grid], dtype=float)[:, None]
+    max_volume = np.array([s['max_volume'] for s in settings_grid], dtype=float)[:, None]
+
+    copied = copy_volumes(volumes[None, :], percent, min_volume, max_volume)
+    allowed = np.ones(copied.shape, dtype=bool)
+    for i, settings in enumerate(settings_grid):
+        if settings.get('allowed_symbols'):
+            allowed[i] = np.isin(symbols, settings['allowed_symbols'])
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        ratio = np.where(volumes > 0, copied / volumes, 0.0)
+    pnl = np.where(allowed, net_profit * ratio, 0.0)
+
+    metrics = []
+    for row, mask in zip(pnl, allowed):
+        result = compute_metrics(row[mask], initial_balance=start_balance)
+        result['copied_volume'] = round(float(copied[len(metrics)][mask].sum()), 2)
+        result['final_balance'] = round(float(start_balance + row.sum()), 2)
+        metrics.append(result)
+    return pnl, metrics
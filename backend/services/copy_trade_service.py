@@ -1,8 +1,13 @@
 # ✅ ĐÃ HOÀN THÀNH
 import logging
+import threading
+import time
 from datetime import datetime
 from models.copy_settings import CopySettings
 from models.account import Account
+from models.trade import Trade
+from utils.ticker import DeadlineTicker
+from services.copy_simulator import copy_volumes
 
 class CopyTradeService:
     def __init__(self, db, mt5_service):
@@ -161,13 +166,15 @@ class CopyTradeService:
                 self.logger.error(f"Error copying trade: {str(e)}")
 
 class CopyTradeService:
-    def __init__(self, db, mt5_service, trade_validator=None, check_interval=1):
+    def __init__(self, db, mt5_service, trade_validator=None, check_interval=1, event_bus=None):
         self.db = db
         self.mt5_service = mt5_service
         self.trade_validator = trade_validator
+        self.event_bus = event_bus  # Phát delta vị thế của master tới các client đang stream
         self.check_interval = check_interval  # Seconds
         self.is_running = False
         self.copy_thread = None
+        self.ticker = DeadlineTicker(check_interval)
         self.logger = logging.getLogger('copy_trade_service')
         # Lưu trữ ticket cuối cùng đã kiểm tra cho mỗi tài khoản master
         self.last_checked_tickets = {}
@@ -180,6 +187,7 @@ class CopyTradeService:
             return
             
         self.is_running = True
+        self.ticker = DeadlineTicker(self.check_interval)
         self.copy_thread = threading.Thread(target=self._copy_loop)
         self.copy_thread.daemon = True
         self.copy_thread.start()
@@ -188,14 +196,16 @@ class CopyTradeService:
     def stop_copy_service(self):
         """Dừng dịch vụ copy trade"""
         self.is_running = False
+        self.ticker.stop()
         if self.copy_thread:
             self.copy_thread.join(timeout=5)
             self.copy_thread = None
         self.logger.info("Copy trade service stopped")
         
     def _copy_loop(self):
-        """Vòng lặp theo dõi và copy giao dịch"""
-        while self.is_running:
+        """Vòng lặp theo dõi và copy giao dịch theo chu kỳ cố định"""
+        while self.is_running and self.ticker.wait():
+            started = time.monotonic()
             try:
                 # Lấy tất cả cài đặt copy trade đang hoạt động
                 copy_settings = self._get_active_copy_settings()
@@ -209,17 +219,26 @@ class CopyTradeService:
                 
                 # Kiểm tra từng tài khoản master
                 for master_account_id, follower_settings in master_followers_map.items():
+                    master_started = time.monotonic()
                     try:
                         self.check_and_copy_new_trades(master_account_id, follower_settings)
                         self.check_and_update_existing_trades(master_account_id)
                     except Exception as e:
                         self.logger.error(f"Error processing master account {master_account_id}: {str(e)}")
+                    self.ticker.metrics.record_item(master_account_id, time.monotonic() - master_started)
                         
             except Exception as e:
                 self.logger.error(f"Error in copy loop: {str(e)}")
                 
-            # Đợi trước khi vòng lặp tiếp theo
-            time.sleep(self.check_interval)
+            duration = time.monotonic() - started
+            if self.ticker.metrics.record_sweep(duration):
+                self.logger.warning(
+                    f"Copy sweep took {duration:.2f}s, longer than interval {self.check_interval}s"
+                )
+    
+    def get_loop_metrics(self):
+        """Số liệu thời gian của vòng lặp copy trade"""
+        return self.ticker.metrics.snapshot()
     
     def _get_active_copy_settings(self):
         """Lấy tất cả cài đặt copy trade đang hoạt động"""
@@ -237,6 +256,11 @@ class CopyTradeService:
             
         # Lấy các vị thế mở từ tài khoản master
         positions = self.mt5_service.get_open_positions(master_account_id, master_account)
+        if positions is None:
+            # Lấy vị thế lỗi: không phát ảnh chụp rỗng
+            return
+        if self.event_bus:
+            self.event_bus.publish_positions(master_account_id, positions)
         if not positions:
             return
             
@@ -372,7 +396,10 @@ class CopyTradeService:
             
         # Lấy tất cả vị thế hiện tại của master
         current_positions = self.mt5_service.get_open_positions(master_account_id, master_account)
-        current_tickets = {p['ticket']: p for p in current_positions} if current_positions else {}
+        if current_positions is None:
+            # Lấy vị thế lỗi: không coi mọi giao dịch master là đã đóng
+            return
+        current_tickets = {p['ticket']: p for p in current_positions}
         
         # Kiểm tra từng giao dịch đã copy
         for master_ticket in master_tickets:
@@ -464,16 +491,14 @@ class CopyTradeService:
         return None
     
     def calculate_copy_volume(self, original_volume, settings):
-        """Tính toán khối lượng giao dịch copy dựa trên cài đặt"""
-        volume = original_volume * (settings.volume_percent / 100)
-        
-        # Giới hạn trong khoảng min/max
-        volume = max(min(volume, settings.max_volume), settings.min_volume)
-        
-        # Làm tròn đến độ chính xác của broker (thường là 0.01 hoặc 0.1)
-        volume = round(volume, 2)
+        """Tính toán khối lượng giao dịch copy dựa trên cài đặt
         
-        return volume
+        Theo tỷ lệ phần trăm, giới hạn trong khoảng min/max và làm tròn đến độ
+        chính xác của broker (0.01). Dùng chung công thức với bộ mô phỏng copy.
+        """
+        return float(copy_volumes(
+            original_volume, settings.volume_percent, settings.min_volume, settings.max_volume
+        ))
     
     # Các phương thức để quản lý cài đặt copy trade
     
@@ -0,0 +1,149 @@
+import threading
+
+
+def _account_entry(account):
+    """Phần của tài khoản hiển thị trên dashboard (không gồm mật khẩu và thời điểm cập nhật)"""
+    return {
+        'account_id': account.account_id,
+        'login': account.login,
+        'server': account.server,
+        'name': account.name,
+        'user_id': account.user_id,
+        'group_name': account.group_name,
+        'balance': account.balance,
+        'equity': account.equity,
+        'margin': account.margin,
+        'free_margin': account.free_margin,
+        'leverage': account.leverage,
+        'profit': account.profit,
+        'is_connected': bool(account.is_connected)
+    }
+
+
+def _empty_totals():
+    return {
+        'total_accounts': 0,
+        'connected_accounts': 0,
+        'total_balance': 0.0,
+        'total_equity': 0.0,
+        'total_profit': 0.0
+    }
+
+
+class DashboardAggregate:
+    """Tổng hợp số liệu dashboard, cập nhật tăng dần theo từng tài khoản
+
+    Mỗi lần một tài khoản thay đổi, phần đóng góp cũ bị trừ đi và phần mới được
+    cộng vào các nhóm (toàn bộ, theo người dùng, theo nhóm tài khoản), nên việc
+    đọc tổng số không phải duyệt lại danh sách tài khoản.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.accounts = {}   # {account_id: dữ liệu đã đóng góp vào tổng}
+        self.totals = _empty_totals()
+        self.by_user = {}    # {user_id: totals}
+        self.by_group = {}   # {group_name: totals}
+        self.version = 0
+        self.is_loaded = False
+        self._snapshot = None
+
+    def load(self, accounts):
+        """Khởi tạo lại toàn bộ từ danh sách tài khoản"""
+        with self.lock:
+            self.accounts = {}
+            self.totals = _empty_totals()
+            self.by_user = {}
+            self.by_group = {}
+            for account in accounts:
+                entry = _account_entry(account)
+                self._apply(entry, 1)
+                self.accounts[account.account_id] = entry
+            self.version += 1
+            self.is_loaded = True
+
+    def update(self, account):
+        """Cập nhật phần đóng góp của một tài khoản. Trả về True nếu có thay đổi"""
+        entry = _account_entry(account)
+        with self.lock:
+            old = self.accounts.get(account.account_id)
+            if old == entry:
+                return False
+            if old:
+                self._apply(old, -1)
+            self._apply(entry, 1)
+            self.accounts[account.account_id] = entry
+            self.version += 1
+            return True
+
+    def remove(self, account_id):
+        """Loại bỏ tài khoản khỏi tổng hợp"""
+        with self.lock:
+            old = self.accounts.pop(account_id, None)
+            if not old:
+                return False
+            self._apply(old, -1)
+            self.version += 1
+            return True
+
+    def _apply(self, entry, sign):
+        """Cộng (sign=1) hoặc trừ (sign=-1) phần đóng góp của một tài khoản"""
+        buckets = [self.totals]
+        if entry.get('user_id') is not None:
+            buckets.append(self.by_user.setdefault(entry['user_id'], _empty_totals()))
+        if entry.get('group_name'):
+            buckets.append(self.by_group.setdefault(entry['group_name'], _empty_totals()))
+
+        for bucket in buckets:
+            bucket['total_accounts'] += sign
+            bucket['connected_accounts'] += sign if entry.get('is_connected') else 0
+            bucket['total_balance'] += sign * (entry.get('balance') or 0)
+            bucket['total_equity'] += sign * (entry.get('equity') or 0)
+            bucket['total_profit'] += sign * (entry.get('profit') or 0)
+
+        # Xóa nhóm rỗng để không giữ lại khóa cũ
+        if sign < 0:
+            if entry.get('user_id') is not None and not self.by_user[entry['user_id']]['total_accounts']:
+                del self.by_user[entry['user_id']]
+            if entry.get('group_name') and not self.by_group[entry['group_name']]['total_accounts']:
+                del self.by_group[entry['group_name']]
+
+    def get_totals(self, user_id=None, group_name=None):
+        """Lấy tổng số của toàn bộ, một người dùng hoặc một nhóm tài khoản"""
+        with self.lock:
+            if user_id is not None:
+                totals = self.by_user.get(user_id, _empty_totals())
+            elif group_name:
+                totals = self.by_group.get(group_name, _empty_totals())
+            else:
+                totals = self.totals
+            return self._format_totals(totals, self.version)
+
+    def get_snapshot(self):
+        """Lấy snapshot đầy đủ (tổng số + danh sách tài khoản) theo version hiện tại
+
+        Snapshot chỉ được dựng lại khi version thay đổi, các request đọc giữa hai
+        lần cập nhật dùng chung cùng một đối tượng.
+        """
+        with self.lock:
+            if self._snapshot and self._snapshot['version'] == self.version:
+                return self._snapshot
+
+            snapshot = self._format_totals(self.totals, self.version)
+            snapshot['accounts'] = sorted(
+                self.accounts.values(),
+                key=lambda a: (a.get('name') or '')
+            )
+            self._snapshot = snapshot
+            return snapshot
+
+    def _format_totals(self, totals, version):
+        return {
+            'version': version,
+            'total_accounts': totals['total_accounts'],
+            'connected_accounts': totals['connected_accounts'],
+            'disconnected_accounts': totals['total_accounts'] - totals['connected_accounts'],
+            'total_balance': round(totals['total_balance'], 2),
+            'total_equity': round(totals['total_equity'], 2),
+            'total_profit': round(totals['total_profit'], 2)
+        }
@@ -0,0 +1,159 @@
+import threading
+import logging
+from datetime import datetime, timedelta
+from services.round_trips import reconstruct_round_trips
+
+
+class DrawdownState:
+    """Trạng thái drawdown của một đường equity, cập nhật O(1) với mỗi điểm mới
+
+    peak: equity cao nhất đã thấy; trough: equity thấp nhất kể từ đỉnh đó.
+    max_drawdown_start/end: thời điểm đỉnh và đáy của lần sụt giảm lớn nhất.
+    Phần trăm tính trên đỉnh, bằng 0 khi đỉnh không dương.
+    """
+
+    FIELDS = [
+        'peak', 'peak_time', 'trough', 'trough_time', 'last_equity', 'last_time',
+        'current_drawdown', 'current_drawdown_percent', 'max_drawdown',
+        'max_drawdown_percent', 'max_drawdown_start', 'max_drawdown_end'
+    ]
+
+    def __init__(self, **values):
+        self.peak = None
+        self.peak_time = None
+        self.trough = None
+        self.trough_time = None
+        self.last_equity = None
+        self.last_time = None
+        self.current_drawdown = 0.0
+        self.current_drawdown_percent = 0.0
+        self.max_drawdown = 0.0
+        self.max_drawdown_percent = 0.0
+        self.max_drawdown_start = None
+        self.max_drawdown_end = None
+        for key, value in values.items():
+            if key in self.FIELDS and value is not None:
+                setattr(self, key, value)
+
+    def update(self, equity, timestamp):
+        """Đưa vào một điểm equity mới (theo thứ tự thời gian)"""
+        equity = float(equity)
+        if self.peak is None or equity > self.peak:
+            # Đỉnh mới: bắt đầu một lần sụt giảm mới
+            self.peak = equity
+            self.peak_time = timestamp
+            self.trough = equity
+            self.trough_time = timestamp
+        elif equity < self.trough:
+            self.trough = equity
+            self.trough_time = timestamp
+
+        self.last_equity = equity
+        self.last_time = timestamp
+        self.current_drawdown = self.peak - equity
+        self.current_drawdown_percent = self.current_drawdown / self.peak * 100 if self.peak > 0 else 0.0
+
+        if self.current_drawdown > self.max_drawdown:
+            self.max_drawdown = self.current_drawdown
+            self.max_drawdown_start = self.peak_time
+            self.max_drawdown_end = timestamp
+        if self.current_drawdown_percent > self.max_drawdown_percent:
+            self.max_drawdown_percent = self.current_drawdown_percent
+
+    def to_dict(self):
+        result = {}
+        for key in self.FIELDS:
+            value = getattr(self, key)
+            if isinstance(value, datetime):
+                value = value.isoformat()
+            elif isinstance(value, float):
+                value = round(value, 2)
+            result[key] = value
+        return result
+
+
+class DrawdownTracker:
+    """Drawdown theo equity của từng tài khoản, cập nhật tăng dần và lưu vào bảng drawdown_state
+
+    Monitor đưa vào mỗi mẫu equity; lần đầu gặp một tài khoản, trạng thái được
+    khởi tạo từ đường số dư của các giao dịch đã đóng trong lịch sử cục bộ
+    (không gọi MT5). Đọc trạng thái không cần tính lại gì.
+    """
+
+    SEED_DAYS = 365
+
+    def __init__(self, db, history_store=None):
+        self.db = db
+        self.history_store = history_store
+        self.lock = threading.Lock()
+        self.states = {}  # {account_id: DrawdownState}
+        self.logger = logging.getLogger('drawdown_tracker')
+
+    def update(self, account, timestamp=None):
+        """Cập nhật drawdown với equity hiện tại của tài khoản"""
+        timestamp = timestamp or datetime.now()
+        with self.lock:
+            state = self._get_state(account)
+            state.update(account.equity, timestamp)
+            self.db.save_drawdown_state(account.account_id, state.to_dict())
+            return state.to_dict()
+
+    def ensure(self, account):
+        """Trạng thái của tài khoản, khởi tạo từ lịch sử nếu chưa có (không thêm mẫu equity)"""
+        with self.lock:
+            is_new = account.account_id not in self.states and not self.db.get_drawdown_state(account.account_id)
+            state = self._get_state(account)
+            if is_new and state.peak is not None:
+                self.db.save_drawdown_state(account.account_id, state.to_dict())
+            return state.to_dict() if state.peak is not None else None
+
+    def get(self, account_id):
+        """Trạng thái drawdown hiện tại của tài khoản (None nếu chưa có mẫu nào)"""
+        with self.lock:
+            state = self.states.get(account_id)
+            if state is None:
+                values = self.db.get_drawdown_state(account_id)
+                if not values:
+                    return None
+                state = self.states[account_id] = DrawdownState(**values)
+            return state.to_dict()
+
+    def remove(self, account_id):
+        with self.lock:
+            self.states.pop(account_id, None)
+
+    def _get_state(self, account):
+        state = self.states.get(account.account_id)
+        if state is not None:
+            return state
+
+        values = self.db.get_drawdown_state(account.account_id)
+        if values:
+            state = DrawdownState(**values)
+        else:
+            state = DrawdownState()
+            self._seed(state, account)
+        self.states[account.account_id] = state
+        return state
+
+    def _seed(self, state, account):
+        """Khởi tạo từ đường số dư sau mỗi giao dịch đã đóng, suy ngược từ số dư hiện tại"""
+        if self.history_store is None:
+            return
+        try:
+            history = self.history_store.load_frame(
+                account.account_id, datetime.now() - timedelta(days=self.SEED_DAYS)
+            )
+            round_trips = reconstruct_round_trips(history)
+        except Exception as e:
+            self.logger.error(f"Error seeding drawdown for account {account.account_id}: {str(e)}")
+            return
+        if round_trips.empty:
+            return
+
+        net = round_trips['net_profit'].to_numpy(dtype=float)
+        balance = (account.balance or 0) - net.sum()
+        state.update(balance, round_trips['open_time'].iloc[0].to_pydatetime())
+        for close_time, profit in zip(round_trips['close_time'], net):
+            balance += profit
+            state.update(balance, close_time.to_pydatetime())
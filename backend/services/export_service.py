@@ -0,0 +1,171 @@
+import io
+import csv
+import logging
+from datetime import timedelta
+import pandas as pd
+from services.round_trips import reconstruct_round_trips, DEAL_TYPE_BUY, DEAL_TYPE_SELL
+
+
+class _ChunkSink:
+    """File-like chỉ ghi, giữ các byte đã ghi cho tới khi được lấy ra"""
+
+    def __init__(self):
+        self.chunks = []
+        self.closed = False
+
+    def write(self, data):
+        self.chunks.append(bytes(data))
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def close(self):
+        self.closed = True
+
+    def drain(self):
+        data = b''.join(self.chunks)
+        self.chunks = []
+        return data
+
+
+class ExportService:
+    """Xuất lịch sử cục bộ (deal, round trip, thống kê ngày/tháng) dưới dạng CSV hoặc Parquet
+
+    Dữ liệu được đọc từ SQLite theo từng trang và ghi ra theo từng phần nên bộ
+    nhớ dùng không phụ thuộc độ dài lịch sử hay số tài khoản. Không gọi MT5:
+    dữ liệu là bản đồng bộ gần nhất trong bảng deals.
+    """
+
+    KINDS = ['deals', 'round_trips', 'daily', 'monthly']
+    FORMATS = ['csv', 'parquet']
+    PAGE_SIZE = 5000
+    # Lấy thêm deal trước khoảng xuất để có deal mở của các vị thế đóng trong khoảng
+    ENTRY_LOOKBACK_DAYS = 30
+
+    def __init__(self, db):
+        self.db = db
+        self.logger = logging.getLogger('export_service')
+
+    def validate(self, kind, fmt):
+        """Kiểm tra tham số xuất, trả về (hợp lệ, thông báo)"""
+        if kind not in self.KINDS:
+            return False, f"Unsupported export kind: {kind}"
+        if fmt not in self.FORMATS:
+            return False, f"Unsupported export format: {fmt}"
+        if fmt == 'parquet':
+            try:
+                import pyarrow  # noqa: F401
+            except ImportError:
+                return False, "Parquet export requires pyarrow"
+        return True, ""
+
+    def stream(self, kind, account_ids, fmt='csv', start_date=None, end_date=None):
+        """Sinh nội dung file xuất theo từng phần (str cho CSV, bytes cho Parquet)"""
+        frames = self._iter_frames(kind, account_ids, start_date, end_date)
+        if fmt == 'parquet':
+            return self._write_parquet(frames)
+        return self._write_csv(frames)
+
+    def _iter_frames(self, kind, account_ids, start_date, end_date):
+        for account_id in account_ids:
+            if kind == 'deals':
+                chunks = self._iter_deal_frames(account_id, start_date, end_date)
+            elif kind == 'round_trips':
+                chunks = self._iter_round_trip_frames(account_id, start_date, end_date)
+            else:
+                chunks = self._iter_rollup_frames(kind, account_id, start_date, end_date)
+            for frame in chunks:
+                if not frame.empty:
+                    frame.insert(0, 'account_id', account_id)
+                    yield frame
+
+    def _iter_deal_pages(self, account_id, start_date, end_date):
+        after = None
+        while True:
+            rows = self.db.get_deals_page(account_id, start_date, end_date, after, self.PAGE_SIZE)
+            if not rows:
+                return
+            yield rows
+            if len(rows) < self.PAGE_SIZE:
+                return
+            last = rows[-1]
+            after = (last[self.db.DEAL_COLUMNS.index('time')], last[0])
+
+    def _iter_deal_frames(self, account_id, start_date, end_date):
+        for rows in self._iter_deal_pages(account_id, start_date, end_date):
+            yield pd.DataFrame.from_records(rows, columns=self.db.DEAL_COLUMNS)
+
+    def _iter_round_trip_frames(self, account_id, start_date, end_date):
+        """Dựng round trip theo từng trang deal, mang các vị thế chưa đóng sang trang sau"""
+        lookback_start = start_date - timedelta(days=self.ENTRY_LOOKBACK_DAYS) if start_date else None
+        carry = None
+
+        for rows in self._iter_deal_pages(account_id, lookback_start, end_date):
+            frame = pd.DataFrame.from_records(rows, columns=self.db.DEAL_COLUMNS)
+            frame['time'] = pd.to_datetime(frame['time'], format='%Y-%m-%d %H:%M:%S')
+            if carry is not None:
+                frame = pd.concat([carry, frame], ignore_index=True)
+
+            round_trips = reconstruct_round_trips(frame)
+            carry = frame[
+                frame['deal_type'].isin((DEAL_TYPE_BUY, DEAL_TYPE_SELL)) &
+                (frame['position_id'].fillna(0) != 0) &
+                ~frame['position_id'].isin(round_trips['position_id'])
+            ]
+
+            if round_trips.empty:
+                # Trang chỉ có deal mở (hoặc không phải giao dịch): cột thời gian không có kiểu datetime
+                continue
+            if start_date is not None:
+                round_trips = round_trips[round_trips['close_time'] >= pd.Timestamp(start_date)]
+            yield round_trips.assign(
+                open_time=round_trips['open_time'].dt.strftime('%Y-%m-%d %H:%M:%S'),
+                close_time=round_trips['close_time'].dt.strftime('%Y-%m-%d %H:%M:%S')
+            )
+
+    def _iter_rollup_frames(self, kind, account_id, start_date, end_date):
+        if kind == 'daily':
+            rows = self.db.get_daily_account_stats(
+                account_id,
+                start_date.date().isoformat() if start_date else '0000-00-00',
+                end_date.date().isoformat() if end_date else '9999-12-31'
+            )
+        else:
+            rows = self.db.get_monthly_account_stats(
+                account_id,
+                start_date.strftime('%Y-%m') if start_date else '0000-00',
+                end_date.strftime('%Y-%m') if end_date else '9999-12'
+            )
+        frame = pd.DataFrame(rows)
+        yield frame.drop(columns=['account_id']) if not frame.empty else frame
+
+    def _write_csv(self, frames):
+        header = True
+        for frame in frames:
+            buffer = io.StringIO()
+            frame.to_csv(buffer, index=False, header=header, quoting=csv.QUOTE_MINIMAL)
+            header = False
+            yield buffer.getvalue()
+
+    def _write_parquet(self, frames):
+        """Ghi Parquet theo từng row group, trả ra các byte ngay sau mỗi nhóm"""
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+
+        sink = _ChunkSink()
+        writer = None
+        for frame in frames:
+            table = pa.Table.from_pandas(frame, preserve_index=False)
+            if writer is None:
+                writer = pq.ParquetWriter(pa.PythonFile(sink, mode='w'), table.schema)
+            else:
+                table = table.cast(writer.schema)
+            writer.write_table(table)
+            yield sink.drain()
+
+        if writer is None:
+            # Không có dữ liệu: file Parquet rỗng (không có cột)
+            writer = pq.ParquetWriter(pa.PythonFile(sink, mode='w'), pa.schema([]))
+        writer.close()
+        yield sink.drain()
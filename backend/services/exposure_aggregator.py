@@ -0,0 +1,144 @@
+import threading
+import logging
+from datetime import datetime
+
+# Thứ tự các phần tử trong một ô tổng hợp
+NET_VOLUME, LONG_VOLUME, SHORT_VOLUME, NET_NOTIONAL, FLOATING_PROFIT, POSITIONS = range(6)
+
+
+class ExposureAggregator:
+    """Tổng vị thế ròng theo symbol trên mọi tài khoản, cập nhật theo delta vị thế
+
+    Được EventBus gọi với các delta (opened/updated/closed) mà monitor và copy
+    engine phát ra, nên không gọi thêm MT5. Mỗi vị thế chỉ được cộng/trừ phần
+    đóng góp của nó vào ba mức: symbol, (symbol, tài khoản), (symbol, người dùng).
+    Các truy vấn đọc trực tiếp các ô đã cộng dồn, O(số symbol).
+    Notional = khối lượng x contract size x giá hiện tại, tính theo đồng tiền định
+    giá của symbol; mua là dương, bán là âm.
+    """
+
+    def __init__(self, db):
+        self.db = db
+        self.lock = threading.Lock()
+        self.positions = {}      # {account_id: {ticket: (symbol, đóng góp)}}
+        self.symbols = {}        # {symbol: ô tổng}
+        self.by_account = {}     # {symbol: {account_id: ô tổng}}
+        self.by_user = {}        # {symbol: {user_id: ô tổng}}
+        self.account_users = {}  # {account_id: user_id}
+        self.updated_at = {}     # {account_id: thời điểm nhận delta gần nhất}
+        self.logger = logging.getLogger('exposure_aggregator')
+
+    def apply(self, account_id, changes):
+        """Áp dụng các delta vị thế của một tài khoản (listener của EventBus)"""
+        user_id = self._user_of(account_id)
+        with self.lock:
+            positions = self.positions.setdefault(account_id, {})
+            for change in changes:
+                position = change['position']
+                old = positions.pop(position['ticket'], None)
+                if old:
+                    self._add(old[0], account_id, user_id, old[1], -1)
+                if change['action'] != 'closed':
+                    contribution = self._contribution(position)
+                    positions[position['ticket']] = (position['symbol'], contribution)
+                    self._add(position['symbol'], account_id, user_id, contribution, 1)
+            if not positions:
+                self.positions.pop(account_id, None)
+            self.updated_at[account_id] = datetime.now()
+
+    def forget_account(self, account_id):
+        """Bỏ toàn bộ vị thế của tài khoản (khi tài khoản bị xóa)"""
+        user_id = self.account_users.get(account_id)
+        with self.lock:
+            for symbol, contribution in self.positions.pop(account_id, {}).values():
+                self._add(symbol, account_id, user_id, contribution, -1)
+            self.updated_at.pop(account_id, None)
+        self.account_users.pop(account_id, None)
+
+    def get_exposure(self, user_id=None):
+        """Tổng vị thế theo symbol (toàn bộ hoặc của một người dùng), sắp theo |notional|"""
+        with self.lock:
+            if user_id is None:
+                result = [
+                    self._to_dict(cell, symbol=symbol, accounts=len(self.by_account[symbol]))
+                    for symbol, cell in self.symbols.items()
+                ]
+            else:
+                result = [
+                    self._to_dict(users[user_id], symbol=symbol)
+                    for symbol, users in self.by_user.items() if user_id in users
+                ]
+
+        result.sort(key=lambda entry: abs(entry['net_notional']), reverse=True)
+        return result
+
+    def get_symbol_exposure(self, symbol, by='account'):
+        """Chi tiết một symbol theo tài khoản hoặc người dùng; None nếu không có vị thế"""
+        if by not in ('account', 'user'):
+            raise ValueError(f"Unsupported exposure drill-down: {by}")
+
+        with self.lock:
+            cell = self.symbols.get(symbol)
+            if cell is None:
+                return None
+            key = 'account_id' if by == 'account' else 'user_id'
+            breakdown = self.by_account[symbol] if by == 'account' else self.by_user[symbol]
+            entries = [self._to_dict(item, **{key: owner}) for owner, item in breakdown.items()]
+            total = self._to_dict(cell, symbol=symbol)
+
+        if by == 'account':
+            for entry in entries:
+                updated_at = self.updated_at.get(entry['account_id'])
+                entry['updated_at'] = updated_at.isoformat() if updated_at else None
+        entries.sort(key=lambda entry: abs(entry['net_notional']), reverse=True)
+        total[by + 's'] = entries
+        return total
+
+    def _user_of(self, account_id):
+        if account_id not in self.account_users:
+            account = self.db.get_account(account_id)
+            self.account_users[account_id] = account.user_id if account else None
+        return self.account_users[account_id]
+
+    def _contribution(self, position):
+        sign = 1 if position['type'] == 'BUY' else -1
+        volume = position['volume'] or 0
+        price = position.get('current_price') or position.get('open_price') or 0
+        contract_size = position.get('contract_size') or 1
+        return (
+            sign * volume,
+            volume if sign > 0 else 0,
+            volume if sign < 0 else 0,
+            sign * volume * contract_size * price,
+            position.get('profit') or 0,
+            1
+        )
+
+    def _add(self, symbol, account_id, user_id, contribution, sign):
+        """Cộng (sign=1) hoặc trừ (sign=-1) đóng góp của một vị thế vào các ô tổng"""
+        for cells, key in (
+            (self.symbols, symbol),
+            (self.by_account.setdefault(symbol, {}), account_id),
+            (self.by_user.setdefault(symbol, {}), user_id)
+        ):
+            cell = cells.setdefault(key, [0.0] * len(contribution))
+            for i, value in enumerate(contribution):
+                cell[i] += sign * value
+            if cell[POSITIONS] <= 0:
+                # Không còn vị thế: bỏ ô để sai số cộng/trừ số thực không tích lũy
+                del cells[key]
+
+        if symbol not in self.symbols:
+            self.by_account.pop(symbol, None)
+            self.by_user.pop(symbol, None)
+
+    def _to_dict(self, cell, **labels):
+        return {
+            **labels,
+            'net_volume': round(cell[NET_VOLUME], 2),
+            'long_volume': round(cell[LONG_VOLUME], 2),
+            'short_volume': round(cell[SHORT_VOLUME], 2),
+            'net_notional': round(cell[NET_NOTIONAL], 2),
+            'floating_profit': round(cell[FLOATING_PROFIT], 2),
+            'positions': int(cell[POSITIONS])
+        }
@@ -0,0 +1,108 @@
+import os
+import shutil
+import threading
+import logging
+import numpy as np
+import pandas as pd
+
+# Kiểu lưu của từng cột deal; chuỗi dùng độ dài cố định để đọc được bằng mmap
+ARCHIVE_DTYPES = {
+    'ticket': 'int64',
+    'order_ticket': 'int64',
+    'position_id': 'int64',
+    'symbol': 'U32',
+    'type': 'U8',
+    'deal_type': 'int64',
+    'entry': 'int64',
+    'volume': 'float64',
+    'price': 'float64',
+    'time': 'datetime64[s]',
+    'profit': 'float64',
+    'commission': 'float64',
+    'swap': 'float64',
+    'fee': 'float64',
+    'magic': 'int64'
+}
+
+
+class HistoryArchive:
+    """Lưu trữ bất biến các tháng đã đóng của lịch sử deal, theo cột, đọc bằng memory map
+
+    Mỗi tài khoản một thư mục, mỗi tháng (YYYY-MM) một thư mục con chứa một
+    file .npy cho mỗi cột. File chỉ được ghi một lần (ghi vào thư mục tạm rồi
+    đổi tên) nên nhiều process có thể cùng mmap và dùng chung page cache.
+    """
+
+    def __init__(self, base_dir):
+        self.base_dir = base_dir
+        self.lock = threading.Lock()
+        self.month_index = {}  # {account_id: set các tháng đã lưu}
+        self.logger = logging.getLogger('history_archive')
+        os.makedirs(base_dir, exist_ok=True)
+
+    def _account_dir(self, account_id):
+        return os.path.join(self.base_dir, str(account_id))
+
+    def months(self, account_id):
+        """Các tháng đã được lưu trữ của tài khoản (đã sắp xếp)"""
+        with self.lock:
+            months = self.month_index.get(account_id)
+            if months is None:
+                account_dir = self._account_dir(account_id)
+                names = os.listdir(account_dir) if os.path.isdir(account_dir) else []
+                months = self.month_index[account_id] = {name for name in names if len(name) == 7}
+            return sorted(months)
+
+    def has_month(self, account_id, month):
+        return month in self.months(account_id)
+
+    def write_month(self, account_id, month, frame):
+        """Đóng băng một tháng (frame theo cột của HistoryStore). Bỏ qua nếu đã có"""
+        if self.has_month(account_id, month):
+            return False
+
+        account_dir = self._account_dir(account_id)
+        target = os.path.join(account_dir, month)
+        temp = os.path.join(account_dir, f'.{month}.{os.getpid()}.{threading.get_ident()}')
+        os.makedirs(temp, exist_ok=True)
+
+        try:
+            for column, dtype in ARCHIVE_DTYPES.items():
+                values = frame[column]
+                if dtype == 'int64':
+                    values = values.fillna(0)
+                elif dtype.startswith('U'):
+                    values = values.fillna('')
+                np.save(os.path.join(temp, f'{column}.npy'), values.to_numpy().astype(dtype))
+            os.rename(temp, target)
+        except OSError:
+            # Process khác đã lưu tháng này trước
+            shutil.rmtree(temp, ignore_errors=True)
+            if not os.path.isdir(target):
+                raise
+
+        with self.lock:
+            self.month_index.setdefault(account_id, set()).add(month)
+        return True
+
+    def read_month(self, account_id, month, start=None, end=None):
+        """Đọc một tháng (memory map), chỉ sao chép các dòng trong khoảng [start, end]"""
+        month_dir = os.path.join(self._account_dir(account_id), month)
+        columns = {
+            column: np.load(os.path.join(month_dir, f'{column}.npy'), mmap_mode='r')
+            for column in ARCHIVE_DTYPES
+        }
+
+        times = columns['time']
+        lo = np.searchsorted(times, np.datetime64(start, 's'), side='left') if start is not None else 0
+        hi = np.searchsorted(times, np.datetime64(end, 's'), side='right') if end is not None else len(times)
+
+        frame = pd.DataFrame({column: np.asarray(values[lo:hi]) for column, values in columns.items()})
+        frame['time'] = frame['time'].astype('datetime64[ns]')
+        return frame
+
+    def remove(self, account_id):
+        """Xóa toàn bộ lưu trữ của tài khoản"""
+        with self.lock:
+            self.month_index.pop(account_id, None)
+        shutil.rmtree(self._account_dir(account_id), ignore_errors=True)
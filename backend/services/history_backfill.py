@@ -0,0 +1,155 @@
+import logging
+from datetime import datetime, timedelta
+from services.job_runner import JobBudgetExceeded
+
+
+class HistoryBackfill:
+    """Nhập lịch sử ban đầu của tài khoản mới vào bảng deals, chạy nền theo từng tháng
+
+    Mỗi job đi lùi từ hiện tại về ngày bắt đầu, mỗi lần một tháng lịch, nên lịch
+    sử gần nhất có sớm nhất. Tiến độ nằm ở history_sync_state.synced_from và bảng
+    history_backfill_jobs nên job bị dừng giữa chừng (hết ngân sách, khởi động
+    lại) sẽ tiếp tục từ tháng còn thiếu. Job chạy trong JobRunner, mỗi lần tải
+    dùng chung giới hạn history_slots của MT5Service với các lần đồng bộ khác.
+    """
+
+    JOB_NAME = 'history_backfill'
+
+    def __init__(self, db, mt5_service, history_store, job_runner=None, days=365):
+        self.db = db
+        self.mt5_service = mt5_service
+        self.history_store = history_store
+        self.job_runner = job_runner
+        self.days = days
+        self.logger = logging.getLogger('history_backfill')
+
+        # Job còn dở từ lần chạy trước: sync của các tài khoản này chỉ lấy phần đuôi
+        for job in self.db.get_active_backfill_jobs():
+            self.history_store.mark_backfilling(job['account_id'])
+
+    def submit(self, account_id, days=None):
+        """Tạo job backfill cho tài khoản (hoặc trả về job đang chạy), trả về ID của job"""
+        active = self.db.get_latest_backfill_job(account_id)
+        if active and active['status'] in ('pending', 'running'):
+            return active['id']
+
+        end_date = datetime.now().replace(microsecond=0)
+        start_date = end_date - timedelta(days=days or self.days)
+        chunks_total = (end_date.year - start_date.year) * 12 + end_date.month - start_date.month + 1
+
+        job_id = self.db.create_backfill_job(account_id, start_date, end_date, chunks_total)
+        self.history_store.mark_backfilling(account_id)
+        if self.job_runner:
+            self.job_runner.run_now(self.JOB_NAME)
+        return job_id
+
+    def cancel(self, account_id):
+        """Hủy job backfill đang chạy của tài khoản (dừng ở tháng kế tiếp)"""
+        job = self.db.get_latest_backfill_job(account_id)
+        self.history_store.clear_backfilling(account_id)
+        if job and job['status'] in ('pending', 'running'):
+            self.db.update_backfill_job(job['id'], status='cancelled', finished_at=datetime.now())
+            return True
+        return False
+
+    def get_job(self, job_id):
+        """Trạng thái và tiến độ của job"""
+        job = self.db.get_backfill_job(job_id)
+        return self._to_dict(job) if job else None
+
+    def get_account_job(self, account_id):
+        """Job backfill gần nhất của tài khoản"""
+        job = self.db.get_latest_backfill_job(account_id)
+        return self._to_dict(job) if job else None
+
+    def run_pending(self, context=None):
+        """Job định kỳ: chạy tiếp các job backfill chưa xong, lần lượt từng tài khoản
+
+        Từng tài khoản một để terminal không phải đổi đăng nhập qua lại giữa các
+        tài khoản đang backfill.
+        """
+        for job in self.db.get_active_backfill_jobs():
+            if context and context.expired():
+                self.logger.info("History backfill out of budget, remaining jobs resume next run")
+                return
+            try:
+                self._run_job(job, context)
+            except JobBudgetExceeded:
+                # Hết ngân sách khi đang tổng hợp: job vẫn running, lần chạy sau làm lại bước tổng hợp
+                raise
+            except Exception as e:
+                self.logger.error(f"Error backfilling history for account {job['account_id']}: {str(e)}")
+                self.history_store.clear_backfilling(job['account_id'])
+                self.db.update_backfill_job(job['id'], status='failed', error=str(e), finished_at=datetime.now())
+
+    def _run_job(self, job, context):
+        account = self.db.get_account(job['account_id'])
+        if not account:
+            self.db.update_backfill_job(job['id'], status='cancelled', finished_at=datetime.now())
+            return
+        if not self.mt5_service.connect_account(account):
+            raise RuntimeError(f"Cannot connect to account {account.login}")
+
+        self.history_store.mark_backfilling(account.account_id)
+        if job['status'] == 'pending':
+            self.db.update_backfill_job(job['id'], status='running')
+
+        chunks_done = job['chunks_done']
+        deals_imported = job['deals_imported']
+        while True:
+            state = self.history_store.get_state(account.account_id)
+            cursor = state['synced_from'] if state else job['end_date']
+            if cursor <= job['start_date']:
+                break
+            if context and context.expired():
+                return
+            current = self.db.get_backfill_job(job['id'])
+            if not current or current['status'] != 'running':
+                # Đã bị hủy
+                return
+
+            # Một tháng lịch: từ đầu tháng chứa thời điểm ngay trước cursor
+            chunk_start = (cursor - timedelta(seconds=1)).replace(day=1, hour=0, minute=0, second=0, microsecond=0)
+            chunk_start = max(chunk_start, job['start_date'])
+
+            imported = self.history_store.extend_history(account, chunk_start)
+            if imported is None:
+                raise RuntimeError(f"Cannot fetch history for account {account.login}")
+            deals_imported += imported
+            chunks_done += 1
+            self.history_store.mark_backfilling(account.account_id)
+            self.db.update_backfill_job(
+                job['id'], backfilled_from=chunk_start,
+                chunks_done=min(chunks_done, job['chunks_total']), deals_imported=deals_imported
+            )
+
+        # Đủ lịch sử: tổng hợp lại thống kê ngày/tháng từ đầu cửa sổ
+        self.history_store.clear_backfilling(account.account_id)
+        self.db.reset_stats_watermark(account.account_id)
+        if self.history_store.sync_rollups(account, context.compute if context else None) is None:
+            raise RuntimeError(f"Cannot fetch history for account {account.login}")
+        self.db.update_backfill_job(
+            job['id'], status='completed', chunks_done=job['chunks_total'], finished_at=datetime.now()
+        )
+        self.logger.info(f"History backfill completed for account {account.account_id}: {deals_imported} deals")
+
+    def _to_dict(self, job):
+        span = (job['end_date'] - job['start_date']).total_seconds()
+        covered = (job['end_date'] - job['backfilled_from']).total_seconds() if job['backfilled_from'] else 0
+        if job['status'] == 'completed':
+            covered = span
+        return {
+            'job_id': job['id'],
+            'account_id': job['account_id'],
+            'status': job['status'],
+            'start_date': job['start_date'].isoformat(),
+            'end_date': job['end_date'].isoformat(),
+            'backfilled_from': job['backfilled_from'].isoformat() if job['backfilled_from'] else None,
+            'chunks_total': job['chunks_total'],
+            'chunks_done': job['chunks_done'],
+            'deals_imported': job['deals_imported'],
+            'progress': round(min(covered / span, 1) * 100, 2) if span else 100.0,
+            'error': job['error'],
+            'created_at': job['created_at'].isoformat() if job['created_at'] else None,
+            'finished_at': job['finished_at'].isoformat() if job['finished_at'] else None
+        }
@@ -0,0 +1,291 @@
+import threading
+import time
+import logging
+from datetime import datetime, timedelta
+import pandas as pd
+from services.round_trips import aggregate_daily_stats
+
+
+class HistoryStore:
+    """Bản sao cục bộ lịch sử deal của từng tài khoản (bảng deals)
+
+    Mỗi lần đồng bộ chỉ lấy từ MT5 phần đuôi mới kể từ deal cuối cùng đã lưu
+    (và phần đầu nếu cần cửa sổ dài hơn), các truy vấn hiệu suất đọc từ SQLite.
+    Watermark (ticket cuối cùng, số deal) dùng làm khóa cache cho kết quả tính.
+    """
+
+    # Lấy lại một đoạn chồng lên deal cuối cùng để không bỏ sót deal cùng thời điểm
+    SYNC_OVERLAP = timedelta(hours=1)
+    # Giờ của server MT5 có thể lệch với giờ máy, lấy dư về phía tương lai
+    FUTURE_MARGIN = timedelta(days=1)
+    CHUNK_DAYS = 30
+    # Khoảng lịch sử được tổng hợp vào bảng thống kê ngày/tháng ở lần đầu
+    ROLLUP_DAYS = 365
+    # Job backfill không tiến triển quá lâu (runner dừng, job treo): sync lấy lại cả cửa sổ
+    BACKFILL_STALL_TIMEOUT = 900  # seconds
+
+    def __init__(self, db, mt5_service, max_staleness=30, archive=None):
+        self.db = db
+        self.mt5_service = mt5_service
+        # Các tháng đã đóng được đọc từ lưu trữ theo cột (mmap) thay vì SQLite
+        self.archive = archive
+        self.max_staleness = max_staleness  # Seconds, bỏ qua đồng bộ nếu vừa đồng bộ xong
+        self.lock = threading.Lock()
+        self.account_locks = {}  # {account_id: RLock} để không đồng bộ một tài khoản hai lần cùng lúc
+        # Tài khoản đang được job backfill nhập phần đầu lịch sử: sync chỉ lấy phần đuôi
+        self.backfilling = {}  # {account_id: lần cuối job backfill tiến triển (monotonic)}
+        self.logger = logging.getLogger('history_store')
+
+    def _account_lock(self, account_id):
+        with self.lock:
+            return self.account_locks.setdefault(account_id, threading.RLock())
+
+    def mark_backfilling(self, account_id):
+        """Ghi nhận job backfill của tài khoản đang chạy (gọi mỗi lần job tiến triển)"""
+        with self.lock:
+            self.backfilling[account_id] = time.monotonic()
+
+    def clear_backfilling(self, account_id):
+        with self.lock:
+            self.backfilling.pop(account_id, None)
+
+    def is_backfilling(self, account_id):
+        """Tài khoản còn được job backfill nhập phần đầu; bỏ cờ nếu job không tiến triển quá lâu"""
+        with self.lock:
+            marked = self.backfilling.get(account_id)
+            if marked is None:
+                return False
+            if time.monotonic() - marked < self.BACKFILL_STALL_TIMEOUT:
+                return True
+            del self.backfilling[account_id]
+        self.logger.warning(f"History backfill of account {account_id} stalled, syncing the full window")
+        return False
+
+    def sync(self, account, start_date=None, force=False):
+        """Đồng bộ lịch sử của tài khoản từ start_date tới hiện tại
+
+        Trả về watermark (last_deal_ticket, deal_count) sau khi đồng bộ, hoặc None
+        nếu không lấy được lịch sử từ MT5 (trạng thái đồng bộ giữ nguyên).
+        """
+        now = datetime.now()
+        start_date = start_date or now - timedelta(days=30)
+
+        with self._account_lock(account.account_id):
+            state = self.db.get_history_sync_state(account.account_id)
+
+            if self.is_backfilling(account.account_id):
+                # Phần đầu do job backfill lấy dần theo tháng, không tải cả năm trên thread gọi
+                start_date = max(start_date, state['synced_from'] if state else now - timedelta(days=self.CHUNK_DAYS))
+
+            if (not force and state and state['synced_from'] <= start_date and state['synced_at']
+                    and (now - state['synced_at']).total_seconds() < self.max_staleness):
+                return self._watermark(state)
+
+            ranges = []
+            if not state:
+                ranges.append((start_date, now + self.FUTURE_MARGIN))
+            else:
+                if start_date < state['synced_from']:
+                    # Cần cửa sổ dài hơn phần đã đồng bộ -> lấy thêm phần đầu
+                    ranges.append((start_date, state['synced_from']))
+                tail_start = min(state['last_deal_time'] or state['synced_to'], state['synced_to'])
+                ranges.append((tail_start - self.SYNC_OVERLAP, now + self.FUTURE_MARGIN))
+
+            for range_start, range_end in ranges:
+                if self._import_range(account, range_start, range_end) is None:
+                    return None
+
+            summary = self.db.get_deal_summary(account.account_id)
+            state = {
+                'account_id': account.account_id,
+                'synced_from': min(start_date, state['synced_from']) if state else start_date,
+                'synced_to': now,
+                'last_deal_time': summary['last_deal_time'],
+                'last_deal_ticket': summary['last_deal_ticket'],
+                'deal_count': summary['deal_count'],
+                'synced_at': now
+            }
+            self.db.save_history_sync_state(state)
+            return self._watermark(state)
+
+    def extend_history(self, account, start_date):
+        """Mở rộng lịch sử cục bộ về phía trước tới start_date (một đoạn của job backfill)
+
+        Chỉ lấy khoảng [start_date, synced_from) còn thiếu; lần đầu lấy từ
+        start_date tới hiện tại. Trả về số deal đã nhập, hoặc None nếu không lấy
+        được lịch sử từ MT5 (synced_from giữ nguyên).
+        """
+        now = datetime.now()
+        with self._account_lock(account.account_id):
+            state = self.db.get_history_sync_state(account.account_id)
+            if state and state['synced_from'] <= start_date:
+                return 0
+
+            range_end = state['synced_from'] if state else now + self.FUTURE_MARGIN
+            imported = self._import_range(account, start_date, range_end)
+            if imported is None:
+                return None
+
+            summary = self.db.get_deal_summary(account.account_id)
+            self.db.save_history_sync_state({
+                'account_id': account.account_id,
+                'synced_from': start_date,
+                'synced_to': state['synced_to'] if state else now,
+                'last_deal_time': summary['last_deal_time'],
+                'last_deal_ticket': summary['last_deal_ticket'],
+                'deal_count': summary['deal_count'],
+                'synced_at': state['synced_at'] if state else now
+            })
+            return imported
+
+    def sync_rollups(self, account, compute=None):
+        """Cộng các giao dịch được đóng bởi deal mới vào daily/monthly_account_stats
+        
+        Chỉ các vị thế có deal sau watermark thống kê được dựng lại. compute: hàm
+        chạy phần tổng hợp (ví dụ JobContext.compute), mặc định chạy tại chỗ.
+        Trả về số giao dịch mới được tổng hợp, hoặc None nếu không lấy được lịch
+        sử từ MT5 (thống kê và watermark giữ nguyên).
+        """
+        account_id = account.account_id
+        with self._account_lock(account_id):
+            watermark = self.db.get_stats_watermark(account_id)
+            
+            reset_from = None
+            if watermark and watermark['synced_from'] and watermark['last_deal_time']:
+                from_date = watermark['last_deal_time']
+                last_ticket = watermark['last_deal_ticket']
+            else:
+                # Lần đầu (hoặc thống kê tạo trước khi có bảng tháng): tổng hợp lại cả cửa sổ
+                from_date = reset_from = datetime.now() - timedelta(days=self.ROLLUP_DAYS)
+                last_ticket = 0
+                
+            # Chỉ lấy phần đuôi mới từ MT5 vào lịch sử cục bộ
+            if self.sync(account, from_date) is None:
+                return None
+            state = self.db.get_history_sync_state(account_id)
+            
+            if not state or state['last_deal_ticket'] <= last_ticket:
+                if reset_from or not watermark:
+                    self.db.apply_daily_account_stats(account_id, [], from_date, last_ticket, reset_from)
+                else:
+                    self.db.touch_stats_watermark(account_id)
+                return 0
+                
+            # Toàn bộ deal của các vị thế có deal mới (kể cả deal mở trước watermark)
+            deals = self.load_position_frame(account_id, last_ticket, from_date)
+            compute = compute or (lambda fn, *args: fn(*args))
+            daily_rows = compute(aggregate_daily_stats, deals, last_ticket)
+            
+            self.db.apply_daily_account_stats(
+                account_id, daily_rows, state['last_deal_time'], state['last_deal_ticket'], reset_from
+            )
+            return sum(row['total_trades'] for row in daily_rows)
+    
+    def _import_range(self, account, start_date, end_date):
+        """Lấy một khoảng lịch sử từ MT5 theo từng đoạn và lưu vào bảng deals
+        
+        Trả về số deal đã nhập, hoặc None nếu một đoạn lấy lỗi: khoảng chưa được
+        nhập đủ nên người gọi không được dời trạng thái đồng bộ.
+        """
+        imported = 0
+        for deals in self.mt5_service.iter_order_history(
+            account.account_id, start_date, end_date, account, chunk_days=self.CHUNK_DAYS
+        ):
+            if deals is None:
+                self.logger.warning(
+                    f"Failed to fetch history for account {account.account_id}, sync state left unchanged"
+                )
+                return None
+            imported += self.db.save_deals(account.account_id, deals)
+        return imported
+
+    def _watermark(self, state):
+        return (state['last_deal_ticket'], state['deal_count'])
+
+    def get_watermark(self, account_id):
+        """Watermark hiện tại của lịch sử cục bộ (không gọi MT5)"""
+        state = self.db.get_history_sync_state(account_id)
+        return self._watermark(state) if state else (0, 0)
+
+    def get_state(self, account_id):
+        """Trạng thái đồng bộ (ticket, thời gian deal cuối cùng...) của tài khoản"""
+        return self.db.get_history_sync_state(account_id)
+
+    def load_frame(self, account_id, start_date=None, end_date=None):
+        """Đọc lịch sử cục bộ thành DataFrame đã sắp xếp theo thời gian
+        
+        Các tháng đã lưu trữ được đọc từ HistoryArchive, phần còn lại từ SQLite.
+        """
+        months = self.archive.months(account_id) if self.archive else []
+        if not months:
+            return self._to_frame(self.db.get_deals(account_id, start_date, end_date))
+            
+        parts = []
+        cursor = start_date
+        for month in months:
+            month_start = datetime.strptime(month, '%Y-%m')
+            month_end = (pd.Timestamp(month_start) + pd.offsets.MonthBegin(1)).to_pydatetime() - timedelta(seconds=1)
+            if (start_date and month_end < start_date) or (end_date and month_start > end_date):
+                continue
+            if cursor is None or cursor < month_start:
+                parts.append(self._to_frame(self.db.get_deals(account_id, cursor, month_start - timedelta(seconds=1))))
+            parts.append(self.archive.read_month(
+                account_id, month, max(cursor, month_start) if cursor else None, end_date
+            ))
+            cursor = month_end + timedelta(seconds=1)
+            
+        if end_date is None or cursor is None or cursor <= end_date:
+            parts.append(self._to_frame(self.db.get_deals(account_id, cursor, end_date)))
+            
+        parts = [part for part in parts if not part.empty]
+        if not parts:
+            return self._to_frame([])
+        return pd.concat(parts, ignore_index=True)[self.db.DEAL_COLUMNS]
+    
+    def archive_all_accounts(self, context=None):
+        """Job định kỳ: lưu trữ các tháng đã đóng của mọi tài khoản"""
+        for account in self.db.get_all_accounts():
+            if context and context.expired():
+                self.logger.warning("History archive job out of budget, remaining accounts deferred")
+                return
+            try:
+                self.archive_closed_months(account.account_id)
+            except Exception as e:
+                self.logger.error(f"Error archiving history for account {account.account_id}: {str(e)}")
+    
+    def archive_closed_months(self, account_id):
+        """Đóng băng các tháng đã đồng bộ đầy đủ và đã kết thúc vào HistoryArchive
+        
+        Một tháng được lưu khi nằm trọn trong khoảng đã đồng bộ và kết thúc trước
+        lần đồng bộ gần nhất (trừ đi đoạn chồng lấn). Trả về số tháng mới lưu.
+        """
+        if not self.archive:
+            return 0
+        state = self.db.get_history_sync_state(account_id)
+        if not state or not state['synced_from'] or not state['synced_to']:
+            return 0
+            
+        first_month = pd.Timestamp(state['synced_from']).to_period('M')
+        if pd.Timestamp(state['synced_from']) > first_month.start_time:
+            first_month += 1
+        closed_before = state['synced_to'] - self.SYNC_OVERLAP
+        
+        archived = 0
+        month = first_month
+        while month.end_time.floor('s').to_pydatetime() < closed_before:
+            name = str(month)
+            if not self.archive.has_month(account_id, name):
+                deals = self.db.get_deals(account_id, month.start_time.to_pydatetime(), month.end_time.floor('s').to_pydatetime())
+                self.archive.write_month(account_id, name, self._to_frame(deals))
+                archived += 1
+            month += 1
+        return archived
+
+    def load_position_frame(self, account_id, after_ticket, from_date):
+        """Đọc mọi deal của các vị thế có deal mới sau after_ticket"""
+        return self._to_frame(self.db.get_position_deals_since(account_id, after_ticket, from_date))
+
+    def _to_frame(self, rows):
+        df = pd.DataFrame.from_records(rows, columns=self.db.DEAL_COLUMNS)
+        df['time'] = pd.to_datetime(df['time'], format='%Y-%m-%d %H:%M:%S')
+        return df
@@ -0,0 +1,182 @@
+import threading
+import time
+import logging
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, TimeoutError as FuturesTimeout
+from utils.ticker import DeadlineTicker
+
+
+class JobBudgetExceeded(Exception):
+    """Job chạy quá ngân sách thời gian được cấp"""
+
+
+class JobContext:
+    """Ngữ cảnh của một lần chạy job: ngân sách thời gian và process pool"""
+
+    def __init__(self, runner, name, budget=None):
+        self.runner = runner
+        self.name = name
+        self.budget = budget
+        self.deadline = time.monotonic() + budget if budget else None
+
+    def time_left(self):
+        if self.deadline is None:
+            return None
+        return max(self.deadline - time.monotonic(), 0)
+
+    def expired(self):
+        return self.deadline is not None and time.monotonic() >= self.deadline
+
+    def compute(self, fn, *args, **kwargs):
+        """Chạy hàm tính toán nặng trong process pool, giới hạn bởi ngân sách còn lại
+
+        fn phải là hàm cấp module (picklable) và không được gọi MT5 - terminal
+        chỉ tồn tại trong process chính.
+        """
+        if self.expired():
+            raise JobBudgetExceeded(f"Job {self.name} exceeded its {self.budget}s budget")
+
+        future = self.runner.submit_process(fn, *args, **kwargs)
+        try:
+            return future.result(timeout=self.time_left())
+        except FuturesTimeout:
+            future.cancel()
+            raise JobBudgetExceeded(f"Job {self.name} exceeded its {self.budget}s budget")
+
+
+class JobRunner:
+    """Chạy các job định kỳ nặng (thống kê, tổng hợp hiệu suất, backfill) ngoài thread giám sát
+
+    Mỗi job chạy trong thread riêng của runner; phần tính toán CPU được đẩy sang
+    process pool qua JobContext.compute. Một job không bao giờ chạy chồng lên
+    chính nó.
+    """
+
+    def __init__(self, config=None):
+        config = config or {}
+        self.process_workers = config.get('process_workers', 2)
+        self.thread_workers = config.get('thread_workers', 2)
+        self.poll_interval = config.get('poll_interval', 1)
+        self.jobs = {}  # {name: thông tin job}
+        self.lock = threading.Lock()
+        self.process_pool = None
+        self.thread_pool = None
+        self.scheduler_thread = None
+        self.ticker = None
+        self.is_running = False
+        self.logger = logging.getLogger('job_runner')
+
+    def register(self, name, func, interval, budget=None):
+        """Đăng ký job định kỳ. func nhận một JobContext làm tham số"""
+        with self.lock:
+            self.jobs[name] = {
+                'func': func,
+                'interval': interval,
+                'budget': budget,
+                'next_run': time.monotonic(),
+                'running': False,
+                'runs': 0,
+                'timeouts': 0,
+                'failures': 0,
+                'last_started': None,
+                'last_duration': None,
+                'last_error': None
+            }
+
+    def start(self):
+        if self.is_running:
+            return
+
+        self.is_running = True
+        self.thread_pool = ThreadPoolExecutor(max_workers=self.thread_workers)
+        self.ticker = DeadlineTicker(self.poll_interval)
+        self.scheduler_thread = threading.Thread(target=self._scheduler_loop)
+        self.scheduler_thread.daemon = True
+        self.scheduler_thread.start()
+        self.logger.info("Job runner started")
+
+    def stop(self):
+        self.is_running = False
+        if self.ticker:
+            self.ticker.stop()
+        if self.scheduler_thread:
+            self.scheduler_thread.join(timeout=5)
+            self.scheduler_thread = None
+        if self.thread_pool:
+            self.thread_pool.shutdown(wait=False)
+            self.thread_pool = None
+        if self.process_pool:
+            self.process_pool.shutdown(wait=False)
+            self.process_pool = None
+        self.logger.info("Job runner stopped")
+
+    def submit_process(self, fn, *args, **kwargs):
+        """Đưa một hàm tính toán vào process pool (khởi tạo khi dùng lần đầu)"""
+        with self.lock:
+            if self.process_pool is None:
+                self.process_pool = ProcessPoolExecutor(max_workers=self.process_workers)
+            pool = self.process_pool
+        return pool.submit(fn, *args, **kwargs)
+
+    def run_now(self, name):
+        """Đưa job vào hàng chạy ngay ở nhịp kế tiếp"""
+        with self.lock:
+            if name not in self.jobs:
+                return False
+            self.jobs[name]['next_run'] = time.monotonic()
+            return True
+
+    def _scheduler_loop(self):
+        while self.is_running and self.ticker.wait():
+            now = time.monotonic()
+            with self.lock:
+                due = [
+                    name for name, job in self.jobs.items()
+                    if not job['running'] and job['next_run'] <= now
+                ]
+                for name in due:
+                    self.jobs[name]['running'] = True
+
+            for name in due:
+                try:
+                    self.thread_pool.submit(self._run_job, name)
+                except RuntimeError:
+                    # Pool đã đóng trong lúc dừng runner
+                    with self.lock:
+                        self.jobs[name]['running'] = False
+
+    def _run_job(self, name):
+        job = self.jobs[name]
+        context = JobContext(self, name, job['budget'])
+        started = time.monotonic()
+        job['last_started'] = time.time()
+        error = None
+
+        try:
+            job['func'](context)
+        except JobBudgetExceeded as e:
+            error = str(e)
+            job['timeouts'] += 1
+            self.logger.warning(error)
+        except Exception as e:
+            error = str(e)
+            job['failures'] += 1
+            self.logger.error(f"Error running job {name}: {error}")
+
+        duration = time.monotonic() - started
+        with self.lock:
+            job['runs'] += 1
+            job['last_duration'] = duration
+            job['last_error'] = error
+            job['next_run'] = started + job['interval']
+            job['running'] = False
+
+    def get_status(self):
+        """Trạng thái các job đã đăng ký"""
+        with self.lock:
+            return {
+                name: {
+                    key: value for key, value in job.items()
+                    if key not in ('func', 'next_run')
+                }
+                for name, job in self.jobs.items()
+            }
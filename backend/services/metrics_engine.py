@@ -0,0 +1,102 @@
+import numpy as np
+
+# Số kỳ giao dịch trong năm để quy đổi Sharpe/Sortino theo năm (dữ liệu theo ngày)
+PERIODS_PER_YEAR = 252
+
+
+def _max_run(mask):
+    """Độ dài chuỗi True liên tiếp dài nhất trong mảng boolean"""
+    if not mask.any():
+        return 0
+    padded = np.concatenate(([0], mask.astype(np.int8), [0]))
+    edges = np.diff(padded)
+    starts = np.flatnonzero(edges == 1)
+    ends = np.flatnonzero(edges == -1)
+    return int((ends - starts).max())
+
+
+def _ratio(numerator, denominator, default=0.0):
+    if denominator == 0:
+        return default
+    return float(numerator / denominator)
+
+
+def drawdown_series(equity):
+    """Drawdown tuyệt đối và phần trăm so với đỉnh trước đó của đường equity"""
+    equity = np.asarray(equity, dtype=float)
+    running_max = np.maximum.accumulate(equity)
+    drawdown = running_max - equity
+    with np.errstate(divide='ignore', invalid='ignore'):
+        drawdown_pct = np.where(running_max > 0, drawdown / running_max * 100, 0.0)
+    return drawdown, drawdown_pct
+
+
+def compute_metrics(pnl, equity=None, initial_balance=0.0, periods_per_year=PERIODS_PER_YEAR):
+    """Tính bộ chỉ số rủi ro/lợi nhuận từ mảng P&L từng giao dịch và đường equity
+
+    pnl: P&L ròng của từng giao dịch theo thứ tự thời gian.
+    equity: equity theo từng kỳ (ví dụ cuối ngày). Nếu không có, dùng
+        initial_balance cộng dồn pnl theo từng giao dịch.
+    """
+    pnl = np.asarray(pnl, dtype=float)
+    if equity is None:
+        equity = initial_balance + np.concatenate(([0.0], np.cumsum(pnl)))
+    equity = np.asarray(equity, dtype=float)
+
+    total_trades = int(pnl.size)
+    wins = pnl > 0
+    losses = pnl < 0
+    winning_trades = int(wins.sum())
+    losing_trades = int(losses.sum())
+    gross_profit = float(pnl[wins].sum())
+    gross_loss = float(pnl[losses].sum())
+    net_profit = gross_profit + gross_loss
+
+    # Có lãi mà không có lệnh lỗ: profit factor không xác định (None, không phải vô cực)
+    no_losses = losing_trades == 0 and gross_profit > 0
+
+    avg_win = _ratio(gross_profit, winning_trades)
+    avg_loss = _ratio(gross_loss, losing_trades)
+    win_rate = _ratio(winning_trades, total_trades) * 100
+
+    # Lợi nhuận theo kỳ từ đường equity
+    if equity.size > 1:
+        previous = equity[:-1]
+        with np.errstate(divide='ignore', invalid='ignore'):
+            returns = np.where(previous > 0, np.diff(equity) / previous, 0.0)
+    else:
+        returns = np.zeros(0)
+
+    mean_return = float(returns.mean()) if returns.size else 0.0
+    std_return = float(returns.std(ddof=1)) if returns.size > 1 else 0.0
+    downside = np.minimum(returns, 0.0)
+    downside_deviation = float(np.sqrt((downside ** 2).mean())) if returns.size else 0.0
+    annualize = float(np.sqrt(periods_per_year))
+
+    drawdown, drawdown_pct = drawdown_series(equity) if equity.size else (np.zeros(0), np.zeros(0))
+    max_drawdown = float(drawdown.max()) if drawdown.size else 0.0
+    max_drawdown_pct = float(drawdown_pct.max()) if drawdown_pct.size else 0.0
+
+    return {
+        'total_trades': total_trades,
+        'winning_trades': winning_trades,
+        'losing_trades': losing_trades,
+        'win_rate': round(win_rate, 2),
+        'gross_profit': round(gross_profit, 2),
+        'gross_loss': round(gross_loss, 2),
+        'net_profit': round(net_profit, 2),
+        'profit_factor': None if no_losses else round(_ratio(gross_profit, abs(gross_loss)), 2),
+        'no_losses': no_losses,
+        'expectancy': round(_ratio(net_profit, total_trades), 2),
+        'average_win': round(avg_win, 2),
+        'average_loss': round(avg_loss, 2),
+        'payoff_ratio': round(_ratio(avg_win, abs(avg_loss)), 2),
+        'max_consecutive_wins': _max_run(wins),
+        'max_consecutive_losses': _max_run(losses),
+        'sharpe_ratio': round(_ratio(mean_return, std_return) * annualize, 2),
+        'sortino_ratio': round(_ratio(mean_return, downside_deviation) * annualize, 2),
+        'max_drawdown': round(max_drawdown, 2),
+        'max_drawdown_percent': round(max_drawdown_pct, 2),
+        'recovery_factor': round(_ratio(net_profit, max_drawdown), 2),
+        'time_in_drawdown': round(_ratio(int((drawdown > 0).sum()), drawdown.size) * 100, 2)
+    }
@@ -0,0 +1,55 @@
+import numpy as np
+
+# Các phân vị được báo cáo cho mỗi phân phối
+PERCENTILES = [5, 25, 50, 75, 95]
+
+
+def simulate_batch(pnl, start_balance, n_paths, n_trades, ruin_balance, target_balance, seed):
+    """Mô phỏng một lô đường equity bằng cách lấy mẫu lại (bootstrap) P&L từng giao dịch
+
+    Hàm cấp module để chạy được trong process pool. seed: số nguyên hoặc
+    np.random.SeedSequence, cùng seed cho cùng kết quả.
+    Trả về (ruined, max_drawdown_percent, trades_to_target, final_balance)
+    cho từng đường; trades_to_target = -1 nếu không chạm mục tiêu.
+    """
+    rng = np.random.default_rng(seed)
+    pnl = np.asarray(pnl, dtype=float)
+
+    samples = pnl[rng.integers(0, pnl.size, size=(n_paths, n_trades))]
+    equity = start_balance + np.cumsum(samples, axis=1)
+    equity = np.hstack((np.full((n_paths, 1), float(start_balance)), equity))
+
+    running_max = np.maximum.accumulate(equity, axis=1)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        drawdown_pct = np.where(running_max > 0, (running_max - equity) / running_max * 100, 0.0)
+
+    ruined = (equity <= ruin_balance).any(axis=1)
+    reached = equity >= target_balance
+    trades_to_target = np.where(reached.any(axis=1), reached.argmax(axis=1), -1)
+
+    return ruined, drawdown_pct.max(axis=1), trades_to_target, equity[:, -1]
+
+
+def summarize(batches, start_balance):
+    """Gộp kết quả các lô thành xác suất và phân vị"""
+    ruined = np.concatenate([batch[0] for batch in batches])
+    max_drawdown = np.concatenate([batch[1] for batch in batches])
+    trades_to_target = np.concatenate([batch[2] for batch in batches])
+    final_balance = np.concatenate([batch[3] for batch in batches])
+    hit = trades_to_target[trades_to_target >= 0]
+
+    def percentiles(values):
+        if values.size == 0:
+            return None
+        return {f'p{p}': round(float(v), 2) for p, v in zip(PERCENTILES, np.percentile(values, PERCENTILES))}
+
+    return {
+        'simulations': int(ruined.size),
+        'risk_of_ruin': round(float(ruined.mean()) * 100, 2),
+        'target_probability': round(hit.size / ruined.size * 100, 2),
+        'expected_max_drawdown': round(float(max_drawdown.mean()), 2),
+        'max_drawdown_percentiles': percentiles(max_drawdown),
+        'trades_to_target_percentiles': percentiles(hit),
+        'final_balance_percentiles': percentiles(final_balance),
+        'start_balance': round(float(start_balance), 2)
+    }
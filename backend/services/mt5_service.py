@@ -7,9 +7,14 @@ from datetime import datetime, timedelta
 import pandas as pd
 
 class MT5Service:
-    def __init__(self):
+    def __init__(self, history_concurrency=1):
         self.connected_accounts = {}  # {account_id: {mt5_instance, login, is_connected}}
-        self.lock = threading.Lock()
+        # Khóa terminal: MT5 chỉ đăng nhập một tài khoản tại một thời điểm
+        self.lock = threading.RLock()
+        # Số lần tải lịch sử theo đoạn được chờ terminal cùng lúc (đồng bộ, backfill),
+        # để monitor và copy trade không phải xếp hàng sau nhiều lần tải lịch sử
+        self.history_slots = threading.BoundedSemaphore(history_concurrency)
+        self.contract_sizes = {}  # {symbol: contract size}, không đổi trong phiên
         self.logger = logging.getLogger('mt5_service')
         
     def initialize_mt5(self):
@@ -105,19 +110,19 @@ class MT5Service:
         }
     
     def get_open_positions(self, account_id, account=None):
-        """Lấy danh sách vị thế mở"""
+        """Lấy danh sách vị thế mở, None nếu không đăng nhập được hoặc MT5 trả về lỗi"""
         # Kiểm tra và kết nối tài khoản nếu cần
         if not self.check_connection(account_id):
             if not account:
-                return []
+                return None
             if not self.connect_account(account):
-                return []
+                return None
         
         # Lấy tất cả vị thế mở
         positions = mt5.positions_get()
         if positions is None:
             self.logger.error(f"No positions found for account {account_id}! Error: {mt5.last_error()}")
-            return []
+            return None
             
         # Chuyển đổi thành danh sách các dictionary
         result = []
@@ -132,20 +137,56 @@ class MT5Service:
                 'current_price': position.price_current,
                 'sl': position.sl,
                 'tp': position.tp,
-                'profit': position.profit
+                'profit': position.profit,
+                'contract_size': self.get_contract_size(position.symbol)
             })
             
         return result
     
-    def get_order_history(self, account_id, from_date, to_date=None, account=None):
-        """Lấy lịch sử giao dịch"""
-        # Kiểm tra và kết nối tài khoản nếu cần
-        if not self.check_connection(account_id):
-            if not account:
-                return []
-            if not self.connect_account(account):
-                return []
+    def get_contract_size(self, symbol):
+        """Contract size của symbol (lưu lại sau lần hỏi đầu tiên), 1 nếu không lấy được"""
+        contract_size = self.contract_sizes.get(symbol)
+        if contract_size is None:
+            info = mt5.symbol_info(symbol)
+            if info is None:
+                return 1.0
+            contract_size = self.contract_sizes[symbol] = info.trade_contract_size
+        return contract_size
+    
+    # Khung thời gian của nến: (hằng số MT5, số giây)
+    TIMEFRAMES = {
+        'M1': ('TIMEFRAME_M1', 60),
+        'M5': ('TIMEFRAME_M5', 300),
+        'M15': ('TIMEFRAME_M15', 900),
+        'M30': ('TIMEFRAME_M30', 1800),
+        'H1': ('TIMEFRAME_H1', 3600),
+        'H4': ('TIMEFRAME_H4', 14400),
+        'D1': ('TIMEFRAME_D1', 86400),
+        'W1': ('TIMEFRAME_W1', 604800)
+    }
+    
+    def get_rates(self, symbol, timeframe, from_time, to_time):
+        """Lấy nến OHLC của symbol trong khoảng [from_time, to_time] (epoch giây)
         
+        Dữ liệu thị trường không phụ thuộc tài khoản nên dùng tài khoản đang đăng
+        nhập, không đổi đăng nhập. Trả về mảng NumPy có cấu trúc của MT5 (time,
+        open, high, low, close, tick_volume, spread, real_volume) hoặc None.
+        """
+        constant = getattr(mt5, self.TIMEFRAMES[timeframe][0])
+        
+        with self.lock:
+            if not mt5.terminal_info():
+                if not self.initialize_mt5():
+                    return None
+            mt5.symbol_select(symbol, True)
+            rates = mt5.copy_rates_range(symbol, constant, int(from_time), int(to_time))
+            
+        if rates is None:
+            self.logger.error(f"Failed to get {timeframe} rates for {symbol}! Error: {mt5.last_error()}")
+        return rates
+    
+    def get_order_history(self, account_id, from_date, to_date=None, account=None):
+        """Lấy lịch sử giao dịch, None nếu không đăng nhập được hoặc MT5 trả về lỗi"""
         # Thiết lập thời gian
         if not to_date:
             to_date = datetime.now()
@@ -154,11 +195,21 @@ class MT5Service:
         from_timestamp = int(from_date.timestamp())
         to_timestamp = int(to_date.timestamp())
         
-        # Lấy lịch sử giao dịch
-        history = mt5.history_deals_get(from_timestamp, to_timestamp)
+        # Giữ khóa terminal từ lúc đăng nhập tới khi lấy xong lịch sử
+        with self.lock:
+            # Kiểm tra và kết nối tài khoản nếu cần
+            if not self.check_connection(account_id):
+                if not account:
+                    return None
+                if not self.connect_account(account):
+                    return None
+            
+            # Lấy lịch sử giao dịch
+            history = mt5.history_deals_get(from_timestamp, to_timestamp)
+            
         if history is None:
             self.logger.error(f"No history found for account {account_id}! Error: {mt5.last_error()}")
-            return []
+            return None
             
         # Chuyển đổi thành danh sách các dictionary
         result = []
@@ -173,11 +224,34 @@ class MT5Service:
                 'profit': deal.profit,
                 'commission': deal.commission,
                 'swap': deal.swap,
-                'fee': deal.fee
+                'fee': deal.fee,
+                'order': deal.order,
+                'position_id': deal.position_id,
+                'entry': deal.entry,        # DEAL_ENTRY_IN / OUT / INOUT / OUT_BY
+                'deal_type': deal.type,     # Loại deal gốc (BUY, SELL, BALANCE, ...)
+                'magic': deal.magic
             })
             
         return result
     
+    def iter_order_history(self, account_id, from_date, to_date=None, account=None, chunk_days=7):
+        """Lấy lịch sử giao dịch theo từng đoạn thời gian
+        
+        Mỗi đoạn là một lần giữ khóa terminal ngắn, giữa các đoạn monitor và
+        copy trade có thể dùng terminal. Số đoạn đang chờ terminal cùng lúc bị
+        giới hạn bởi history_slots. Đoạn lấy lỗi được trả về là None.
+        """
+        if not to_date:
+            to_date = datetime.now()
+            
+        chunk_start = from_date
+        while chunk_start < to_date:
+            chunk_end = min(chunk_start + timedelta(days=chunk_days), to_date)
+            with self.history_slots:
+                deals = self.get_order_history(account_id, chunk_start, chunk_end, account)
+            yield deals
+            chunk_start = chunk_end
+    
     def open_order(self, account_id, symbol, order_type, volume, price=None, sl=None, tp=None, account=None):
         """Mở lệnh giao dịch mới"""
         # Kiểm tra và kết nối tài khoản nếu cần
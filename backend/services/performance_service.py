@@ -2,37 +2,152 @@
 
 import pandas as pd
 import numpy as np
+import threading
+import logging
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from datetime import datetime, timedelta
+from services.history_store import HistoryStore
+from services.metrics_engine import compute_metrics, drawdown_series
+from services.round_trips import reconstruct_round_trips, breakdown_round_trips
+from services.monte_carlo import simulate_batch, summarize
+from services.copy_simulator import simulate_copy_grid
+from utils.result_cache import ResultCache
 
 class PerformanceService:
-    def __init__(self, db, mt5_service):
+    def __init__(self, db, mt5_service, history_store=None, compare_workers=4, drawdown_tracker=None,
+                 result_cache=None, job_runner=None, monte_carlo_max_simulations=100000,
+                 monte_carlo_max_trades=10000, monte_carlo_max_steps=50000000):
         self.db = db
         self.mt5_service = mt5_service
+        self.history_store = history_store or HistoryStore(db, mt5_service)
+        # Drawdown theo equity được monitor cập nhật liên tục (đọc ngay, không tính lại)
+        self.drawdown_tracker = drawdown_tracker
+        # Lấy lịch sử song song khi so sánh; truy cập terminal vẫn được khóa của MT5Service giới hạn
+        self.executor = ThreadPoolExecutor(max_workers=compare_workers)
+        # Cache chỉ số theo tài khoản: {account_id: (khóa watermark, metrics)}
+        self.metrics_cache = {}
+        # Cache kết quả của các endpoint theo (endpoint, tham số, phiên bản dữ liệu)
+        self.result_cache = result_cache or ResultCache()
+        # Process pool của JobRunner cho các mô phỏng nặng (chạy tại chỗ nếu không có)
+        self.job_runner = job_runner
+        self.monte_carlo_max_simulations = monte_carlo_max_simulations
+        self.monte_carlo_max_trades = monte_carlo_max_trades
+        # Mỗi lô cấp phát vài mảng số đường x số giao dịch: giới hạn tích của hai số
+        self.monte_carlo_max_steps = monte_carlo_max_steps
+        self.lock = threading.Lock()
+        self.logger = logging.getLogger('performance_service')
         
-    def calculate_daily_performance(self, account_id, days=30):
-        """Tính toán hiệu suất hàng ngày trong khoảng thời gian"""
-        # Lấy tài khoản
-        account = self.db.get_account(account_id)
-        if not account:
+    # Số đường equity trong một lô mô phỏng Monte Carlo
+    MONTE_CARLO_BATCH = 1000
+    # Số bộ cài đặt tối đa trong một lần mô phỏng copy
+    COPY_SIMULATION_MAX_GRID = 1000
+    
+    # Cửa sổ lịch sử của từng chỉ số
+    DRAWDOWN_DAYS = 365
+    METRICS_DAYS = 90
+    RISK_DAYS = 365
+    
+    # Lấy thêm lịch sử trước cửa sổ để có deal mở của các vị thế đóng trong cửa sổ
+    ENTRY_LOOKBACK_DAYS = 30
+    
+    # Trường của Account dùng để nhóm danh mục
+    PORTFOLIO_GROUPS = {
+        'user': 'user_id',
+        'server': 'server',
+        'group': 'group_name'
+    }
+    
+    def get_result_key(self, endpoint, account_ids, params=None, days=None, live=False):
+        """Khóa cache của một kết quả: endpoint, tham số và phiên bản dữ liệu của từng tài khoản
+        
+        Phiên bản gồm watermark lịch sử sau khi đồng bộ phần đuôi (và lần cập nhật
+        cuối của tài khoản nếu kết quả chứa số dư/equity hiện tại). Trả về None
+        nếu không có tài khoản nào tồn tại.
+        """
+        days = days or self.RISK_DAYS
+        start_date = datetime.now() - timedelta(days=days + self.ENTRY_LOOKBACK_DAYS)
+        
+        def version(account_id):
+            account = self.db.get_account(account_id)
+            if not account:
+                return (account_id, None)
+            # MT5 lỗi: dùng watermark của lịch sử cục bộ hiện có
+            watermark = self.history_store.sync(account, start_date) or self.history_store.get_watermark(account_id)
+            return (account_id, watermark, account.last_update if live else None)
+            
+        account_ids = list(dict.fromkeys(account_ids))
+        if len(account_ids) == 1:
+            versions = [version(account_ids[0])]
+        else:
+            versions = list(self.executor.map(version, account_ids))
+        if all(v[1] is None for v in versions):
             return None
             
+        # Các cửa sổ thời gian trượt theo ngày nên khóa gồm cả ngày hiện tại
+        params = tuple(sorted((params or {}).items()))
+        return (endpoint, params, datetime.now().date(), tuple(versions))
+    
+    def get_cached_result(self, key, compute):
+        """Lấy kết quả từ cache theo khóa, tính và lưu nếu chưa có"""
+        result = self.result_cache.get(key)
+        if result is None:
+            result = compute()
+            if result is not None:
+                self.result_cache.put(key, result)
+        return result
+    
+    def load_history(self, account_id, start_date, end_date=None, account=None):
+        """Lấy lịch sử giao dịch một lần dưới dạng DataFrame đã sắp xếp theo thời gian
+        
+        Chỉ phần deal mới được lấy từ MT5 vào lịch sử cục bộ, sau đó đọc từ SQLite.
+        """
+        if account is None:
+            account = self.db.get_account(account_id)
+            if not account:
+                return None
+                
+        self.history_store.sync(account, start_date)
+        return self.history_store.load_frame(account_id, start_date, end_date)
+    
+    def load_round_trips(self, account_id, start_date, end_date=None, account=None):
+        """Lấy các giao dịch (round trip) đóng từ start_date, dựng lại từ lịch sử deal"""
+        history = self.load_history(
+            account_id, start_date - timedelta(days=self.ENTRY_LOOKBACK_DAYS), end_date, account
+        )
+        if history is None:
+            return None
+        return self._slice_round_trips(reconstruct_round_trips(history), start_date)
+    
+    def _slice_round_trips(self, round_trips, start_date):
+        """Lấy các giao dịch đóng từ start_date (round trip đã sắp xếp theo thời gian đóng)"""
+        if round_trips.empty:
+            return round_trips
+        index = round_trips['close_time'].searchsorted(pd.Timestamp(start_date))
+        return round_trips.iloc[index:]
+    
+    def _get_round_trips(self, account_id, days, round_trips, end_date, account=None):
+        """Dùng round trip đã dựng sẵn (cắt theo cửa sổ) hoặc tải mới"""
+        start_date = end_date - timedelta(days=days)
+        if round_trips is None:
+            return self.load_round_trips(account_id, start_date, end_date, account)
+        return self._slice_round_trips(round_trips, start_date)
+    
+    def calculate_daily_performance(self, account_id, days=30, round_trips=None, end_date=None):
+        """Tính toán hiệu suất hàng ngày trong khoảng thời gian"""
         # Thiết lập thời gian
-        end_date = datetime.now()
+        end_date = end_date or datetime.now()
         start_date = end_date - timedelta(days=days)
         
-        # Lấy lịch sử giao dịch
-        history = self.mt5_service.get_order_history(account_id, start_date, end_date, account)
-        if not history:
+        # Lấy các giao dịch đã đóng (hoặc dùng round trip đã dựng sẵn)
+        round_trips = self._get_round_trips(account_id, days, round_trips, end_date)
+        if round_trips is None:
+            return None
+        if round_trips.empty:
             return pd.DataFrame()
             
-        # Chuyển đổi thành DataFrame
-        df = pd.DataFrame(history)
-        
-        # Chuyển đổi cột thời gian thành đúng định dạng
-        df['date'] = pd.to_datetime(df['time']).dt.date
-        
-        # Tính toán lợi nhuận hàng ngày
-        daily_profit = df.groupby('date')['profit'].sum()
+        # Tính toán lợi nhuận ròng hàng ngày theo ngày đóng lệnh
+        daily_profit = round_trips.groupby(round_trips['close_time'].dt.normalize())['net_profit'].sum()
+        daily_profit.name = 'profit'
         
         # Tạo DataFrame cho tất cả các ngày trong khoảng
         date_range = pd.date_range(start=start_date.date(), end=end_date.date(), freq='D')
@@ -46,34 +161,25 @@ class PerformanceService:
         
         return result
     
-    def calculate_monthly_performance(self, account_id, months=12):
+    def calculate_monthly_performance(self, account_id, months=12, round_trips=None, end_date=None):
         """Tính toán hiệu suất hàng tháng"""
-        # Lấy tài khoản
-        account = self.db.get_account(account_id)
-        if not account:
-            return None
-            
         # Thiết lập thời gian
-        end_date = datetime.now()
+        end_date = end_date or datetime.now()
         start_date = end_date - timedelta(days=30*months)
         
-        # Lấy lịch sử giao dịch
-        history = self.mt5_service.get_order_history(account_id, start_date, end_date, account)
-        if not history:
+        # Lấy các giao dịch đã đóng (hoặc dùng round trip đã dựng sẵn)
+        round_trips = self._get_round_trips(account_id, 30*months, round_trips, end_date)
+        if round_trips is None:
+            return None
+        if round_trips.empty:
             return pd.DataFrame()
             
-        # Chuyển đổi thành DataFrame
-        df = pd.DataFrame(history)
-        
-        # Chuyển đổi cột thời gian thành đúng định dạng
-        df['time'] = pd.to_datetime(df['time'])
-        df['month'] = df['time'].dt.to_period('M')
-        
-        # Tính toán lợi nhuận hàng tháng
-        monthly_profit = df.groupby('month')['profit'].sum()
+        # Tính toán lợi nhuận ròng hàng tháng theo tháng đóng lệnh
+        monthly_profit = round_trips.groupby(round_trips['close_time'].dt.to_period('M'))['net_profit'].sum()
+        monthly_profit.name = 'profit'
         
         # Tạo DataFrame cho tất cả các tháng trong khoảng
-        month_range = pd.period_range(start=start_date.to_period('M'), end=end_date.to_period('M'), freq='M')
+        month_range = pd.period_range(start=pd.Timestamp(start_date).to_period('M'), end=pd.Timestamp(end_date).to_period('M'), freq='M')
         result = pd.DataFrame({'month': month_range})
         
         # Hợp nhất với kết quả đã tính
@@ -87,116 +193,309 @@ class PerformanceService:
         
         return result
     
-    def calculate_drawdown(self, account_id):
-        """Tính toán drawdown lớn nhất"""
+    def get_daily_performance(self, account_id, days=30, account=None):
+        """Hiệu suất hàng ngày đọc từ bảng thống kê ngày (một dòng mỗi ngày có giao dịch)
+        
+        Thống kê được cập nhật tăng dần từ các deal mới trước khi đọc.
+        """
+        if account is None:
+            account = self.db.get_account(account_id)
+            if not account:
+                return None
+                
+        self.history_store.sync_rollups(account)
+        end_date = datetime.now().date()
+        start_date = end_date - timedelta(days=days)
+        rows = self.db.get_daily_account_stats(account_id, start_date.isoformat(), end_date.isoformat())
+        
+        periods = [(start_date + timedelta(days=i)).isoformat() for i in range((end_date - start_date).days + 1)]
+        return self._fill_rollup(rows, 'date', periods)
+    
+    def get_monthly_performance(self, account_id, months=12, account=None):
+        """Hiệu suất hàng tháng đọc từ bảng thống kê tháng (tối đa một dòng mỗi tháng)"""
+        if account is None:
+            account = self.db.get_account(account_id)
+            if not account:
+                return None
+                
+        self.history_store.sync_rollups(account)
+        end_month = pd.Timestamp(datetime.now()).to_period('M')
+        start_month = pd.Timestamp(datetime.now() - timedelta(days=30*months)).to_period('M')
+        rows = self.db.get_monthly_account_stats(account_id, str(start_month), str(end_month))
+        
+        periods = [str(month) for month in pd.period_range(start=start_month, end=end_month, freq='M')]
+        return self._fill_rollup(rows, 'month', periods)
+    
+    def _fill_rollup(self, rows, key, periods):
+        """Điền các kỳ không có giao dịch và tính lợi nhuận tích lũy"""
+        rows = {row[key]: row for row in rows}
+        result = []
+        cumulative_profit = 0.0
+        
+        for period in periods:
+            row = rows.get(period, {})
+            profit = row.get('profit', 0.0) + row.get('loss', 0.0)
+            cumulative_profit += profit
+            result.append({
+                key: period,
+                'profit': round(profit, 2),
+                'cumulative_profit': round(cumulative_profit, 2),
+                'gross_profit': round(row.get('profit', 0.0), 2),
+                'gross_loss': round(row.get('loss', 0.0), 2),
+                'total_trades': row.get('total_trades', 0),
+                'winning_trades': row.get('winning_trades', 0),
+                'losing_trades': row.get('losing_trades', 0),
+                'volume': round(row.get('volume', 0.0), 2),
+                'commission': round(row.get('commission', 0.0), 2),
+                'swap': round(row.get('swap', 0.0), 2)
+            })
+            
+        return result
+    
+    def calculate_drawdown(self, account_id, round_trips=None, end_date=None, account=None):
+        """Tính drawdown lớn nhất (%) trên đường số dư cuối ngày trong lịch sử
+        
+        Số dư đầu kỳ được suy ngược từ số dư hiện tại nên drawdown đúng cả với
+        tài khoản bắt đầu bằng một khoản lỗ.
+        """
+        if account is None:
+            account = self.db.get_account(account_id)
+            if not account:
+                return 0
+                
         # Lấy hiệu suất hàng ngày
-        daily_performance = self.calculate_daily_performance(account_id, days=365)
-        if daily_performance.empty:
+        daily_performance = self.calculate_daily_performance(
+            account_id, days=self.DRAWDOWN_DAYS, round_trips=round_trips, end_date=end_date
+        )
+        if daily_performance is None or daily_performance.empty:
             return 0
             
-        # Tính toán drawdown
-        cumulative = daily_performance['cumulative_profit']
-        running_max = np.maximum.accumulate(cumulative)
-        drawdown = (cumulative - running_max) / running_max * 100
+        # Đường số dư cuối ngày
+        cumulative = daily_performance['cumulative_profit'].to_numpy(dtype=float)
+        start_balance = (account.balance or 0) - cumulative[-1]
+        equity = start_balance + np.concatenate(([0.0], cumulative))
         
-        # Trả về drawdown lớn nhất (giá trị âm)
-        max_drawdown = drawdown.min()
+        # Drawdown lớn nhất so với đỉnh trước đó
+        _, drawdown_pct = drawdown_series(equity)
+        return round(float(drawdown_pct.max()), 2)
+    
+    def get_drawdown(self, account_id, account=None):
+        """Trạng thái drawdown theo equity (đỉnh, đáy, drawdown hiện tại và lớn nhất)
         
-        return abs(max_drawdown) if not np.isnan(max_drawdown) else 0
+        Đọc từ DrawdownTracker; tài khoản chưa có mẫu equity nào được khởi tạo
+        từ đường số dư của các giao dịch đã đóng.
+        """
+        if self.drawdown_tracker is None:
+            return None
+            
+        state = self.drawdown_tracker.get(account_id)
+        if state is not None:
+            return state
+            
+        if account is None:
+            account = self.db.get_account(account_id)
+            if not account:
+                return None
+        return self.drawdown_tracker.ensure(account)
     
-    def calculate_win_rate(self, account_id):
+    def calculate_win_rate(self, account_id, round_trips=None, end_date=None):
         """Tính tỷ lệ thắng"""
-        # Lấy tài khoản
-        account = self.db.get_account(account_id)
-        if not account:
+        # Lấy các giao dịch đóng trong 3 tháng gần nhất
+        end_date = end_date or datetime.now()
+        round_trips = self._get_round_trips(account_id, self.METRICS_DAYS, round_trips, end_date)
+        if round_trips is None or round_trips.empty:
             return 0
             
-        # Lấy lịch sử giao dịch trong 3 tháng gần nhất
-        end_date = datetime.now()
-        start_date = end_date - timedelta(days=90)
-        
-        history = self.mt5_service.get_order_history(account_id, start_date, end_date, account)
-        if not history:
-            return 0
-            
-        # Đếm số giao dịch thắng/thua
-        winning_trades = sum(1 for trade in history if trade['profit'] > 0)
-        total_trades = len(history)
+        # Đếm số giao dịch thắng (theo lợi nhuận ròng)
+        winning_trades = int((round_trips['net_profit'] > 0).sum())
+        total_trades = len(round_trips)
         
         # Tính tỷ lệ thắng
         win_rate = (winning_trades / total_trades * 100) if total_trades > 0 else 0
         
         return round(win_rate, 2)
     
-    def calculate_profit_factor(self, account_id):
-        """Tính hệ số lợi nhuận (tổng lãi / tổng lỗ)"""
-        # Lấy tài khoản
-        account = self.db.get_account(account_id)
-        if not account:
-            return 0
-            
-        # Lấy lịch sử giao dịch trong 3 tháng gần nhất
-        end_date = datetime.now()
-        start_date = end_date - timedelta(days=90)
-        
-        history = self.mt5_service.get_order_history(account_id, start_date, end_date, account)
-        if not history:
+    def calculate_profit_factor(self, account_id, round_trips=None, end_date=None):
+        """Tính hệ số lợi nhuận (tổng lãi / tổng lỗ), None nếu có lãi mà không có lệnh lỗ"""
+        # Lấy các giao dịch đóng trong 3 tháng gần nhất
+        end_date = end_date or datetime.now()
+        round_trips = self._get_round_trips(account_id, self.METRICS_DAYS, round_trips, end_date)
+        if round_trips is None or round_trips.empty:
             return 0
             
         # Tính tổng lãi và tổng lỗ
-        total_profit = sum(trade['profit'] for trade in history if trade['profit'] > 0)
-        total_loss = abs(sum(trade['profit'] for trade in history if trade['profit'] < 0))
+        profit = round_trips['net_profit']
+        total_profit = profit[profit > 0].sum()
+        total_loss = abs(profit[profit < 0].sum())
         
         # Tính hệ số lợi nhuận
-        profit_factor = (total_profit / total_loss) if total_loss > 0 else float('inf')
+        if total_loss == 0:
+            return None if total_profit > 0 else 0
         
-        return round(profit_factor, 2)
+        return round(float(total_profit / total_loss), 2)
     
-    def compare_accounts(self, account_ids):
-        """So sánh hiệu suất giữa các tài khoản"""
-        result = []
+    def calculate_risk_metrics(self, account_id, round_trips=None, end_date=None, account=None):
+        """Tính bộ chỉ số rủi ro/lợi nhuận (Sharpe, Sortino, expectancy, chuỗi thắng/thua...)"""
+        if account is None:
+            account = self.db.get_account(account_id)
+            if not account:
+                return None
+                
+        end_date = end_date or datetime.now()
+        start_date = end_date - timedelta(days=self.RISK_DAYS)
+        round_trips = self._get_round_trips(account_id, self.RISK_DAYS, round_trips, end_date, account)
+        if round_trips is None:
+            return None
+            
+        net = round_trips['net_profit'].to_numpy(dtype=float)
         
-        for account_id in account_ids:
+        # Đường equity cuối ngày, suy ngược từ số dư hiện tại
+        if round_trips.empty:
+            daily_net = np.zeros(0)
+        else:
+            date_range = pd.date_range(start=start_date.date(), end=end_date.date(), freq='D')
+            daily_net = (
+                pd.Series(net, index=round_trips['close_time'].dt.normalize())
+                .groupby(level=0).sum()
+                .reindex(date_range, fill_value=0)
+                .to_numpy()
+            )
+        start_balance = (account.balance or 0) - net.sum()
+        equity = start_balance + np.concatenate(([0.0], np.cumsum(daily_net)))
+        
+        return compute_metrics(net, equity)
+    
+    def get_account_metrics(self, account_id, account=None):
+        """Lấy win rate, profit factor và drawdown, dùng cache theo watermark lịch sử"""
+        if account is None:
             account = self.db.get_account(account_id)
             if not account:
-                continue
+                return None
                 
-            # Tính các chỉ số
-            win_rate = self.calculate_win_rate(account_id)
-            profit_factor = self.calculate_profit_factor(account_id)
-            max_drawdown = self.calculate_drawdown(account_id)
+        end_date = datetime.now()
+        start_date = end_date - timedelta(days=max(self.DRAWDOWN_DAYS, self.METRICS_DAYS))
+        
+        # Cửa sổ chỉ số trượt theo ngày nên khóa cache gồm cả ngày hiện tại
+        watermark = (self.history_store.sync(account, start_date - timedelta(days=self.ENTRY_LOOKBACK_DAYS))
+                     or self.history_store.get_watermark(account_id))
+        cache_key = (watermark, end_date.date())
+        with self.lock:
+            cached = self.metrics_cache.get(account_id)
+        if cached and cached[0] == cache_key:
+            return self._with_drawdown(account_id, cached[1], account)
             
-            # Lấy thông tin tài khoản
-            account_info = {
-                'account_id': account_id,
-                'name': account.name,
-                'login': account.login,
-                'balance': account.balance,
-                'equity': account.equity,
-                'profit': account.profit,
-                'win_rate': win_rate,
-                'profit_factor': profit_factor,
-                'max_drawdown': max_drawdown
-            }
+        history = self.history_store.load_frame(
+            account_id, start_date - timedelta(days=self.ENTRY_LOOKBACK_DAYS), end_date
+        )
+        round_trips = self._slice_round_trips(reconstruct_round_trips(history), start_date)
+        metrics = {
+            'win_rate': self.calculate_win_rate(account_id, round_trips, end_date),
+            'profit_factor': self.calculate_profit_factor(account_id, round_trips, end_date)
+        }
+        metrics['no_losses'] = metrics['profit_factor'] is None
+        if self.drawdown_tracker is None:
+            metrics['max_drawdown'] = self.calculate_drawdown(account_id, round_trips, end_date, account)
+        
+        with self.lock:
+            self.metrics_cache[account_id] = (cache_key, metrics)
+        return self._with_drawdown(account_id, metrics, account)
+    
+    def _with_drawdown(self, account_id, metrics, account):
+        """Thêm drawdown theo equity (đọc từ tracker, không nằm trong cache)"""
+        if self.drawdown_tracker is None:
+            return metrics
+        drawdown = self.get_drawdown(account_id, account)
+        return {**metrics, 'max_drawdown': drawdown['max_drawdown_percent'] if drawdown else 0}
+    
+    def _compare_account(self, account_id):
+        """Tính dữ liệu so sánh cho một tài khoản"""
+        account = self.db.get_account(account_id)
+        if not account:
+            return None
             
-            result.append(account_info)
+        try:
+            metrics = self.get_account_metrics(account_id, account)
+        except Exception as e:
+            self.logger.error(f"Error calculating metrics for account {account_id}: {str(e)}")
+            return None
             
-        return result
+        # Lấy thông tin tài khoản
+        return {
+            'account_id': account_id,
+            'name': account.name,
+            'login': account.login,
+            'balance': account.balance,
+            'equity': account.equity,
+            'profit': account.profit,
+            **metrics
+        }
+    
+    def iter_compare_accounts(self, account_ids):
+        """So sánh hiệu suất, trả về kết quả của từng tài khoản ngay khi tính xong"""
+        futures = [
+            self.executor.submit(self._compare_account, account_id)
+            for account_id in dict.fromkeys(account_ids)
+        ]
+        
+        for future in as_completed(futures):
+            result = future.result()
+            if result:
+                yield result
     
-    def generate_performance_report(self, account_id):
-        """Tạo báo cáo hiệu suất đầy đủ"""
+    def compare_accounts(self, account_ids):
+        """So sánh hiệu suất giữa các tài khoản"""
+        results = {r['account_id']: r for r in self.iter_compare_accounts(account_ids)}
+        
+        # Giữ thứ tự theo danh sách yêu cầu
+        return [results[account_id] for account_id in dict.fromkeys(account_ids) if account_id in results]
+    
+    def get_breakdowns(self, account_id, dimensions, round_trips=None, days=None, account=None):
+        """Thống kê theo symbol, side, weekday, hour, session
+        
+        Không cache riêng: phần tốn kém là tải và dựng round trip, báo cáo gọi hàm
+        này đã được cache theo khóa gồm cả các chiều thống kê.
+        """
+        days = days or self.RISK_DAYS
+        end_date = datetime.now()
+        dimensions = list(dict.fromkeys(dimensions))
+        
+        if round_trips is None:
+            round_trips = self._get_round_trips(account_id, days, None, end_date, account)
+            if round_trips is None:
+                return None
+        else:
+            round_trips = self._slice_round_trips(round_trips, end_date - timedelta(days=days))
+            
+        return {dimension: breakdown_round_trips(round_trips, dimension) for dimension in dimensions}
+    
+    def generate_performance_report(self, account_id, breakdowns=None):
+        """Tạo báo cáo hiệu suất đầy đủ
+        
+        breakdowns: các chiều thống kê thêm (symbol, side, weekday, hour, session).
+        """
         account = self.db.get_account(account_id)
         if not account:
             return None
             
+        # Tải lịch sử và dựng round trip một lần cho cửa sổ rộng nhất,
+        # các chỉ số dùng các lát cắt của nó
+        end_date = datetime.now()
+        history_days = max(self.DRAWDOWN_DAYS, self.METRICS_DAYS, self.RISK_DAYS, 30, 30*12)
+        round_trips = self.load_round_trips(account_id, end_date - timedelta(days=history_days), end_date, account)
+        
         # Tính các chỉ số
-        win_rate = self.calculate_win_rate(account_id)
-        profit_factor = self.calculate_profit_factor(account_id)
-        max_drawdown = self.calculate_drawdown(account_id)
+        win_rate = self.calculate_win_rate(account_id, round_trips, end_date)
+        profit_factor = self.calculate_profit_factor(account_id, round_trips, end_date)
+        drawdown = self.get_drawdown(account_id, account)
+        if drawdown:
+            max_drawdown = drawdown['max_drawdown_percent']
+        else:
+            max_drawdown = self.calculate_drawdown(account_id, round_trips, end_date, account)
         
         # Lấy hiệu suất hàng ngày và hàng tháng
-        daily_performance = self.calculate_daily_performance(account_id, days=30)
-        monthly_performance = self.calculate_monthly_performance(account_id, months=12)
+        daily_performance = self.calculate_daily_performance(account_id, 30, round_trips, end_date)
+        monthly_performance = self.calculate_monthly_performance(account_id, 12, round_trips, end_date)
+        risk_metrics = self.calculate_risk_metrics(account_id, round_trips, end_date, account)
         
         # Tạo báo cáo
         report = {
@@ -213,10 +512,363 @@ class PerformanceService:
             'metrics': {
                 'win_rate': win_rate,
                 'profit_factor': profit_factor,
+                'no_losses': profit_factor is None,
                 'max_drawdown': max_drawdown
             },
+            'risk_metrics': risk_metrics,
+            'drawdown': drawdown,
             'daily_performance': daily_performance.to_dict('records') if not daily_performance.empty else [],
             'monthly_performance': monthly_performance.to_dict('records') if not monthly_performance.empty else []
         }
+        if breakdowns:
+            report['breakdowns'] = self.get_breakdowns(account_id, breakdowns, round_trips, account=account)
+        
+        return report
+    
+    def _daily_pnl_matrix(self, accounts, days):
+        """Ma trận P&L ròng ngày x tài khoản (căn theo ngày) từ bảng thống kê ngày
+        
+        Trả về (các ngày YYYY-MM-DD, ma trận P&L, thống kê giao dịch theo tài khoản
+        [total, winning, losing, profit, loss]).
+        """
+        end_date = datetime.now().date()
+        start_date = end_date - timedelta(days=days)
+        date_strings = pd.date_range(start=start_date, end=end_date, freq='D').strftime('%Y-%m-%d').to_numpy()
+        
+        column = {account.account_id: i for i, account in enumerate(accounts)}
+        rows = self.db.get_daily_stats_for_accounts(
+            list(column), start_date.isoformat(), end_date.isoformat()
+        )
+        pnl = np.zeros((len(date_strings), len(accounts)))
+        trade_stats = np.zeros((len(accounts), 5))
+        if rows:
+            stats = np.array([row[2:] for row in rows], dtype=float)
+            cols = np.array([column[row[0]] for row in rows])
+            day_index = np.searchsorted(date_strings, np.array([row[1] for row in rows]))
+            np.add.at(pnl, (day_index, cols), stats[:, 0])
+            np.add.at(trade_stats, cols, stats[:, 1:])
+            
+        return date_strings, pnl, trade_stats
+    
+    def get_portfolio_performance(self, account_ids=None, group_by=None, filters=None, days=365,
+                                  include_series=True):
+        """Hiệu suất danh mục: cộng chuỗi P&L ngày của nhiều tài khoản thành đường equity chung
+        
+        Đọc chuỗi ngày từ bảng thống kê đã tổng hợp (một truy vấn cho mọi tài khoản),
+        căn theo ngày thành ma trận ngày x tài khoản rồi cộng theo nhóm bằng một phép
+        nhân ma trận. group_by: 'user', 'server', 'group' hoặc None (toàn bộ).
+        filters: {'user': ..., 'server': ..., 'group': ...} để chọn tài khoản.
+        """
+        if group_by is not None and group_by not in self.PORTFOLIO_GROUPS:
+            raise ValueError(f"Unsupported group_by: {group_by}")
+            
+        # Chọn tài khoản
+        accounts = self.db.get_all_accounts()
+        if account_ids:
+            selected = set(account_ids)
+            accounts = [a for a in accounts if a.account_id in selected]
+        for name, value in (filters or {}).items():
+            if value is not None:
+                field = self.PORTFOLIO_GROUPS[name]
+                accounts = [a for a in accounts if str(getattr(a, field)) == str(value)]
+        if not accounts:
+            return []
+            
+        date_strings, pnl, trade_stats = self._daily_pnl_matrix(accounts, days)
+        
+        # Ma trận một-nóng tài khoản x nhóm
+        if group_by:
+            field = self.PORTFOLIO_GROUPS[group_by]
+            keys = list(dict.fromkeys(getattr(account, field) for account in accounts))
+        else:
+            field, keys = None, [None]
+        group_index = {key: i for i, key in enumerate(keys)}
+        membership = np.zeros((len(accounts), len(keys)))
+        for i, account in enumerate(accounts):
+            membership[i, group_index[getattr(account, field) if field else None]] = 1
+            
+        group_pnl = pnl @ membership                      # ngày x nhóm
+        group_stats = membership.T @ trade_stats          # nhóm x thống kê
+        balances = np.array([account.balance or 0 for account in accounts]) @ membership
+        equities = np.array([account.equity or 0 for account in accounts]) @ membership
+        
+        results = []
+        for g, key in enumerate(keys):
+            daily = group_pnl[:, g]
+            # Đường số dư cuối ngày, suy ngược từ tổng số dư hiện tại
+            equity = balances[g] - daily.sum() + np.concatenate(([0.0], np.cumsum(daily)))
+            curve = compute_metrics(daily[daily != 0], equity)
+            total, winning, losing, profit, loss = (float(value) for value in group_stats[g])
+            
+            result = {
+                'group_by': group_by,
+                'key': key,
+                'accounts': [a.account_id for i, a in enumerate(accounts) if membership[i, g]],
+                'balance': round(float(balances[g]), 2),
+                'equity': round(float(equities[g]), 2),
+                'metrics': {
+                    'total_trades': int(total),
+                    'winning_trades': int(winning),
+                    'losing_trades': int(losing),
+                    'win_rate': round(winning / total * 100, 2) if total else 0,
+                    'profit_factor': round(profit / abs(loss), 2) if loss else (None if profit else 0),
+                    'no_losses': bool(profit and not loss),
+                    'net_profit': round(float(profit + loss), 2),
+                    'sharpe_ratio': curve['sharpe_ratio'],
+                    'sortino_ratio': curve['sortino_ratio'],
+                    'max_drawdown': curve['max_drawdown'],
+                    'max_drawdown_percent': curve['max_drawdown_percent'],
+                    'recovery_factor': curve['recovery_factor'],
+                    'time_in_drawdown': curve['time_in_drawdown']
+                }
+            }
+            if include_series:
+                drawdown = drawdown_series(equity)[0][1:]
+                result['daily'] = [{
+                    'date': date,
+                    'profit': round(float(profit_day), 2),
+                    'equity': round(float(equity_day), 2),
+                    'drawdown': round(float(drawdown_day), 2)
+                } for date, profit_day, equity_day, drawdown_day in zip(date_strings, daily, equity[1:], drawdown)]
+            results.append(result)
+            
+        return results
+    
+    # Chỉ số xếp hạng và chiều mặc định (True: lớn hơn đứng trước)
+    LEADERBOARD_METRICS = {
+        'return_percent': True,
+        'net_profit': True,
+        'profit_factor': True,
+        'win_rate': True,
+        'max_drawdown_percent': False,
+        'total_trades': True
+    }
+    
+    def get_leaderboard(self, metric='return_percent', page=1, page_size=50, masters_only=True,
+                        descending=None):
+        """Bảng xếp hạng tài khoản theo một chỉ số, phân trang
+        
+        Đọc từ dòng chỉ số đã tính sẵn của từng tài khoản (được cập nhật khi có
+        deal mới và khi drawdown thay đổi), sắp xếp bằng index nên không phụ thuộc
+        số tài khoản. masters_only: chỉ các tài khoản đang là master của copy trade.
+        """
+        if metric not in self.LEADERBOARD_METRICS:
+            raise ValueError(f"Unsupported leaderboard metric: {metric}")
+        if descending is None:
+            descending = self.LEADERBOARD_METRICS[metric]
+        page = max(page, 1)
+        
+        rows, total = self.db.get_leaderboard(
+            metric, descending, page_size, (page - 1) * page_size, masters_only
+        )
+        
+        entries = []
+        for rank, row in enumerate(rows, start=(page - 1) * page_size + 1):
+            entries.append({
+                'rank': rank,
+                'account_id': row['account_id'],
+                'login': row['login'],
+                'name': row['name'],
+                'server': row['server'],
+                'user_id': row['user_id'],
+                'group_name': row['group_name'],
+                'balance': row['balance'],
+                'metrics': {
+                    'return_percent': row['return_percent'],
+                    'net_profit': row['net_profit'],
+                    'profit_factor': row['profit_factor'],
+                    # profit_factor null: có lãi nhưng chưa có lệnh lỗ
+                    'no_losses': row['profit_factor'] is None,
+                    'win_rate': row['win_rate'],
+                    'max_drawdown': row['max_drawdown'],
+                    'max_drawdown_percent': row['max_drawdown_percent'],
+                    'total_trades': row['total_trades'],
+                    'winning_trades': row['winning_trades'],
+                    'losing_trades': row['losing_trades']
+                },
+                'updated_at': row['updated_at']
+            })
+            
+        return {
+            'metric': metric,
+            'order': 'desc' if descending else 'asc',
+            'page': page,
+            'page_size': page_size,
+            'total': total,
+            'entries': entries
+        }
+    
+    def get_correlation_matrix(self, account_ids=None, days=90):
+        """Ma trận tương quan lợi nhuận ngày giữa các tài khoản, sắp theo cụm
         
-        return report
\ No newline at end of file
+        Lợi nhuận ngày = P&L ròng / số dư cuối ngày trước (suy ngược từ số dư hiện
+        tại). Các ngày không tài khoản nào giao dịch bị bỏ. Tài khoản không có biến
+        động cho tương quan None. Thứ tự hiển thị theo vector Fiedler của ma trận
+        tương đồng nên các tài khoản tương quan cao nằm cạnh nhau.
+        """
+        accounts = self.db.get_all_accounts()
+        if account_ids:
+            selected = set(account_ids)
+            accounts = [a for a in accounts if a.account_id in selected]
+        if not accounts:
+            return None
+            
+        _, pnl, _ = self._daily_pnl_matrix(accounts, days)
+        pnl = pnl[np.any(pnl != 0, axis=1)]
+        
+        # Lợi nhuận theo số dư đầu ngày của từng tài khoản
+        balances = np.array([account.balance or 0 for account in accounts], dtype=float)
+        previous = balances - pnl.sum(axis=0) + np.vstack((np.zeros(len(accounts)), np.cumsum(pnl, axis=0)[:-1]))
+        with np.errstate(divide='ignore', invalid='ignore'):
+            returns = np.where(previous > 0, pnl / previous, 0.0)
+            
+        # Tương quan của mọi cặp trong một phép nhân ma trận
+        if len(returns) > 1:
+            centered = returns - returns.mean(axis=0)
+            std = centered.std(axis=0)
+            valid = std > 0
+            z = np.divide(centered, std, out=np.zeros_like(centered), where=valid)
+            corr = np.clip(z.T @ z / len(returns), -1.0, 1.0)
+        else:
+            valid = np.zeros(len(accounts), dtype=bool)
+            corr = np.zeros((len(accounts), len(accounts)))
+        np.fill_diagonal(corr, 1.0)
+        
+        order = self._cluster_order(corr, valid)
+        corr = corr[np.ix_(order, order)]
+        valid = valid[order]
+        matrix = np.round(corr, 4).tolist()
+        for i in np.flatnonzero(~valid):
+            # Tài khoản không biến động: không xác định tương quan với tài khoản khác
+            for j in range(len(order)):
+                if i != j:
+                    matrix[i][j] = matrix[j][i] = None
+                    
+        return {
+            'accounts': [accounts[i].account_id for i in order],
+            'names': [accounts[i].name for i in order],
+            'days': int(len(returns)),
+            'matrix': matrix
+        }
+    
+    def _cluster_order(self, corr, valid):
+        """Thứ tự seriation: sắp theo vector Fiedler của Laplacian ma trận tương đồng"""
+        n = len(corr)
+        if n < 3:
+            return np.arange(n)
+            
+        similarity = np.where(np.outer(valid, valid), (corr + 1) / 2, 0.0)
+        np.fill_diagonal(similarity, 0.0)
+        laplacian = np.diag(similarity.sum(axis=1)) - similarity
+        _, vectors = np.linalg.eigh(laplacian)
+        return np.argsort(vectors[:, 1], kind='stable')
+    
+    def simulate_risk_of_ruin(self, account_id, simulations=5000, trades=None, ruin_percent=50,
+                              target_percent=20, seed=None):
+        """Mô phỏng Monte Carlo rủi ro cháy tài khoản từ P&L các giao dịch đã đóng
+        
+        Lấy mẫu lại P&L ròng của các round trip trong RISK_DAYS thành các đường
+        equity dài trades giao dịch (mặc định bằng số giao dịch trong lịch sử, tối
+        đa monte_carlo_max_trades), bắt đầu từ số dư hiện tại. Số đường bị giảm để
+        số đường x số giao dịch không vượt monte_carlo_max_steps. Cháy: equity chạm mức giảm ruin_percent %;
+        mục tiêu: equity tăng target_percent %. Các lô chạy song song trong process
+        pool, mỗi lô có seed riêng sinh từ seed nên kết quả lặp lại được.
+        """
+        account = self.db.get_account(account_id)
+        if not account:
+            return None
+            
+        end_date = datetime.now()
+        round_trips = self.load_round_trips(account_id, end_date - timedelta(days=self.RISK_DAYS), end_date, account)
+        pnl = round_trips['net_profit'].to_numpy(dtype=float) if round_trips is not None else np.zeros(0)
+        if pnl.size == 0:
+            return {'simulations': 0, 'trades': 0, 'message': 'No closed trades to simulate'}
+            
+        trades = max(1, min(int(trades or pnl.size), self.monte_carlo_max_trades))
+        simulations = max(1, min(int(simulations), self.monte_carlo_max_simulations,
+                                 self.monte_carlo_max_steps // trades))
+        start_balance = float(account.balance or 0)
+        ruin_balance = start_balance * (1 - ruin_percent / 100)
+        target_balance = start_balance * (1 + target_percent / 100)
+        
+        # Chia thành các lô cố định: kết quả không phụ thuộc số process
+        sizes = [self.MONTE_CARLO_BATCH] * (simulations // self.MONTE_CARLO_BATCH)
+        if simulations % self.MONTE_CARLO_BATCH:
+            sizes.append(simulations % self.MONTE_CARLO_BATCH)
+        seeds = np.random.SeedSequence(seed).spawn(len(sizes))
+        args = [(pnl, start_balance, size, trades, ruin_balance, target_balance, batch_seed)
+                for size, batch_seed in zip(sizes, seeds)]
+        
+        if self.job_runner and len(args) > 1:
+            futures = [self.job_runner.submit_process(simulate_batch, *batch) for batch in args]
+            batches = [future.result() for future in futures]
+        else:
+            batches = [simulate_batch(*batch) for batch in args]
+            
+        result = summarize(batches, start_balance)
+        result.update({
+            'trades': trades,
+            'history_trades': int(pnl.size),
+            'ruin_percent': ruin_percent,
+            'target_percent': target_percent,
+            'seed': seed
+        })
+        return result
+    
+    def simulate_copy_settings(self, master_account_id, settings_grid, days=365, balance=None):
+        """Mô phỏng follower với các bộ cài đặt copy trên lịch sử round trip của master
+        
+        settings_grid: danh sách dict volume_percent, min_volume, max_volume,
+        allowed_symbols. balance: số dư ban đầu của follower (mặc định số dư
+        master). Các bộ cài đặt được chia cho process pool; đường equity theo
+        ngày chỉ trả về khi mô phỏng một bộ cài đặt.
+        """
+        account = self.db.get_account(master_account_id)
+        if not account:
+            return None
+            
+        end_date = datetime.now()
+        round_trips = self.load_round_trips(master_account_id, end_date - timedelta(days=days), end_date, account)
+        start_balance = float(balance if balance is not None else (account.balance or 0))
+        
+        net_profit = round_trips['net_profit'].to_numpy(dtype=float)
+        volumes = round_trips['volume'].to_numpy(dtype=float)
+        symbols = round_trips['symbol'].to_numpy(dtype=str)
+        
+        # Chia các bộ cài đặt thành từng phần cho các process
+        workers = self.job_runner.process_workers if self.job_runner else 1
+        chunk_size = max(1, -(-len(settings_grid) // workers))
+        chunks = [settings_grid[i:i + chunk_size] for i in range(0, len(settings_grid), chunk_size)]
+        
+        if self.job_runner and len(chunks) > 1:
+            futures = [
+                self.job_runner.submit_process(simulate_copy_grid, net_profit, volumes, symbols, start_balance, chunk)
+                for chunk in chunks
+            ]
+            parts = [future.result() for future in futures]
+        else:
+            parts = [simulate_copy_grid(net_profit, volumes, symbols, start_balance, chunk) for chunk in chunks]
+            
+        results = []
+        for chunk, (pnl, metrics) in zip(chunks, parts):
+            for settings, row, row_metrics in zip(chunk, pnl, metrics):
+                results.append({'settings': settings, 'metrics': row_metrics})
+                
+        # Đường equity theo ngày đóng lệnh cho một bộ cài đặt
+        if len(results) == 1 and len(round_trips):
+            daily = (
+                pd.Series(parts[0][0][0], index=round_trips['close_time'].dt.normalize())
+                .groupby(level=0).sum()
+            )
+            equity = start_balance + daily.cumsum()
+            results[0]['equity_curve'] = [
+                {'date': date.strftime('%Y-%m-%d'), 'profit': round(float(profit), 2), 'equity': round(float(value), 2)}
+                for date, profit, value in zip(daily.index, daily.to_numpy(), equity.to_numpy())
+            ]
+            
+        return {
+            'master_account_id': master_account_id,
+            'start_balance': start_balance,
+            'master_trades': int(len(round_trips)),
+            'results': results
+        }
@@ -0,0 +1,57 @@
+import threading
+import logging
+from datetime import datetime
+
+
+class PositionStore:
+    """Ảnh chụp vị thế mở của từng tài khoản trong SQLite, kèm thời điểm chụp
+
+    Được EventBus gọi mỗi lần monitor hoặc copy engine lấy danh sách vị thế, nên
+    route đọc vị thế không phải giành khóa terminal (và đổi đăng nhập) với vòng
+    copy. Chỉ các vị thế thay đổi được ghi; lần lấy không có thay đổi chỉ dời
+    thời điểm chụp trong bộ nhớ và được ghi xuống tối đa mỗi
+    FRESHNESS_WRITE_INTERVAL giây.
+    """
+
+    FRESHNESS_WRITE_INTERVAL = 10  # seconds
+
+    def __init__(self, db):
+        self.db = db
+        self.lock = threading.Lock()
+        self.seen_at = {}       # {account_id: lần lấy vị thế gần nhất}
+        self.persisted_at = {}  # {account_id: thời điểm chụp đã ghi xuống database}
+        self.logger = logging.getLogger('position_store')
+
+    def apply(self, account_id, changes):
+        """Ghi các delta vị thế của một lần lấy danh sách (listener của EventBus)"""
+        now = datetime.now()
+        with self.lock:
+            self.seen_at[account_id] = now
+            # Lần ghi đầu trong tiến trình này: thay cả danh sách đã lưu từ lần chạy trước
+            first = account_id not in self.persisted_at
+            if (not changes and not first and
+                    (now - self.persisted_at[account_id]).total_seconds() < self.FRESHNESS_WRITE_INTERVAL):
+                return
+            self.persisted_at[account_id] = now
+
+        upserts = [change['position'] for change in changes if change['action'] != 'closed']
+        closed = [change['position']['ticket'] for change in changes if change['action'] == 'closed']
+        self.db.apply_position_changes(account_id, upserts, closed, now, replace=first)
+
+    def forget_account(self, account_id):
+        with self.lock:
+            self.seen_at.pop(account_id, None)
+            self.persisted_at.pop(account_id, None)
+
+    def get(self, account_id):
+        """Vị thế mở đã lưu, thời điểm chụp và tuổi (giây); captured_at None nếu chưa có ảnh chụp"""
+        positions, captured_at = self.db.get_open_positions(account_id)
+        seen_at = self.seen_at.get(account_id)
+        if captured_at and seen_at and seen_at > captured_at:
+            captured_at = seen_at
+
+        return {
+            'positions': positions,
+            'captured_at': captured_at.isoformat() if captured_at else None,
+            'age': round((datetime.now() - captured_at).total_seconds(), 1) if captured_at else None
+        }
@@ -0,0 +1,216 @@
+import numpy as np
+import pandas as pd
+
+# Hằng số deal của MT5 (giữ ở đây để module không phụ thuộc MetaTrader5 và chạy được trong process pool)
+DEAL_TYPE_BUY = 0
+DEAL_TYPE_SELL = 1
+DEAL_ENTRY_IN = 0
+DEAL_ENTRY_OUT = 1
+DEAL_ENTRY_INOUT = 2
+DEAL_ENTRY_OUT_BY = 3
+
+# Sai số khi so sánh khối lượng vào/ra
+VOLUME_EPSILON = 1e-8
+
+ROUND_TRIP_COLUMNS = [
+    'position_id', 'symbol', 'side', 'volume', 'entry_price', 'exit_price',
+    'open_time', 'close_time', 'duration', 'gross_profit', 'commission',
+    'swap', 'fee', 'net_profit', 'close_ticket'
+]
+
+
+def reconstruct_round_trips(deals):
+    """Gom các deal theo position_id thành các giao dịch đã đóng hoàn toàn
+
+    deals: DataFrame theo cột của HistoryStore (ticket, position_id, deal_type,
+    entry, volume, price, time, profit, commission, swap, fee...).
+
+    Một vị thế được tính là một giao dịch khi tổng khối lượng đóng (OUT, INOUT,
+    OUT_BY) bằng khối lượng mở (IN), nên các lần đóng từng phần được gộp lại.
+    Deal nạp/rút, hoa hồng... (không phải BUY/SELL) bị loại. Vị thế còn mở hoặc
+    thiếu deal mở trong dữ liệu không được tính. Độ phức tạp tuyến tính theo số deal.
+    """
+    if deals is None or deals.empty:
+        return pd.DataFrame(columns=ROUND_TRIP_COLUMNS)
+
+    trades = deals[deals['deal_type'].isin((DEAL_TYPE_BUY, DEAL_TYPE_SELL)) & (deals['position_id'].fillna(0) != 0)]
+    if trades.empty:
+        return pd.DataFrame(columns=ROUND_TRIP_COLUMNS)
+
+    is_in = (trades['entry'] == DEAL_ENTRY_IN).to_numpy()
+    is_out = trades['entry'].isin((DEAL_ENTRY_OUT, DEAL_ENTRY_INOUT, DEAL_ENTRY_OUT_BY)).to_numpy()
+    volume = trades['volume'].to_numpy(dtype=float)
+    notional = volume * trades['price'].to_numpy(dtype=float)
+
+    columns = pd.DataFrame({
+        'position_id': trades['position_id'].to_numpy(),
+        'symbol': trades['symbol'].to_numpy(),
+        'in_volume': np.where(is_in, volume, 0.0),
+        'out_volume': np.where(is_out, volume, 0.0),
+        'in_notional': np.where(is_in, notional, 0.0),
+        'out_notional': np.where(is_out, notional, 0.0),
+        # Hướng của vị thế theo deal mở (BUY=0, SELL=1); -1 cho deal đóng
+        'side_code': np.where(is_in, trades['deal_type'].to_numpy(), -1),
+        'open_time': trades['time'].where(is_in).to_numpy(),
+        'close_time': trades['time'].where(is_out).to_numpy(),
+        'close_ticket': np.where(is_out, trades['ticket'].to_numpy(), 0),
+        'gross_profit': trades['profit'].to_numpy(dtype=float),
+        'commission': trades['commission'].to_numpy(dtype=float),
+        'swap': trades['swap'].to_numpy(dtype=float),
+        'fee': trades['fee'].to_numpy(dtype=float)
+    })
+
+    grouped = columns.groupby('position_id', sort=False).agg(
+        symbol=('symbol', 'first'),
+        in_volume=('in_volume', 'sum'),
+        out_volume=('out_volume', 'sum'),
+        in_notional=('in_notional', 'sum'),
+        out_notional=('out_notional', 'sum'),
+        side_code=('side_code', 'max'),
+        open_time=('open_time', 'min'),
+        close_time=('close_time', 'max'),
+        close_ticket=('close_ticket', 'max'),
+        gross_profit=('gross_profit', 'sum'),
+        commission=('commission', 'sum'),
+        swap=('swap', 'sum'),
+        fee=('fee', 'sum')
+    )
+
+    closed = grouped[
+        (grouped['in_volume'] > 0) &
+        (grouped['out_volume'] >= grouped['in_volume'] - VOLUME_EPSILON)
+    ]
+
+    result = pd.DataFrame({
+        'position_id': closed.index.to_numpy(),
+        'symbol': closed['symbol'].to_numpy(),
+        'side': np.where(closed['side_code'].to_numpy() == DEAL_TYPE_SELL, 'SELL', 'BUY'),
+        'volume': closed['in_volume'].to_numpy(),
+        'entry_price': (closed['in_notional'] / closed['in_volume']).to_numpy(),
+        'exit_price': (closed['out_notional'] / closed['out_volume']).to_numpy(),
+        'open_time': closed['open_time'].to_numpy(),
+        'close_time': closed['close_time'].to_numpy(),
+        'duration': (closed['close_time'] - closed['open_time']).dt.total_seconds().to_numpy(),
+        'gross_profit': closed['gross_profit'].to_numpy(),
+        'commission': closed['commission'].to_numpy(),
+        'swap': closed['swap'].to_numpy(),
+        'fee': closed['fee'].to_numpy(),
+        'net_profit': (closed['gross_profit'] + closed['commission'] + closed['swap'] + closed['fee']).to_numpy(),
+        'close_ticket': closed['close_ticket'].to_numpy()
+    }, columns=ROUND_TRIP_COLUMNS)
+
+    return result.sort_values(['close_time', 'close_ticket'], kind='stable').reset_index(drop=True)
+
+
+def aggregate_daily_stats(deals, after_ticket=0):
+    """Gom các giao dịch được đóng bởi deal có ticket > after_ticket theo ngày đóng
+    
+    Trả về các dòng cộng dồn vào daily_account_stats. Hàm cấp module để chạy
+    được trong process pool.
+    """
+    round_trips = reconstruct_round_trips(deals)
+    round_trips = round_trips[round_trips['close_ticket'] > after_ticket]
+    if round_trips.empty:
+        return []
+        
+    net = round_trips['net_profit']
+    grouped = pd.DataFrame({
+        'date': round_trips['close_time'].dt.strftime('%Y-%m-%d'),
+        'total_trades': 1,
+        'winning_trades': (net > 0).astype(int),
+        'losing_trades': (net < 0).astype(int),
+        'profit': net.where(net > 0, 0.0),
+        'loss': net.where(net < 0, 0.0),
+        'volume': round_trips['volume'].astype(float),
+        'commission': round_trips['commission'].astype(float),
+        'swap': round_trips['swap'].astype(float)
+    }).groupby('date', as_index=False).sum()
+    
+    return [{
+        'date': row.date,
+        'total_trades': int(row.total_trades),
+        'winning_trades': int(row.winning_trades),
+        'losing_trades': int(row.losing_trades),
+        'profit': float(row.profit),
+        'loss': float(row.loss),
+        'volume': float(row.volume),
+        'commission': float(row.commission),
+        'swap': float(row.swap)
+    } for row in grouped.itertuples(index=False)]
+
+
+# Phiên giao dịch theo giờ mở lệnh (giờ server MT5): (giờ bắt đầu, tên phiên)
+SESSIONS = [
+    (0, 'asia'),
+    (7, 'london'),
+    (12, 'london_new_york'),
+    (16, 'new_york'),
+    (21, 'late')
+]
+
+WEEKDAYS = ['monday', 'tuesday', 'wednesday', 'thursday', 'friday', 'saturday', 'sunday']
+
+BREAKDOWN_DIMENSIONS = ['symbol', 'side', 'weekday', 'hour', 'session']
+
+
+def breakdown_round_trips(round_trips, dimension):
+    """Thống kê các giao dịch theo một chiều (symbol, side, weekday, hour, session)
+
+    Một phép groupby trên các round trip; weekday/hour/session theo thời điểm mở lệnh.
+    """
+    if dimension not in BREAKDOWN_DIMENSIONS:
+        raise ValueError(f"Unsupported breakdown: {dimension}")
+    if round_trips is None or round_trips.empty:
+        return []
+
+    if dimension in ('symbol', 'side'):
+        key = round_trips[dimension]
+    elif dimension == 'weekday':
+        key = round_trips['open_time'].dt.weekday
+    else:
+        hours = round_trips['open_time'].dt.hour
+        if dimension == 'hour':
+            key = hours
+        else:
+            starts = np.array([start for start, _ in SESSIONS])
+            names = np.array([name for _, name in SESSIONS])
+            key = pd.Series(names[np.searchsorted(starts, hours.to_numpy(), side='right') - 1], index=round_trips.index)
+
+    net = round_trips['net_profit']
+    grouped = pd.DataFrame({
+        'key': key,
+        'trades': 1,
+        'winning_trades': (net > 0).astype(int),
+        'losing_trades': (net < 0).astype(int),
+        'gross_profit': net.where(net > 0, 0.0),
+        'gross_loss': net.where(net < 0, 0.0),
+        'net_profit': net,
+        'volume': round_trips['volume'].astype(float),
+        'duration': round_trips['duration'].astype(float)
+    }).groupby('key', sort=True).sum()
+
+    results = []
+    for key_value, row in grouped.iterrows():
+        trades = int(row['trades'])
+        gross_loss = abs(row['gross_loss'])
+        results.append({
+            dimension: WEEKDAYS[key_value] if dimension == 'weekday' else (
+                int(key_value) if dimension == 'hour' else key_value
+            ),
+            'trades': trades,
+            'winning_trades': int(row['winning_trades']),
+            'losing_trades': int(row['losing_trades']),
+            'win_rate': round(float(row['winning_trades'] / trades * 100), 2),
+            'net_profit': round(float(row['net_profit']), 2),
+            'gross_profit': round(float(row['gross_profit']), 2),
+            'gross_loss': round(float(row['gross_loss']), 2),
+            # Có lãi mà không có lệnh lỗ: profit factor không xác định (None)
+            'profit_factor': round(float(row['gross_profit'] / gross_loss), 2) if gross_loss else (
+                None if row['gross_profit'] else 0
+            ),
+            'no_losses': bool(not gross_loss and row['gross_profit']),
+            'average_profit': round(float(row['net_profit'] / trades), 2),
+            'volume': round(float(row['volume']), 2),
+            'average_duration': round(float(row['duration'] / trades), 1)
+        })
+    return results
@@ -0,0 +1,72 @@
+import numpy as np
+
+METHODS = ['lttb', 'minmax']
+
+
+def lttb_indices(y, points, x=None):
+    """Chọn points điểm theo Largest-Triangle-Three-Buckets, giữ hình dạng đường
+
+    Luôn giữ điểm đầu và điểm cuối; mỗi bucket giữ điểm tạo tam giác lớn nhất
+    với điểm đã chọn trước đó và trung bình bucket kế tiếp.
+    """
+    y = np.asarray(y, dtype=float)
+    n = y.size
+    if points >= n or points < 3:
+        return np.arange(n)
+    x = np.arange(n, dtype=float) if x is None else np.asarray(x, dtype=float)
+
+    edges = np.linspace(1, n - 1, points - 1).astype(int)
+    selected = np.empty(points, dtype=int)
+    selected[0] = 0
+    selected[-1] = n - 1
+    previous = 0
+
+    for i in range(points - 2):
+        start, end = edges[i], edges[i + 1]
+        next_start, next_end = edges[i + 1], edges[i + 2] if i + 2 < len(edges) else n
+        avg_x = x[next_start:next_end].mean() if next_end > next_start else x[-1]
+        avg_y = y[next_start:next_end].mean() if next_end > next_start else y[-1]
+
+        area = np.abs(
+            (x[previous] - avg_x) * (y[start:end] - y[previous]) -
+            (x[previous] - x[start:end]) * (avg_y - y[previous])
+        )
+        previous = start + int(area.argmax())
+        selected[i + 1] = previous
+
+    return selected
+
+
+def minmax_indices(y, points):
+    """Chọn điểm nhỏ nhất và lớn nhất của mỗi bucket (giữ đỉnh/đáy, hợp với drawdown)"""
+    y = np.asarray(y, dtype=float)
+    n = y.size
+    if points >= n or points < 4:
+        return np.arange(n)
+
+    buckets = (points - 2) // 2
+    edges = np.linspace(1, n - 1, buckets + 1).astype(int)
+    selected = [0, n - 1]
+    for start, end in zip(edges[:-1], edges[1:]):
+        if end > start:
+            selected.append(start + int(y[start:end].argmin()))
+            selected.append(start + int(y[start:end].argmax()))
+    return np.unique(selected)
+
+
+def downsample_records(records, y_key, points, method='lttb'):
+    """Rút gọn danh sách bản ghi của một chuỗi thời gian (đã sắp xếp) còn khoảng points điểm
+
+    y_key: trường dùng để giữ hình dạng (ví dụ equity hoặc cumulative_profit).
+    """
+    if method not in METHODS:
+        raise ValueError(f"Unsupported downsample method: {method}")
+    if not records or not points or points >= len(records):
+        return records
+
+    y = [record.get(y_key) or 0 for record in records]
+    if method == 'minmax':
+        indices = minmax_indices(y, points)
+    else:
+        indices = lttb_indices(y, points)
+    return [records[i] for i in indices]
@@ -0,0 +1,209 @@
+import threading
+import time
+import logging
+import itertools
+from collections import deque
+from datetime import datetime
+
+
+class Subscription:
+    """Hàng đợi có giới hạn cho một client đăng ký nhận sự kiện"""
+
+    def __init__(self, account_ids=None, event_types=None, max_queue=500):
+        self.account_ids = set(account_ids) if account_ids else None
+        self.event_types = set(event_types) if event_types else None
+        self.max_queue = max_queue
+        self.queue = deque()
+        self.condition = threading.Condition()
+        self.dropped = 0
+        # Client đọc chậm làm tràn hàng đợi -> cần gửi lại snapshot
+        self.lagged = False
+
+    def matches(self, event):
+        """Kiểm tra sự kiện có khớp bộ lọc của client không"""
+        if self.event_types and event['type'] not in self.event_types:
+            return False
+        if self.account_ids and event['account_id'] not in self.account_ids:
+            return False
+        return True
+
+    def put(self, event):
+        with self.condition:
+            if len(self.queue) >= self.max_queue:
+                # Bỏ toàn bộ delta cũ, client sẽ nhận snapshot mới thay thế
+                self.dropped += len(self.queue)
+                self.queue.clear()
+                self.lagged = True
+            self.queue.append(event)
+            self.condition.notify()
+
+    def get(self, timeout=None):
+        """Lấy sự kiện tiếp theo, trả về None nếu hết thời gian chờ"""
+        with self.condition:
+            if not self.queue:
+                self.condition.wait(timeout)
+            if not self.queue:
+                return None
+            return self.queue.popleft()
+
+    def take_lagged(self):
+        """Trả về True (một lần) nếu client đã bị tràn hàng đợi"""
+        with self.condition:
+            lagged = self.lagged
+            self.lagged = False
+            return lagged
+
+
+class EventBus:
+    """Phát các thay đổi tài khoản và vị thế từ monitor/copy engine tới các client
+
+    Producer gọi publish một lần cho mỗi thay đổi, bus phân phối vào hàng đợi
+    của từng client theo bộ lọc, nên số client không làm tăng số lần gọi MT5.
+    """
+
+    def __init__(self, max_queue=500):
+        self.max_queue = max_queue
+        self.lock = threading.Lock()
+        self.subscriptions = set()
+        self.sequence = itertools.count(1)
+        self.accounts = {}   # {account_id: trạng thái tài khoản gần nhất}
+        self.positions = {}  # {account_id: {ticket: position}}
+        self.positions_published_at = {}  # {account_id: lần publish_positions gần nhất (monotonic)}
+        # Hàm nhận delta vị thế sau mỗi lần producer lấy danh sách vị thế (kể cả khi
+        # không có delta, để cập nhật thời điểm chụp): fn(account_id, changes)
+        self.position_listeners = []
+        # Monitor và copy engine cùng phát vị thế của master: giữ thứ tự delta tới listener
+        self.position_lock = threading.Lock()
+
+    def subscribe(self, account_ids=None, event_types=None, max_queue=None):
+        subscription = Subscription(account_ids, event_types, max_queue or self.max_queue)
+        with self.lock:
+            self.subscriptions.add(subscription)
+        return subscription
+
+    def add_position_listener(self, listener):
+        """Đăng ký hàm được gọi đồng bộ với các delta của mỗi lần publish_positions"""
+        self.position_listeners.append(listener)
+
+    def has_position_consumers(self):
+        """Có listener hoặc client nào nhận vị thế không (không thì producer khỏi lấy vị thế)"""
+        if self.position_listeners:
+            return True
+        with self.lock:
+            return any(
+                not subscription.event_types or 'position' in subscription.event_types
+                for subscription in self.subscriptions
+            )
+
+    def positions_age(self, account_id):
+        """Số giây từ lần phát vị thế gần nhất của tài khoản, None nếu chưa phát lần nào"""
+        with self.lock:
+            published_at = self.positions_published_at.get(account_id)
+        return time.monotonic() - published_at if published_at is not None else None
+
+    def unsubscribe(self, subscription):
+        with self.lock:
+            self.subscriptions.discard(subscription)
+
+    def publish(self, event_type, account_id, data):
+        """Phát một sự kiện tới các client có bộ lọc phù hợp"""
+        event = {
+            'id': next(self.sequence),
+            'type': event_type,
+            'account_id': account_id,
+            'time': datetime.now().isoformat(),
+            'data': data
+        }
+        with self.lock:
+            subscriptions = list(self.subscriptions)
+        for subscription in subscriptions:
+            if subscription.matches(event):
+                subscription.put(event)
+        return event
+
+    def publish_account(self, account):
+        """Phát thông số mới của tài khoản nếu có thay đổi"""
+        data = account.to_dict()
+        data.pop('password', None)
+        data.pop('last_update', None)
+
+        with self.lock:
+            if self.accounts.get(account.account_id) == data:
+                return None
+            self.accounts[account.account_id] = data
+        return self.publish('account', account.account_id, data)
+
+    def publish_positions(self, account_id, positions):
+        """So sánh danh sách vị thế mới với trạng thái trước và phát các delta
+
+        Trả về danh sách delta dạng {'action': opened|updated|closed, 'position': ...}
+        """
+        current = {p['ticket']: _serialize_position(p) for p in positions}
+
+        with self.position_lock:
+            with self.lock:
+                previous = self.positions.get(account_id, {})
+                self.positions[account_id] = current
+                self.positions_published_at[account_id] = time.monotonic()
+
+            changes = []
+            for ticket, position in current.items():
+                old = previous.get(ticket)
+                if old is None:
+                    changes.append({'action': 'opened', 'position': position})
+                elif old != position:
+                    changes.append({'action': 'updated', 'position': position})
+            for ticket, position in previous.items():
+                if ticket not in current:
+                    changes.append({'action': 'closed', 'position': position})
+
+            for change in changes:
+                self.publish('position', account_id, change)
+            self._notify_listeners(account_id, changes)
+        return changes
+
+    def _notify_listeners(self, account_id, changes):
+        for listener in self.position_listeners:
+            try:
+                listener(account_id, changes)
+            except Exception:
+                # Listener lỗi không được làm hỏng vòng lặp của producer
+                logging.getLogger('event_bus').exception("Position listener failed")
+
+    def forget_account(self, account_id):
+        """Xóa trạng thái đã lưu của tài khoản (khi tài khoản bị xóa)"""
+        with self.position_lock:
+            with self.lock:
+                self.accounts.pop(account_id, None)
+                self.positions_published_at.pop(account_id, None)
+                previous = self.positions.pop(account_id, {})
+            if previous:
+                self._notify_listeners(
+                    account_id, [{'action': 'closed', 'position': position} for position in previous.values()]
+                )
+
+    def get_positions(self, account_id):
+        """Lấy danh sách vị thế gần nhất mà producer đã phát"""
+        with self.lock:
+            return list(self.positions.get(account_id, {}).values())
+
+    def get_snapshot(self, account_ids=None, event_types=None):
+        """Trạng thái hiện tại để gửi cho client khi mới kết nối hoặc bị tràn hàng đợi"""
+        with self.lock:
+            ids = set(account_ids) if account_ids else set(self.accounts) | set(self.positions)
+            snapshot = {}
+            if not event_types or 'account' in event_types:
+                snapshot['accounts'] = [self.accounts[i] for i in ids if i in self.accounts]
+            if not event_types or 'position' in event_types:
+                snapshot['positions'] = {
+                    i: list(self.positions[i].values()) for i in ids if i in self.positions
+                }
+            return snapshot
+
+
+def _serialize_position(position):
+    """Chuyển các trường datetime của vị thế thành chuỗi để so sánh và gửi JSON"""
+    return {
+        key: value.isoformat() if isinstance(value, datetime) else value
+        for key, value in position.items()
+    }
@@ -0,0 +1,72 @@
+import threading
+import hashlib
+import json
+from collections import OrderedDict
+
+
+class ResultCache:
+    """Cache LRU cho kết quả tính toán, giới hạn theo số mục và dung lượng
+
+    Khóa chứa phiên bản dữ liệu (watermark lịch sử...) nên kết quả cũ không cần
+    xóa chủ động: khóa mới không trùng và mục cũ tự bị đẩy ra. ETag được suy ra
+    từ khóa nên có thể so với If-None-Match trước khi tính.
+    """
+
+    def __init__(self, max_entries=512, max_bytes=64 * 1024 * 1024):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.lock = threading.Lock()
+        self.entries = OrderedDict()  # {key: (value, size)}
+        self.total_bytes = 0
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def etag(key):
+        """ETag ổn định cho một khóa"""
+        return hashlib.sha1(repr(key).encode('utf-8')).hexdigest()
+
+    def get(self, key, default=None):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return default
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def put(self, key, value):
+        """Lưu kết quả; bỏ qua kết quả lớn hơn toàn bộ dung lượng cache"""
+        size = len(json.dumps(value, default=str))
+        if size > self.max_bytes:
+            return False
+
+        with self.lock:
+            old = self.entries.pop(key, None)
+            if old:
+                self.total_bytes -= old[1]
+            self.entries[key] = (value, size)
+            self.total_bytes += size
+
+            # Đẩy các mục ít dùng nhất ra khi vượt giới hạn
+            while len(self.entries) > self.max_entries or self.total_bytes > self.max_bytes:
+                _, (_, evicted_size) = self.entries.popitem(last=False)
+                self.total_bytes -= evicted_size
+            return True
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+            self.total_bytes = 0
+
+    def get_stats(self):
+        with self.lock:
+            return {
+                'entries': len(self.entries),
+                'bytes': self.total_bytes,
+                'max_entries': self.max_entries,
+                'max_bytes': self.max_bytes,
+                'hits': self.hits,
+                'misses': self.misses
+            }
@@ -0,0 +1,106 @@
+import threading
+import time
+from collections import deque
+
+
+class LoopMetrics:
+    """Thống kê thời gian của một vòng lặp định kỳ (sweep, từng phần tử, overrun)"""
+
+    def __init__(self, interval, window=100):
+        self.interval = interval
+        self.lock = threading.Lock()
+        self.durations = deque(maxlen=window)  # Thời gian các sweep gần nhất
+        self.item_latency = {}                 # {key: thời gian xử lý gần nhất}
+        self.sweeps = 0
+        self.overruns = 0
+        self.skipped_ticks = 0
+        self.deferred_items = 0
+        self.last_sweep_at = None
+
+    def record_sweep(self, duration, deferred=0):
+        """Ghi nhận một sweep; trả về True nếu sweep vượt quá chu kỳ"""
+        overrun = duration > self.interval
+        with self.lock:
+            self.sweeps += 1
+            self.durations.append(duration)
+            self.deferred_items += deferred
+            self.last_sweep_at = time.time()
+            if overrun:
+                self.overruns += 1
+        return overrun
+
+    def record_item(self, key, latency):
+        with self.lock:
+            self.item_latency[key] = latency
+
+    def forget_item(self, key):
+        with self.lock:
+            self.item_latency.pop(key, None)
+
+    def record_skipped(self, ticks):
+        with self.lock:
+            self.skipped_ticks += ticks
+
+    def snapshot(self, slowest=10):
+        """Lấy số liệu hiện tại dưới dạng dictionary"""
+        with self.lock:
+            durations = sorted(self.durations)
+            slowest_items = sorted(self.item_latency.items(), key=lambda item: item[1], reverse=True)[:slowest]
+            return {
+                'interval': self.interval,
+                'sweeps': self.sweeps,
+                'overruns': self.overruns,
+                'skipped_ticks': self.skipped_ticks,
+                'deferred_items': self.deferred_items,
+                'last_sweep_at': self.last_sweep_at,
+                'last_duration': round(self.durations[-1], 4) if self.durations else None,
+                'avg_duration': round(sum(durations) / len(durations), 4) if durations else None,
+                'p95_duration': round(durations[int(0.95 * (len(durations) - 1))], 4) if durations else None,
+                'max_duration': round(durations[-1], 4) if durations else None,
+                'slowest_items': [
+                    {'key': key, 'latency': round(latency, 4)} for key, latency in slowest_items
+                ]
+            }
+
+
+class DeadlineTicker:
+    """Bộ đếm nhịp theo deadline cố định thay vì sleep sau mỗi lần xử lý
+
+    Deadline thứ k là start + k * interval, nên thời gian xử lý không cộng dồn
+    vào chu kỳ. Nếu một sweep kéo dài qua nhiều deadline, các nhịp bị lỡ được
+    bỏ qua (và ghi nhận) thay vì chạy dồn liên tiếp.
+
+    Cách dùng:
+        ticker = DeadlineTicker(60)
+        while ticker.wait():
+            ...
+    """
+
+    def __init__(self, interval, clock=time.monotonic):
+        self.interval = interval
+        self.clock = clock
+        self.stop_event = threading.Event()
+        self.metrics = LoopMetrics(interval)
+        self.next_deadline = None
+
+    def wait(self):
+        """Chờ tới deadline kế tiếp. Trả về False nếu ticker đã bị dừng"""
+        now = self.clock()
+
+        if self.next_deadline is None:
+            # Nhịp đầu tiên chạy ngay
+            self.next_deadline = now
+            return not self.stop_event.is_set()
+
+        self.next_deadline += self.interval
+        if now > self.next_deadline:
+            # Sweep trước vượt quá chu kỳ -> bỏ các nhịp đã lỡ, giữ nguyên lưới thời gian
+            missed = int((now - self.next_deadline) // self.interval) + 1
+            self.next_deadline += missed * self.interval
+            self.metrics.record_skipped(missed)
+
+        return not self.stop_event.wait(self.next_deadline - now)
+
+    def stop(self):
+        """Dừng ticker và đánh thức thread đang chờ"""
+        self.stop_event.set()